@@ -0,0 +1,288 @@
+"""
+Headless benchmark suite for the simulation, tax, report and chart paths.
+
+    python benchmarks.py                       # run everything, print a table
+    python benchmarks.py --quick --only tax    # smaller sizes, matching names only
+    python benchmarks.py --save baseline.json  # store results as a baseline
+    python benchmarks.py --compare baseline.json --threshold 1.25
+    python benchmarks.py --profile --memory    # cProfile hotspots and tracemalloc peaks
+
+Profiles come from a seeded synthetic generator, so runs are comparable across
+versions; a baseline stores the results together with the engine version.
+"""
+import argparse
+import cProfile
+import io
+import json
+import logging
+import platform
+import pstats
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import financial_core as fp
+import financial_reports as fr
+
+# -----------------------------------------------------------------------------
+# SYNTHETIC PROFILES
+# -----------------------------------------------------------------------------
+def synthetic_inputs(rng, years=35, loans=2, children=1, dependents=2, custom_events=0, mortgage=True):
+    """One all_inputs dict shaped like InputModule.collect_all_inputs output."""
+    age = rng.randint(22, 45)
+    liabilities = [{"liability_name": f"Loan {i+1}", "interest_rate": rng.uniform(6, 16), "remaining_term": rng.randint(12, 120),
+                    "amount": rng.uniform(5e4, 1.5e6), "min_payment": rng.uniform(2e3, 3e4)} for i in range(loans)]
+    mortgage_details = None
+    if mortgage:
+        mortgage_details = {"emi_amount": rng.uniform(1e4, 6e4), "remaining_term": rng.randint(60, 300), "loan_interest_rate": rng.uniform(6, 10),
+                            "principal": rng.uniform(1e6, 8e6), "market_value": rng.uniform(2e6, 1.2e7)}
+    return {
+        "personal_information": {
+            "age": age,
+            "city": "Tier 2",
+            "city_cost_factor": rng.choice([1.2, 1.0, 0.9]),
+            "marital_status": "Not Married",
+            "age_of_marriage": age + rng.randint(1, 10),
+            "children": [{"age_at_birth": rng.randint(0, 15)} for _ in range(children)],
+            "dependents": [{"relationship": rng.choice(["Parent", "Sibling", "Pet", "Child"]), "age": rng.randint(1, 80)} for _ in range(dependents)],
+            "additional_income_sources": [],
+        },
+        "career_income_details": {"employment_type": "Job", "monthly_salary": rng.uniform(3e4, 5e5),
+                                  "bonus": {"frequency": rng.choice(["annual", "quarterly", "monthly"]), "amount": rng.uniform(0, 2e5)}},
+        "assets_liabilities_investments": {
+            "housing_status": "Owned" if mortgage else rng.choice(["Rented", "Owned by Parents"]),
+            "mortgage_details": mortgage_details,
+            "other_assets": [{"asset_name": "Car", "asset_value": rng.uniform(2e5, 2e6)}],
+            "investments": [{"investment_type": "mutual funds", "current_value": rng.uniform(0, 3e6)}],
+            "liabilities": liabilities,
+        },
+        "retirement_investment_strategy": {"retirement_age": age + years, "investment_strategy": "Moderate"},
+        "simulation_parameters": {"years_to_simulate": years, "starting_age": age},
+        "reserved_investments": 1000000,
+        "emergency_fund": 500000,
+        "custom_events": [{"name": "Planned Expense", "year": rng.randint(0, max(years - 1, 0)), "cost": rng.uniform(1e5, 2e6)}
+                          for _ in range(custom_events)],
+    }
+
+def synthetic_profiles(n, seed=0, **shape):
+    """n seeded synthetic all_inputs dicts sharing one shape (years, loans, children, ...)."""
+    rng = random.Random(seed)
+    return [synthetic_inputs(rng, **shape) for _ in range(n)]
+
+# -----------------------------------------------------------------------------
+# HARNESS
+# -----------------------------------------------------------------------------
+def measure(fn, repeat=3, memory=False, profile=False, top=8):
+    """
+    Best wall time of repeat calls of fn. With memory, one extra call runs under
+    tracemalloc for the peak; with profile, one extra call runs under cProfile
+    and the top cumulative-time functions are returned as text.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    result = {"seconds": best}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(fn)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        result["hotspots"] = out.getvalue()
+    return result
+
+def _profile_years(inputs_list):
+    return sum(max(inputs["simulation_parameters"]["years_to_simulate"], 0) for inputs in inputs_list)
+
+# -----------------------------------------------------------------------------
+# BENCHMARKS
+# -----------------------------------------------------------------------------
+# Each case is (name, params, setup) where setup() returns (fn, work, unit);
+# throughput is reported as work / seconds in that unit.
+def _loop_engine(years, loans, children, n):
+    profiles = synthetic_profiles(n, years=years, loans=loans, children=children)
+    return lambda: [fp.simulate_yearly_projection(p) for p in profiles], _profile_years(profiles), "profile-years/s"
+
+def _loop_engine_metrics(years, loans, children, n):
+    # The loop engine with stage instrumentation on, to compare against loop_engine
+    run, work, unit = _loop_engine(years, loans, children, n)
+    def instrumented():
+        enabled = fp.METRICS.enabled
+        fp.METRICS.enable()
+        try:
+            run()
+        finally:
+            fp.METRICS.enable(enabled)
+    return instrumented, work, unit
+
+def _batch_engine(years, loans, children, n):
+    table = fp.profiles_table(synthetic_profiles(n, years=years, loans=loans, children=children, custom_events=1))
+    return lambda: fp.simulate_batch_projection(table), n * years, "profile-years/s"
+
+def _monte_carlo(years, paths):
+    inputs = synthetic_profiles(1, years=years)[0]
+    return lambda: fp.simulate_monte_carlo(inputs, n_paths=paths, seed=1), paths * years, "path-years/s"
+
+def _portfolio(years, holdings, n, paths):
+    profiles = synthetic_profiles(n, years=years)
+    types = list(fp.PORTFOLIO_DEFAULTS["investment_classes"])
+    for inputs in profiles:
+        inputs["assets_liabilities_investments"]["investments"] = [{"investment_type": types[i % len(types)], "current_value": 1e5 * (i + 1)}
+                                                                    for i in range(holdings)]
+    return lambda: fp.simulate_household_portfolio(profiles, n_paths=paths or None, seed=1), n * max(paths, 1) * years, "path-years/s"
+
+def _safe_withdrawal_rate(strategy, years, paths):
+    # Drawdown of `years` retired years; guardrails searches a grid of rates on every path
+    inputs = synthetic_profiles(1, years=35)[0]
+    retirement_age = inputs["simulation_parameters"]["starting_age"] + 35
+    assumptions = {"life_expectancy": retirement_age + years}
+    return (lambda: fp.safe_withdrawal_rate(inputs, strategy, n_paths=paths, seed=1, assumptions=assumptions),
+            paths * years, "path-years/s")
+
+def _tax_scalar(calls):
+    calc = fp.DetailedCalculations()
+    incomes = np.random.default_rng(0).uniform(0, 5e6, calls).tolist()
+    return lambda: [calc.calculate_tax_liability(x) for x in incomes], calls, "calls/s"
+
+def _tax_array(values):
+    schedule = fp.get_tax_schedule()
+    incomes = np.random.default_rng(0).uniform(0, 5e6, values)
+    return lambda: schedule.tax_array(incomes), values, "values/s"
+
+def _pdf_report(years, reports):
+    frames = [fp.ProjectionResult.from_rows(fp.simulate_yearly_projection(p)).frame()
+              for p in synthetic_profiles(reports, years=years, children=2)]
+    template = fr.pdf_report_template()
+    def run():
+        template.pages_rendered = 0
+        for frame in frames:
+            fr.generate_pdf_report(frame)
+    run()
+    pages = template.pages_rendered
+    return run, pages, "pages/s"
+
+def _charts(years, charts):
+    results = [fp.ProjectionResult.from_rows(fp.simulate_yearly_projection(p)) for p in synthetic_profiles(charts, years=years)]
+    return lambda: [chart.to_dict() for result in results for chart in fr.projection_charts(result)], 2 * charts, "charts/s"
+
+def _chart_bands(years, n):
+    batch = fp.simulate_batch_projection(fp.profiles_table(synthetic_profiles(n, years=years)))
+    return lambda: fr.batch_band_frame(batch), n * years, "cells/s"
+
+def _lttb(points):
+    y = np.cumsum(np.random.default_rng(0).normal(size=points))
+    x = np.arange(points, dtype=float)
+    return lambda: fr.lttb_indices(x, y, fr.CHART_MAX_POINTS), points, "points/s"
+
+def benchmark_cases(quick=False):
+    scale = 0.1 if quick else 1
+    size = lambda n: max(int(n * scale), 1)
+    cases = []
+    for years in (10, 35, 60):
+        cases.append(("loop_engine", {"years": years, "loans": 2, "children": 2, "n": size(200)}, _loop_engine))
+    for loans in (0, 5):
+        cases.append(("loop_engine", {"years": 35, "loans": loans, "children": 0, "n": size(200)}, _loop_engine))
+    cases.append(("loop_engine_metrics", {"years": 35, "loans": 2, "children": 2, "n": size(200)}, _loop_engine_metrics))
+    for n in (1000, 10000, 100000):
+        cases.append(("batch_engine", {"years": 35, "loans": 2, "children": 2, "n": size(n)}, _batch_engine))
+    cases.append(("batch_engine", {"years": 60, "loans": 5, "children": 3, "n": size(10000)}, _batch_engine))
+    cases.append(("monte_carlo", {"years": 35, "paths": size(20000)}, _monte_carlo))
+    cases.append(("portfolio", {"years": 35, "holdings": 6, "n": size(10000), "paths": 0}, _portfolio))
+    cases.append(("portfolio", {"years": 35, "holdings": 36, "n": 1, "paths": size(10000)}, _portfolio))
+    for strategy in ("fixed", "guardrails"):
+        cases.append(("safe_withdrawal_rate", {"strategy": strategy, "years": 40, "paths": size(20000)}, _safe_withdrawal_rate))
+    cases.append(("tax_scalar", {"calls": size(100000)}, _tax_scalar))
+    cases.append(("tax_array", {"values": size(1000000)}, _tax_array))
+    cases.append(("pdf_report", {"years": 35, "reports": size(50)}, _pdf_report))
+    cases.append(("charts", {"years": 35, "charts": size(50)}, _charts))
+    cases.append(("chart_bands", {"years": 35, "n": size(100000)}, _chart_bands))
+    cases.append(("lttb", {"points": size(2000000)}, _lttb))
+    return cases
+
+def case_key(name, params):
+    return name + "[" + ",".join(f"{k}={v}" for k, v in sorted(params.items())) + "]"
+
+def run_benchmarks(only=None, quick=False, repeat=3, memory=False, profile=False):
+    """Run the matching cases; returns one result dict per case."""
+    results = []
+    for name, params, setup in benchmark_cases(quick):
+        key = case_key(name, params)
+        if only and not re.search(only, key):
+            continue
+        fn, work, unit = setup(**params)
+        stats = measure(fn, repeat=repeat, memory=memory, profile=profile)
+        results.append(dict(stats, key=key, name=name, params=params, unit=unit, throughput=work / stats["seconds"]))
+    return results
+
+# -----------------------------------------------------------------------------
+# BASELINES
+# -----------------------------------------------------------------------------
+def save_baseline(results, path):
+    """Store results (without profiler text) with the engine version and machine."""
+    baseline = {"engine_version": fp.ENGINE_VERSION, "python": platform.python_version(), "machine": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": {r["key"]: {k: v for k, v in r.items() if k != "hotspots"} for r in results}}
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2)
+
+def compare_baseline(results, path, threshold=1.2):
+    """Attach the ratio to the baseline time; slower than threshold times the baseline is a regression."""
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for r in results:
+        old = baseline.get(r["key"])
+        if old:
+            r["ratio"] = r["seconds"] / old["seconds"]
+            if r["ratio"] > threshold:
+                regressions.append(r)
+    return regressions
+
+def format_results(results):
+    lines = [f"{'case':<58} {'seconds':>9} {'throughput':>22} {'peak MB':>8} {'vs base':>8}"]
+    for r in results:
+        peak = f"{r['peak_mb']:8.1f}" if "peak_mb" in r else " " * 8
+        ratio = f"{r['ratio']:7.2f}x" if "ratio" in r else " " * 8
+        lines.append(f"{r['key']:<58} {r['seconds']:9.4f} {r['throughput']:>12,.0f} {r['unit']:<9} {peak} {ratio}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the financial projection engine headlessly.")
+    parser.add_argument("--only", help="regular expression selecting cases by key")
+    parser.add_argument("--quick", action="store_true", help="run at a tenth of the default sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--memory", action="store_true", help="record tracemalloc peak memory")
+    parser.add_argument("--profile", action="store_true", help="print cProfile hotspots per case")
+    parser.add_argument("--save", metavar="PATH", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    results = run_benchmarks(args.only, args.quick, args.repeat, args.memory, args.profile)
+    regressions = compare_baseline(results, args.compare, args.threshold) if args.compare else []
+    print(format_results(results))
+    if args.profile:
+        for r in results:
+            print(f"\n== {r['key']} ==\n{r['hotspots']}")
+    if args.save:
+        save_baseline(results, args.save)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold}x: " + ", ".join(r["key"] for r in regressions))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Command line for running financial projections without the Streamlit app.
+Profiles are read as JSON, JSON Lines or a CSV profile table:
+
+    python financial_cli.py project profiles.json -o results.parquet
+    python financial_cli.py project profiles.csv -o results.csv --chunk-size 50000
+    python financial_cli.py monte-carlo profile.json -o bands.csv --paths 20000 --seed 7
+    python financial_cli.py solve profiles.json --target 50000000 --variable annual_contribution --retirement-age 60
+    python financial_cli.py sweep profiles.json --axis investment_return=0.08,0.1,0.12 --axis retirement_age=55,60,65
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from financial_core import (GOAL_SEEK_VARIABLES, METRICS, METRICS_ENV, OBJECT_PROFILE_FIELDS, ProjectionResult,
+                            SWEEP_FACTORS, WITHDRAWAL_STRATEGIES, decumulation_frame, default_sensitivity_axes,
+                            goal_seek, monte_carlo_bands_frame, portfolio_bands, portfolio_frame, profiles_table,
+                            safe_withdrawal_rate, sensitivity_frame, sensitivity_grid, simulate_decumulation,
+                            simulate_household_portfolio, simulate_monte_carlo, simulate_yearly_projection,
+                            tax_regime_names)
+from financial_export import CSVSink, EXPORT_SINKS, iter_batch_projection, stream_batch_projection
+from financial_store import ProjectionStore
+
+logger = logging.getLogger(__name__)
+
+# Public names
+__all__ = [
+    "INPUT_SECTIONS", "read_profiles", "read_profile_table", "write_profile_table", "cli",
+]
+
+# -----------------------------------------------------------------------------
+# COMMAND LINE
+# -----------------------------------------------------------------------------
+# Top-level keys of an all_inputs dict, used to tell one profile from a dict of profiles keyed by id
+INPUT_SECTIONS = ("personal_information", "career_income_details", "assets_liabilities_investments",
+                  "retirement_investment_strategy", "simulation_parameters", "emergency_fund", "reserved_investments", "custom_events")
+
+def read_profiles(path):
+    """
+    {profile id: all_inputs} from JSON (one all_inputs dict, a list of them or a
+    dict of them keyed by id) or JSON Lines (one per line). "-" reads stdin.
+    """
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    if str(path).endswith(".jsonl"):
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        data = json.loads(text)
+    if isinstance(data, list):
+        return dict(enumerate(data))
+    if not data or set(data) & set(INPUT_SECTIONS):
+        return {0: data}
+    return data
+
+def read_profile_table(path):
+    """
+    Profile table from a CSV with profile_from_inputs columns (missing ones take
+    the defaults). Ragged columns such as loans hold JSON; a Profile column, if
+    present, becomes the index.
+    """
+    import pandas as pd
+    table = pd.read_csv(path, float_precision="round_trip")
+    if "Profile" in table:
+        table = table.set_index("Profile")
+    for name in OBJECT_PROFILE_FIELDS:
+        if name in table and name != "housing_status":
+            table[name] = [json.loads(value) if isinstance(value, str) else [] for value in table[name]]
+    return table
+
+def write_profile_table(table, target):
+    """Inverse of read_profile_table: ragged columns are written as JSON."""
+    table = table.copy()
+    for name in OBJECT_PROFILE_FIELDS:
+        if name in table and name != "housing_status":
+            table[name] = [json.dumps(value) for value in table[name]]
+    table.to_csv(target, index_label="Profile")
+
+def _output_sink(target):
+    if target == "-":
+        return CSVSink(sys.stdout)
+    ext = os.path.splitext(str(target))[1].lower()
+    if ext not in EXPORT_SINKS:
+        raise ValueError(f"Unsupported output format '{ext}'; use one of {sorted(EXPORT_SINKS)}.")
+    return EXPORT_SINKS[ext](target)
+
+def _with_profile(df, profile_id):
+    df.insert(0, "Profile", profile_id)
+    return df
+
+def _cli_project(args, assumptions):
+    if args.store and args.input.endswith(".csv"):
+        raise ValueError("--store needs all_inputs profiles (JSON or JSON Lines), not a CSV profile table.")
+    store = ProjectionStore(args.store) if args.store else None
+    sink = _output_sink(args.output)
+    try:
+        if store is not None:
+            profiles = read_profiles(args.input)
+            ids, count = list(profiles), 0
+            if args.engine == "batch":
+                table = profiles_table(profiles.values())
+                table.index = ids
+                for start, batch in zip(range(0, len(ids), args.chunk_size), iter_batch_projection(table, assumptions, args.chunk_size)):
+                    frame = batch.to_frame(with_events=args.events)
+                    sink.write_frame(frame)
+                    store.save_batch(batch, {i: profiles[i] for i in ids[start:start + args.chunk_size]}, args.scenario)
+                    count += len(frame)
+                return len(ids), count
+            records = []
+            for profile_id, inputs in profiles.items():
+                result = ProjectionResult.from_rows(simulate_yearly_projection(inputs, verbose=args.verbose, assumptions=assumptions))
+                sink.write_frame(_with_profile(result.frame().copy(), profile_id))
+                records.append((profile_id, inputs, result))
+                count += len(result)
+            store.save_results(records, args.scenario, assumptions)
+            return len(ids), count
+        if args.engine == "batch":
+            if args.input.endswith(".csv"):
+                table = read_profile_table(args.input)
+            else:
+                profiles = read_profiles(args.input)
+                table = profiles_table(profiles.values())
+                table.index = list(profiles)
+            return len(table), stream_batch_projection(table, [sink], assumptions, args.chunk_size, with_events=args.events)
+        if args.input.endswith(".csv"):
+            raise ValueError("The loop engine needs all_inputs profiles (JSON or JSON Lines), not a CSV profile table.")
+        profiles = read_profiles(args.input)
+        count = 0
+        for profile_id, inputs in profiles.items():
+            rows = simulate_yearly_projection(inputs, verbose=args.verbose, assumptions=assumptions)
+            frame = ProjectionResult.from_rows(rows).frame().copy()
+            sink.write_frame(_with_profile(frame, profile_id))
+            count += len(frame)
+        return len(profiles), count
+    finally:
+        sink.close()
+        if store is not None:
+            store.close()
+
+def _cli_monte_carlo(args, assumptions):
+    profiles = read_profiles(args.input)
+    sink = _output_sink(args.output)
+    count = 0
+    try:
+        for profile_id, inputs in profiles.items():
+            result = simulate_monte_carlo(inputs, n_paths=args.paths, seed=args.seed, assumptions=assumptions)
+            frame = monte_carlo_bands_frame(result)
+            frame["Probability Short"] = result["probability_short"]
+            sink.write_frame(_with_profile(frame, profile_id))
+            count += len(frame)
+    finally:
+        sink.close()
+    return len(profiles), count
+
+def _cli_solve(args, assumptions):
+    import pandas as pd
+    profiles = read_profiles(args.input)
+    results = goal_seek(list(profiles.values()), args.target, variable=args.variable, retirement_age=args.retirement_age,
+                        assumptions=assumptions, tol=args.tol)
+    sink = _output_sink(args.output)
+    try:
+        sink.write_frame(_with_profile(pd.DataFrame(results), list(profiles)))
+    finally:
+        sink.close()
+    return len(profiles), len(results)
+
+def _cli_sweep(args, assumptions):
+    profiles = read_profiles(args.input)
+    axes = {}
+    for axis in args.axis:
+        name, _, values = axis.partition("=")
+        axes[name] = [float(v) for v in values.split(",")]
+    inputs_list = list(profiles.values())
+    grid = sensitivity_grid(inputs_list, axes or default_sensitivity_axes(inputs_list[0], assumptions), assumptions)
+    sink = _output_sink(args.output)
+    try:
+        for i, profile_id in enumerate(profiles):
+            sink.write_frame(_with_profile(sensitivity_frame(grid, i), profile_id))
+    finally:
+        sink.close()
+    return len(profiles), grid["corpus"].size
+
+def _cli_portfolio(args, assumptions):
+    profiles = read_profiles(args.input)
+    result = simulate_household_portfolio(list(profiles.values()), assumptions, n_paths=args.paths, seed=args.seed)
+    sink = _output_sink(args.output)
+    count = 0
+    try:
+        for i, profile_id in enumerate(profiles):
+            frame = monte_carlo_bands_frame(portfolio_bands(result, i)) if args.paths else portfolio_frame(result, i)
+            sink.write_frame(_with_profile(frame, profile_id))
+            count += len(frame)
+    finally:
+        sink.close()
+    return len(profiles), count
+
+def _cli_retire(args, assumptions):
+    import pandas as pd
+    profiles = read_profiles(args.input)
+    if args.life_expectancy is not None:
+        assumptions = dict(assumptions, life_expectancy=args.life_expectancy)
+    sink = _output_sink(args.output)
+    try:
+        if args.safe_rate:
+            results = [safe_withdrawal_rate(inputs, args.strategy, args.target, n_paths=args.paths or 10000, seed=args.seed,
+                                            assumptions=assumptions) for inputs in profiles.values()]
+            sink.write_frame(_with_profile(pd.DataFrame(results), list(profiles)))
+            return len(profiles), len(results)
+        count = 0
+        for profile_id, inputs in profiles.items():
+            result = simulate_decumulation(inputs, args.strategy, args.rate, n_paths=args.paths, seed=args.seed, assumptions=assumptions)
+            frame = decumulation_frame(result)
+            frame["Success Probability"] = result["success_probability"]
+            sink.write_frame(_with_profile(frame, profile_id))
+            count += len(frame)
+        return len(profiles), count
+    finally:
+        sink.close()
+
+def _cli_table(args, assumptions):
+    profiles = read_profiles(args.input)
+    table = profiles_table(profiles.values())
+    table.index = list(profiles)
+    write_profile_table(table, sys.stdout if args.output == "-" else args.output)
+    return len(table), len(table)
+
+def _parse_time(value):
+    """Epoch seconds from a number or an ISO date/time string."""
+    import datetime
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def _cli_store(args, assumptions):
+    import pandas as pd
+    with ProjectionStore(args.input) as store:
+        as_of = _parse_time(args.as_of) if args.as_of else None
+        scoped = assumptions or None
+        if args.below is not None:
+            frame = pd.DataFrame(store.clients_below(args.below, args.scenario, as_of, scoped), columns=["Profile", "Final Corpus"])
+        elif args.before:
+            pairs = store.compare(args.client or None, args.scenario, _parse_time(args.before), as_of, scoped)
+            frame = pd.DataFrame([(client_id, old, new) for client_id, (old, new) in pairs.items()],
+                                 columns=["Profile", "Final Corpus Before", "Final Corpus After"])
+            frame["Change"] = frame["Final Corpus After"] - frame["Final Corpus Before"]
+        elif args.client:
+            frame = store.results_frame(args.client, args.scenario, as_of, scoped)
+            frame = _with_profile(frame.drop(columns="Client"), frame["Client"])
+        else:
+            frame = pd.DataFrame(store.summaries(args.scenario, as_of, scoped)).rename(columns={"client_id": "Profile"})
+    sink = _output_sink(args.output)
+    try:
+        sink.write_frame(frame)
+    finally:
+        sink.close()
+    return frame["Profile"].nunique() if len(frame) else 0, len(frame)
+
+def cli(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="financial_cli", description="Run financial projections without the Streamlit app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    project = commands.add_parser("project", help="year-by-year projections for every profile")
+    project.add_argument("--engine", choices=["batch", "loop"], default="batch",
+                         help="vectorized batch engine (default) or the per-profile loop engine")
+    project.add_argument("--chunk-size", type=int, default=10000, help="profiles per batch chunk")
+    project.add_argument("--events", action="store_true", help="include the Life Events column (batch engine)")
+    project.add_argument("--verbose", action="store_true", help="log every calculation step (loop engine)")
+    project.add_argument("--store", metavar="DB", help="also save profiles and results to this SQLite projection store")
+    project.set_defaults(run=_cli_project)
+    monte_carlo = commands.add_parser("monte-carlo", help="Corpus percentile bands over stochastic paths")
+    monte_carlo.add_argument("--paths", type=int, default=10000)
+    monte_carlo.add_argument("--seed", type=int)
+    monte_carlo.set_defaults(run=_cli_monte_carlo)
+    solve = commands.add_parser("solve", help="goal seek: the input that reaches a target corpus at retirement")
+    solve.add_argument("--target", type=float, required=True, help="corpus to reach in the year before retirement")
+    solve.add_argument("--variable", choices=sorted(GOAL_SEEK_VARIABLES) + ["retirement_age"], default="annual_contribution")
+    solve.add_argument("--retirement-age", type=int, help="retire at this age instead of each profile's own")
+    solve.add_argument("--tol", type=float, default=1.0, help="precision of the solved value")
+    solve.set_defaults(run=_cli_solve)
+    sweep = commands.add_parser("sweep", help="corpus at retirement over a grid of assumptions")
+    sweep.add_argument("--axis", action="append", default=[], metavar="FACTOR=V1,V2,...",
+                       help=f"grid axis, repeatable; factors: {', '.join(SWEEP_FACTORS)} (default: around the first profile)")
+    sweep.set_defaults(run=_cli_sweep)
+    portfolio = commands.add_parser("portfolio", help="household portfolio by asset class, or its corpus bands with --paths")
+    portfolio.add_argument("--paths", type=int, help="draw this many return paths and write percentile bands")
+    portfolio.add_argument("--seed", type=int)
+    portfolio.set_defaults(run=_cli_portfolio)
+    retire = commands.add_parser("retire", help="draw down the retirement corpus to life expectancy, or solve the safe withdrawal rate")
+    retire.add_argument("--strategy", choices=WITHDRAWAL_STRATEGIES, help="withdrawal strategy (default: the assumption set's)")
+    retire.add_argument("--rate", type=float, help="withdrawal rate (default: the assumption set's)")
+    retire.add_argument("--life-expectancy", type=int)
+    retire.add_argument("--paths", type=int, help="draw this many return and inflation paths (10000 for --safe-rate)")
+    retire.add_argument("--seed", type=int)
+    retire.add_argument("--safe-rate", action="store_true", help="solve the highest rate at which --target of the paths last")
+    retire.add_argument("--target", type=float, help="share of paths that must last (default: the assumption set's)")
+    retire.set_defaults(run=_cli_retire)
+    table = commands.add_parser("table", help="convert JSON profiles into a CSV profile table")
+    table.set_defaults(run=_cli_table)
+    store = commands.add_parser("store", help="query a projection store: latest results, clients below a target, comparisons")
+    store.add_argument("--below", type=float, metavar="TARGET", help="clients whose latest final Corpus is below TARGET")
+    store.add_argument("--before", metavar="TIME", help="compare the latest results as of TIME with those as of --as-of")
+    store.add_argument("--as-of", metavar="TIME", help="epoch seconds or ISO date (default: now)")
+    store.add_argument("--client", action="append", default=[], help="restrict to this client (repeatable); alone, prints its projection")
+    store.set_defaults(run=_cli_store)
+    for command in (project, store):
+        command.add_argument("--scenario", default="base", help="scenario label results are stored under")
+    for command in (project, monte_carlo, solve, sweep, portfolio, retire, table, store):
+        command.add_argument("input", help="profiles: .json, .jsonl or (project only) a .csv profile table; - for stdin JSON; "
+                                           "the database file for store")
+        command.add_argument("-o", "--output", default="-", help=f"output file ({', '.join(sorted(EXPORT_SINKS))}); - for CSV on stdout")
+        command.add_argument("--assumptions", help="JSON file of assumption overrides")
+        command.add_argument("--tax-regime", choices=tax_regime_names())
+        command.add_argument("--log-level", default="WARNING")
+        command.add_argument("--metrics", metavar="PATH", default=os.environ.get(METRICS_ENV),
+                             help=f"write stage timings to PATH (.json, or Prometheus text otherwise); default ${METRICS_ENV}")
+    args = parser.parse_args(argv)
+
+    level = "INFO" if getattr(args, "verbose", False) else args.log_level.upper()
+    logging.basicConfig(level=level, format="%(asctime)s - %(levelname)s - %(message)s", stream=sys.stderr)
+    assumptions = {}
+    if args.assumptions:
+        with open(args.assumptions, encoding="utf-8") as f:
+            assumptions.update(json.load(f))
+    if args.tax_regime:
+        assumptions["tax_regime"] = args.tax_regime
+    if args.metrics:
+        METRICS.enable()
+    start = time.perf_counter()
+    try:
+        with METRICS.stage(f"cli.{args.command}"):
+            profiles, rows = args.run(args, assumptions)
+    except (FileNotFoundError, ValueError) as exc:
+        parser.error(str(exc))
+    logger.info(f"{args.command}: {profiles} profiles, {rows} rows in {time.perf_counter() - start:.2f}s")
+    if args.metrics:
+        METRICS.write(args.metrics)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,2459 @@
+"""
+Headless financial projection engine: tax, loans, life events, and the loop,
+vectorized, batch and Monte Carlo projections with the analyses built on them.
+
+Importing this module only loads numpy and the standard library. pandas and
+altair are imported by the functions that build frames and charts, so workers
+and scripts that only project pay for the math libraries. Around the engine:
+
+    financial_parallel  batch and Monte Carlo runs sharded over a process pool
+    financial_export    streaming sinks and export formats
+    financial_store     result cache and the SQLite projection store
+    financial_reports   PDF and Excel reports and chart data
+    financial_cli       the command line
+
+The Streamlit app (proxy_metaclass.py) builds its UI on top of these modules.
+"""
+import numpy as np
+import logging
+from math import ceil
+import json
+import hashlib
+import copy
+import bisect
+import heapq
+from collections import deque, namedtuple
+import os
+import time
+import threading
+import functools
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Public names
+__all__ = [
+    "TRACE_OFF", "TRACE_SUMMARY", "TRACE_FULL", "TraceRecord", "render_record", "CalculationTrace",
+    "METRICS_ENV", "STAGE_BUCKETS", "PROJECTION_STAGES", "Histogram", "StageLaps", "Metrics", "METRICS", "timed",
+    "AssumptionsAnalysis",
+    "TAX_REGIMES_PATH", "TaxSchedule", "load_tax_schedules", "get_tax_schedule", "tax_regime_names",
+    "DetailedCalculations",
+    "LOAN_CHUNK", "emi_payment", "loans_from_inputs", "loan_balances", "amortize_loans", "profile_debt_schedule",
+    "loan_schedule_frame",
+    "ScheduledEvent", "EVENT_RANKS", "CHILD_EXPENSE", "MARRIAGE_MIN_COST", "MARRIAGE_INCOME_MULTIPLE", "event_cost",
+    "render_event", "marriage_year", "custom_events_from_inputs", "EventSchedule", "profile_event_costs", "pay_event_costs",
+    "DEFAULT_ASSUMPTIONS", "simulate_yearly_projection", "iter_yearly_projection",
+    "property_value", "profile_from_inputs", "OBJECT_PROFILE_FIELDS", "RATE_KEYS", "price_index", "project_profile_arrays",
+    "marriage_delayed", "vectorized_yearly_projection",
+    "PROFILE_DEFAULTS", "NUMERIC_PROFILE_FIELDS", "profiles_table", "BatchProjection", "PROJECTION_FIELDS", "ProjectionResult",
+    "projection_frame", "simulate_batch_projection",
+    "MONTE_CARLO_FACTORS", "DEFAULT_VOLATILITY", "draw_rate_paths", "MONTE_CARLO_BLOCK", "monte_carlo_streams",
+    "draw_path_blocks", "monte_carlo_distributions", "summarize_monte_carlo", "simulate_monte_carlo", "monte_carlo_bands_frame",
+    "PORTFOLIO_DEFAULTS", "portfolio_assumptions", "household_from_inputs", "withdraw_pro_rata", "rebalance_holdings",
+    "simulate_household_portfolio", "asset_class_label", "portfolio_frame", "portfolio_bands",
+    "DECUMULATION_DEFAULTS", "WITHDRAWAL_STRATEGIES", "decumulation_assumptions", "decumulation_paths",
+    "fixed_withdrawal_capacity", "retirement_start", "simulate_decumulation", "decumulation_frame", "safe_withdrawal_rate",
+    "GOAL_SEEK_VARIABLES", "goal_seek",
+    "SWEEP_FACTORS", "scenario_corpus", "sensitivity_grid", "tornado_sensitivity", "default_sensitivity_axes",
+    "sensitivity_frame", "tornado_frame", "sensitivity_heatmap", "tornado_chart",
+    "ENGINE_VERSION", "content_hash", "engine_fingerprint",
+    "LATE_EFFECT_INPUTS", "first_changed_year", "IncrementalProjection",
+]
+
+# -----------------------------------------------------------------------------
+# CALCULATION TRACE
+# -----------------------------------------------------------------------------
+# Trace levels: OFF skips all formatting and allocation, SUMMARY keeps the
+# headline results (tax, savings, DTI, corpus, cashflow, life events) and FULL
+# keeps every formula step as an audit trail.
+TRACE_OFF, TRACE_SUMMARY, TRACE_FULL = 0, 1, 2
+
+TraceRecord = namedtuple("TraceRecord", ["formula", "template", "inputs", "output"])
+
+def render_record(record):
+    return record.template.format(output=record.output, **record.inputs)
+
+class CalculationTrace:
+    """
+    Structured records of calculation steps. Callers check `level` before
+    recording, so nothing is built when tracing is off; text is only rendered
+    when asked for, or immediately when a sink (e.g. print) is attached.
+    """
+    def __init__(self, level=TRACE_OFF, max_records=None, sink=None):
+        self.level = level
+        self.records = deque(maxlen=max_records)
+        self.sink = sink
+
+    def record(self, formula, template, output, **inputs):
+        record = TraceRecord(formula, template, inputs, output)
+        self.records.append(record)
+        if self.sink is not None:
+            self.sink(render_record(record))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(render_record(record))
+
+    def render(self):
+        return [render_record(record) for record in self.records]
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame([{"Formula": r.formula, "Inputs": r.inputs, "Output": r.output, "Message": render_record(r)}
+                             for r in self.records])
+
+
+# -----------------------------------------------------------------------------
+# INSTRUMENTATION
+# -----------------------------------------------------------------------------
+# Stage timers and counters for the projection pipeline, aggregated into
+# fixed-bucket histograms and exported as Prometheus text or JSON. Disabled by
+# default: every probe is one `enabled` check (a `None` check per stage inside
+# the yearly loop), so nothing is timed or allocated. Setting the
+# FINANCIAL_METRICS environment variable to an output path enables it at import.
+# Each process keeps its own registry; snapshots merge across worker processes.
+METRICS_ENV = "FINANCIAL_METRICS"
+# Upper bounds (seconds) of the stage histogram buckets, roughly 2.5x apart
+STAGE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Stages of one loop-engine projection, timed per year and observed once per projection
+PROJECTION_STAGES = ("setup", "income", "expense", "debt", "tax", "investment", "events", "corpus")
+
+class Histogram:
+    """Cumulative-style latency histogram over fixed bucket bounds (the last bucket is +Inf)."""
+    __slots__ = ("bounds", "buckets", "count", "sum")
+
+    def __init__(self, bounds=STAGE_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, buckets, count, total):
+        for i, n in enumerate(buckets):
+            self.buckets[i] += n
+        self.count += count
+        self.sum += total
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (the largest bound if it is in +Inf)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.bounds, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+class StageLaps:
+    """Per-run accumulator for stages timed inside a loop; observed into the registry once at the end."""
+    __slots__ = ("metrics", "group", "totals", "last")
+
+    def __init__(self, metrics, group):
+        self.metrics = metrics
+        self.group = group
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def mark(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.totals[stage] = self.totals.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def observe(self):
+        for stage, seconds in self.totals.items():
+            self.metrics.observe(f"{self.group}.{stage}", seconds)
+
+class _Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+_NO_STAGE = nullcontext()
+
+class Metrics:
+    """
+    Registry of stage histograms and counters. Use `stage(name)` as a context
+    manager, `@timed(name)` on functions, `laps(group)` inside hot loops and
+    `count(name)` for counters; all are no-ops while disabled.
+    """
+    def __init__(self, enabled=False, bounds=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.bounds = bounds
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.bounds)
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def laps(self, group):
+        """A StageLaps for one run, or None while disabled (callers check before each lap)."""
+        return StageLaps(self, group) if self.enabled else None
+
+    # -- snapshots ------------------------------------------------------------
+    def snapshot(self, reset=False):
+        """Plain-data copy of the registry (picklable, JSON-able); reset clears it, e.g. in worker processes."""
+        with self.lock:
+            snap = {"histograms": {name: (list(h.buckets), h.count, h.sum) for name, h in self.histograms.items()},
+                    "counters": dict(self.counters)}
+            if reset:
+                self.histograms = {}
+                self.counters = {}
+        return snap
+
+    def merge(self, snapshot):
+        """Add a snapshot taken elsewhere (another process, an earlier run) into this registry."""
+        if not snapshot:
+            return
+        with self.lock:
+            for name, (buckets, count, total) in snapshot["histograms"].items():
+                self.histograms.setdefault(name, Histogram(self.bounds)).merge(buckets, count, total)
+            for name, n in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    # -- export ---------------------------------------------------------------
+    def to_json(self):
+        with self.lock:
+            stages = {name: {"count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0,
+                             "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99),
+                             "buckets": dict(zip([str(b) for b in h.bounds] + ["+Inf"], h.buckets))}
+                      for name, h in sorted(self.histograms.items())}
+            return {"stages": stages, "counters": dict(sorted(self.counters.items()))}
+
+    def to_prometheus(self, prefix="financial"):
+        """Prometheus text exposition: one stage_seconds histogram labelled by stage, and one counter per name."""
+        lines = [f"# HELP {prefix}_stage_seconds Wall time per pipeline stage.", f"# TYPE {prefix}_stage_seconds histogram"]
+        with self.lock:
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, n in zip([repr(b) for b in h.bounds] + ["+Inf"], h.buckets):
+                    cumulative += n
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum!r}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}')
+            for name, n in sorted(self.counters.items()):
+                metric = f"{prefix}_{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {n}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write JSON (.json) or Prometheus text (anything else, e.g. a node_exporter .prom file), atomically."""
+        text = json.dumps(self.to_json(), indent=2) if str(path).endswith(".json") else self.to_prometheus()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+METRICS = Metrics(enabled=bool(os.environ.get(METRICS_ENV)))
+
+def timed(stage):
+    """Decorator timing every call of a function as `stage` while METRICS is enabled."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                METRICS.observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+# -----------------------------------------------------------------------------
+# ASSUMPTIONS & ANALYSIS MODULE
+# -----------------------------------------------------------------------------
+class AssumptionsAnalysis:
+    def __init__(self, inputs, trace=None):
+        self.inputs = inputs
+        self.trace = trace if trace is not None else CalculationTrace()
+
+    @property
+    def logs(self):
+        return self.trace.render()
+
+    def handle_marriage_event(self, annual_income, reserved_investments=None, emergency_fund=None):
+        pers = self.inputs.get("personal_information", {})
+        marriage_age = pers.get("age_of_marriage")
+        current_age = pers.get("age")
+        if marriage_age is None or marriage_age <= current_age:
+            raise ValueError("Invalid marriage age.")
+        years_until_marriage = marriage_age - current_age
+        scheduled_year = years_until_marriage
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("marriage_schedule", "Marriage scheduled in simulation year: {output}", scheduled_year, marriage_age=marriage_age, current_age=current_age)
+
+        cost = max(1.8 * annual_income, 2000000)
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("marriage_cost", "Calculated marriage cost: {output:.2f}", cost, annual_income=annual_income)
+
+        reserved_inv = self.inputs.get("reserved_investments", 1000000) if reserved_investments is None else reserved_investments
+        emergency = self.inputs.get("emergency_fund", 500000) if emergency_fund is None else emergency_fund
+        if cost > 200000:
+            if reserved_inv >= cost:
+                funding_source = "Reserved Investments"
+                reserved_inv -= cost
+            else:
+                shortfall = cost - reserved_inv
+                funding_source = "Reserved Investments & Emergency Fund"
+                emergency -= shortfall
+            if self.trace.level >= TRACE_FULL:
+                self.trace.record("marriage_funding", "Marriage funded by {output}. Updated reserves: Investments {reserved_investments}, Emergency {emergency_fund}", funding_source, reserved_investments=reserved_inv, emergency_fund=emergency)
+        dti = self.calculate_DTI()
+        delayed = dti > 0.4 or (reserved_inv + emergency) < cost
+        if delayed:
+            if self.trace.level >= TRACE_SUMMARY:
+                self.trace.record("marriage_delay", "Marriage event delayed due to insufficient funds or high DTI.", scheduled_year + 1, dti=dti, cost=cost)
+            scheduled_year += 1
+        return {"event": "Marriage", "scheduled_year": scheduled_year, "cost": cost, "delayed": delayed, "logs": self.logs}
+
+    def handle_children_events(self):
+        pers = self.inputs.get("personal_information", {})
+        children = pers.get("children", [])
+        events = []
+        for i, child in enumerate(children):
+            scheduled_year = child.get("age_at_birth", 0) + 1
+            cost = 200000
+            events.append({"event": f"Child_{i+1}_Expense", "scheduled_year": scheduled_year, "cost": cost})
+            if self.trace.level >= TRACE_SUMMARY:
+                self.trace.record("child_event", "Scheduled one-time expense for Child {child} in year {scheduled_year} with cost {output}.", cost, child=i+1, scheduled_year=scheduled_year)
+        return events
+
+    def handle_unexpected_events(self, total_income, sim_year, interval=3, rate=0.2):
+        events = []
+        if sim_year % interval == 0:
+            cost = rate * total_income
+            events.append({"event": "Unexpected Expense", "scheduled_year": sim_year, "cost": cost})
+            if self.trace.level >= TRACE_SUMMARY:
+                self.trace.record("unexpected_event", "Unexpected expense scheduled in year {sim_year} with cost {output:.2f}.", cost, sim_year=sim_year, total_income=total_income, rate=rate)
+        return events
+
+    def calculate_DTI(self):
+        career = self.inputs.get("career_income_details", {})
+        monthly_income = career.get("monthly_salary", 0)
+        liab = self.inputs.get("assets_liabilities_investments", {}).get("liabilities", [])
+        total_debt = sum([l.get("min_payment", l.get("amount", 0)/l.get("remaining_term", 1)) for l in liab])
+        dti = total_debt / monthly_income if monthly_income else 0
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("calculate_DTI", "Calculated DTI: {output:.2f}", dti, total_debt=total_debt, monthly_income=monthly_income)
+        return dti
+
+# -----------------------------------------------------------------------------
+# TAX SCHEDULES
+# -----------------------------------------------------------------------------
+TAX_REGIMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tax_regimes.json")
+
+class TaxSchedule:
+    """
+    Slab tax compiled once from (upper limit, rate) pairs, the last upper limit
+    being None. The tax owed at each slab's lower bound is precomputed, so an
+    income is taxed with one binary search plus one multiply-add.
+    """
+    def __init__(self, slabs, name=None, regime=None, assessment_year=None):
+        uppers = [float("inf") if upper is None else float(upper) for upper, _ in slabs]
+        if not uppers or uppers[-1] != float("inf") or any(b <= a for a, b in zip(uppers, uppers[1:])):
+            raise ValueError(f"Tax slabs for {name} must have increasing limits ending with an open slab.")
+        self.name = name
+        self.regime = regime
+        self.assessment_year = assessment_year
+        self.lowers = np.array([0.0] + uppers[:-1])
+        self.uppers = np.array(uppers)
+        self.rates = np.array([float(rate) for _, rate in slabs])
+        self.base_tax = np.concatenate([[0.0], np.cumsum((self.uppers[:-1] - self.lowers[:-1]) * self.rates[:-1])])
+        self._lowers = self.lowers.tolist()
+        self._rates = self.rates.tolist()
+        self._base_tax = self.base_tax.tolist()
+
+    def tax(self, taxable_income):
+        if taxable_income <= 0:
+            return 0.0
+        i = bisect.bisect_right(self._lowers, taxable_income) - 1
+        return self._base_tax[i] + (taxable_income - self._lowers[i]) * self._rates[i]
+
+    def tax_array(self, taxable_incomes):
+        incomes = np.maximum(np.asarray(taxable_incomes, dtype=float), 0.0)
+        i = np.searchsorted(self.lowers, incomes, side="right") - 1
+        return self.base_tax[i] + (incomes - self.lowers[i]) * self.rates[i]
+
+    def breakdown(self, taxable_income):
+        """(lower, upper, rate, tax) for each taxed slab the income reaches."""
+        slabs = []
+        for lower, upper, rate in zip(self._lowers, self.uppers.tolist(), self._rates):
+            if taxable_income <= lower:
+                break
+            if rate:
+                slabs.append((lower, upper, rate, (min(taxable_income, upper) - lower) * rate))
+        return slabs
+
+_TAX_SCHEDULES = {}
+
+def load_tax_schedules(path=TAX_REGIMES_PATH):
+    """Compile every regime in a tax regime file; returns (schedules by name, default name)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    schedules = {name: TaxSchedule(spec["slabs"], name=name, regime=spec.get("regime"), assessment_year=spec.get("assessment_year"))
+                 for name, spec in data["regimes"].items()}
+    return schedules, data.get("default", next(iter(schedules)))
+
+def get_tax_schedule(name=None):
+    if not _TAX_SCHEDULES:
+        schedules, default = load_tax_schedules()
+        _TAX_SCHEDULES.update(schedules)
+        _TAX_SCHEDULES[None] = schedules[default]
+    if name not in _TAX_SCHEDULES:
+        raise ValueError(f"Unknown tax regime: {name}")
+    return _TAX_SCHEDULES[name]
+
+def tax_regime_names():
+    get_tax_schedule()
+    return [name for name in _TAX_SCHEDULES if name is not None]
+
+# -----------------------------------------------------------------------------
+# DETAILED CALCULATION FORMULAS MODULE
+# -----------------------------------------------------------------------------
+class DetailedCalculations:
+    """
+    The calculation formulas, each recording its step on `trace`.
+    verbose=True traces every step to the module logger at INFO; it no longer writes
+    with st.write as before, since the engine must not import Streamlit. To show the
+    steps in the app, pass trace=CalculationTrace(TRACE_FULL, sink=st.write) instead.
+    """
+    def __init__(self, verbose=False, trace=None, tax_schedule=None):
+        self.verbose = verbose
+        self.tax_schedule = tax_schedule or get_tax_schedule()
+        if trace is None:
+            trace = CalculationTrace(TRACE_FULL, sink=logger.info) if verbose else CalculationTrace()
+        self.trace = trace
+
+    @property
+    def logs(self):
+        return self.trace.render()
+
+    # Income Projection
+    def compute_monthly_income(self, base_salary, bonus, bonus_conversion_factor):
+        monthly_income = base_salary + (bonus / bonus_conversion_factor)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("compute_monthly_income", "Monthly Income: {base_salary} + ({bonus}/{bonus_conversion_factor}) = {output:.2f}", monthly_income, base_salary=base_salary, bonus=bonus, bonus_conversion_factor=bonus_conversion_factor)
+        return monthly_income
+
+    def project_annual_income(self, current_income, growth_rate):
+        new_income = current_income * (1 + growth_rate)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("project_annual_income", "Annual Income Projection: {current_income:.2f} * (1 + {growth_rate}) = {output:.2f}", new_income, current_income=current_income, growth_rate=growth_rate)
+        return new_income
+
+    def update_income_for_role_change(self, current_income, increment_rate):
+        new_income = current_income * (1 + increment_rate)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("update_income_for_role_change", "Role-based Income Update: {current_income:.2f} * (1 + {increment_rate}) = {output:.2f}", new_income, current_income=current_income, increment_rate=increment_rate)
+        return new_income
+
+    # Expense Adjustments
+    def compute_baseline_expense(self, housing_status, baseline_rent, baseline_expense, discount=0.15):
+        if housing_status.lower() == "rented":
+            expense = baseline_rent
+            if self.trace.level >= TRACE_FULL:
+                self.trace.record("compute_baseline_expense", "Baseline Expense (Rented): {output:.2f}", expense, housing_status=housing_status, baseline_rent=baseline_rent)
+        elif housing_status.lower() == "owned":
+            expense = baseline_expense * (1 - discount)
+            if self.trace.level >= TRACE_FULL:
+                self.trace.record("compute_baseline_expense", "Baseline Expense (Owned): {baseline_expense:.2f}*(1-{discount}) = {output:.2f}", expense, housing_status=housing_status, baseline_expense=baseline_expense, discount=discount)
+        else:
+            expense = baseline_expense
+            if self.trace.level >= TRACE_FULL:
+                self.trace.record("compute_baseline_expense", "Baseline Expense (Other): {output:.2f}", expense, housing_status=housing_status, baseline_expense=baseline_expense)
+        return expense
+
+    def apply_inflation(self, expense, inflation_rate):
+        new_expense = expense * (1 + inflation_rate)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("apply_inflation", "Expense with Inflation: {expense:.2f}*(1+{inflation_rate}) = {output:.2f}", new_expense, expense=expense, inflation_rate=inflation_rate)
+        return new_expense
+
+    def compute_marriage_cost(self, annual_income):
+        cost = max(1.8 * annual_income, 2000000)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("compute_marriage_cost", "Marriage Cost: max(1.8*{annual_income:.2f},2000000) = {output:.2f}", cost, annual_income=annual_income)
+        return cost
+
+    def compute_child_event_cost(self):
+        cost = 200000
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("compute_child_event_cost", "Child Event Cost: ₹{output}", cost)
+        return cost
+
+    # Debt & EMI Calculation
+    def calculate_emi(self, principal, annual_interest_rate, number_months):
+        monthly_rate = (annual_interest_rate / 100) / 12
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("monthly_interest_rate", "Monthly Interest Rate: {output:.6f}", monthly_rate, annual_interest_rate=annual_interest_rate)
+        emi = float(emi_payment(principal, annual_interest_rate, number_months))
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("calculate_emi", "EMI Calculation: {output:.2f}", emi, principal=principal, monthly_rate=monthly_rate, number_months=number_months)
+        return emi
+
+    def calculate_dti(self, total_monthly_debt_payments, gross_monthly_income):
+        dti = total_monthly_debt_payments / gross_monthly_income if gross_monthly_income else 0
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("calculate_dti", "DTI Calculation: {output:.2f}", dti, total_monthly_debt_payments=total_monthly_debt_payments, gross_monthly_income=gross_monthly_income)
+        return dti
+
+    # Asset Valuation
+    def appreciate_asset(self, asset_value, appreciation_rate):
+        new_value = asset_value * (1 + appreciation_rate)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("appreciate_asset", "Asset Appreciation: {asset_value}*(1+{appreciation_rate}) = {output:.2f}", new_value, asset_value=asset_value, appreciation_rate=appreciation_rate)
+        return new_value
+
+    def depreciate_asset(self, asset_value, depreciation_rate):
+        new_value = asset_value * (1 - depreciation_rate)
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("depreciate_asset", "Asset Depreciation: {asset_value}*(1-{depreciation_rate}) = {output:.2f}", new_value, asset_value=asset_value, depreciation_rate=depreciation_rate)
+        return new_value
+
+    # Tax Calculation
+    def compute_taxable_income(self, total_income, allowable_deductions):
+        taxable_income = total_income - allowable_deductions
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("compute_taxable_income", "Taxable Income: {total_income} - {allowable_deductions} = {output}", taxable_income, total_income=total_income, allowable_deductions=allowable_deductions)
+        return taxable_income
+
+    def calculate_tax_liability(self, taxable_income):
+        tax = self.tax_schedule.tax(taxable_income)
+        if self.trace.level >= TRACE_FULL:
+            for lower, upper, rate, slab_tax in self.tax_schedule.breakdown(taxable_income):
+                self.trace.record("slab_tax", "Tax for slab {lower:.0f}-{upper:.0f} at {rate_pct}%: {output}", slab_tax, lower=lower, upper=upper, rate_pct=rate*100)
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("calculate_tax_liability", "Total Tax Liability: {output:.2f}", tax, taxable_income=taxable_income, regime=self.tax_schedule.name)
+        return tax
+
+    # Savings, Investment & Rebalancing
+    def compute_savings(self, total_income, total_expenses, debt_payments, taxes):
+        savings = total_income - (total_expenses + debt_payments + taxes)
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("compute_savings", "Savings: {output:.2f}", savings, total_income=total_income, total_expenses=total_expenses, debt_payments=debt_payments, taxes=taxes)
+        return savings
+
+    def project_investment_growth(self, current_investment, new_contributions, expected_return):
+        growth = current_investment * expected_return
+        new_value = current_investment + new_contributions + growth
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("project_investment_growth", "Investment Growth: {current_investment}+{new_contributions}+{growth:.2f} = {output:.2f}", new_value, current_investment=current_investment, new_contributions=new_contributions, growth=growth)
+        return new_value
+
+    def rebalance_funds(self, savings, investment_value, withdrawal_amount):
+        total_funds = savings + investment_value
+        if withdrawal_amount > total_funds:
+            if self.trace.level >= TRACE_SUMMARY:
+                self.trace.record("rebalance_funds", "Insufficient funds to rebalance.", None, savings=savings, investment_value=investment_value, withdrawal_amount=withdrawal_amount)
+            return savings, investment_value
+        ratio_savings = savings / total_funds
+        ratio_inv = investment_value / total_funds
+        withdraw_savings = withdrawal_amount * ratio_savings
+        withdraw_inv = withdrawal_amount * ratio_inv
+        new_savings = savings - withdraw_savings
+        new_investment = investment_value - withdraw_inv
+        if self.trace.level >= TRACE_FULL:
+            self.trace.record("rebalance_funds", "Rebalance: Withdraw {withdrawal_amount} -> Savings: {withdraw_savings:.2f}, Investments: {withdraw_inv:.2f}", (new_savings, new_investment), withdrawal_amount=withdrawal_amount, withdraw_savings=withdraw_savings, withdraw_inv=withdraw_inv)
+        return new_savings, new_investment
+
+    def trace_cashflow(self, income, expenses, emergency, debt_payment, investment):
+        cashflow = {"income": income, "expenses": expenses, "emergency": emergency, "debt_payment": debt_payment, "investments": investment}
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("trace_cashflow", "Cashflow: Income={income}, Expenses={expenses}, Emergency={emergency}, Debt Payment={debt_payment}, Investments={investments}", None, **cashflow)
+        return cashflow
+
+    def calculate_corpus(self, savings, investment_growth, asset_appreciation, liabilities):
+        corpus = savings + investment_growth + asset_appreciation - liabilities
+        if self.trace.level >= TRACE_SUMMARY:
+            self.trace.record("calculate_corpus", "Corpus: {output:.2f}", corpus, savings=savings, investment_growth=investment_growth, asset_appreciation=asset_appreciation, liabilities=liabilities)
+        return corpus
+
+# -----------------------------------------------------------------------------
+# LOAN AMORTIZATION
+# -----------------------------------------------------------------------------
+# Loans are dicts of principal, annual_rate (% p.a.), monthly payment and optional
+# prepayments ({"month", "amount"}, applied after that month's payment). Balances
+# come from the closed form B[k] = B[0]*g^k - PMT*(g^k - 1)/i with g = 1 + i, so a
+# whole schedule is evaluated at once for many loans; a prepayment restarts the
+# closed form from the reduced balance.
+LOAN_CHUNK = 4096
+
+def emi_payment(principal, annual_rate, months):
+    monthly_rate = np.asarray(annual_rate, dtype=float) / 100 / 12
+    months = np.maximum(np.asarray(months, dtype=float), 1)
+    factor = (1 + monthly_rate) ** months
+    with np.errstate(divide="ignore", invalid="ignore"):
+        emi = np.where(monthly_rate > 0, principal * monthly_rate * factor / (factor - 1), principal / months)
+    return emi
+
+def loans_from_inputs(all_inputs):
+    """
+    Liabilities and the mortgage as loans. Each pays at least the EMI that clears
+    it within its remaining term, or the stated payment if that is larger.
+    """
+    assets_data = all_inputs.get("assets_liabilities_investments", {})
+    loans = []
+    for l in assets_data.get("liabilities", []):
+        principal, rate, term = l.get("amount", 0), l.get("interest_rate", 0), l.get("remaining_term", 1)
+        loans.append({
+            "name": l.get("liability_name", "Liability"),
+            "principal": principal,
+            "annual_rate": rate,
+            "payment": max(l.get("min_payment", 0), float(emi_payment(principal, rate, term))),
+            "prepayments": list(l.get("prepayments", [])),
+        })
+    md = assets_data.get("mortgage_details")
+    if md:
+        principal, rate, term = md.get("principal", 0), md.get("loan_interest_rate", 0), md.get("remaining_term", 1)
+        loans.append({
+            "name": "Mortgage",
+            "principal": principal,
+            "annual_rate": rate,
+            "payment": max(md.get("emi_amount", 0), float(emi_payment(principal, rate, term))),
+            "prepayments": list(md.get("prepayments", [])),
+        })
+    return loans
+
+def _closed_form_balance(balance, monthly_rate, payment, months_elapsed):
+    with np.errstate(over="ignore", invalid="ignore"):
+        growth = (1 + monthly_rate) ** months_elapsed
+        amortized = balance * growth - payment * (growth - 1) / np.where(monthly_rate > 0, monthly_rate, 1)
+    return np.maximum(np.where(monthly_rate > 0, amortized, balance - payment * months_elapsed), 0.0)
+
+def loan_balances(loans, months):
+    """(loans, months + 1) balances, column k being the balance after k monthly payments."""
+    principal = np.array([l["principal"] for l in loans], dtype=float).reshape(-1, 1)
+    monthly_rate = np.array([l["annual_rate"] for l in loans], dtype=float).reshape(-1, 1) / 100 / 12
+    payment = np.array([l["payment"] for l in loans], dtype=float).reshape(-1, 1)
+    k = np.arange(months + 1)
+    balances = _closed_form_balance(principal, monthly_rate, payment, k)
+    prepayments = [sorted(l.get("prepayments") or [], key=lambda p: p["month"]) for l in loans]
+    for j in range(max((len(p) for p in prepayments), default=0)):
+        rows = np.array([i for i, p in enumerate(prepayments) if len(p) > j and p[j]["month"] <= months], dtype=int)
+        if not len(rows):
+            continue
+        month = np.array([prepayments[i][j]["month"] for i in rows], dtype=int)
+        amount = np.array([prepayments[i][j]["amount"] for i in rows], dtype=float)
+        start = np.maximum(balances[rows, month] - amount, 0.0).reshape(-1, 1)
+        elapsed = k - month.reshape(-1, 1)
+        restarted = _closed_form_balance(start, monthly_rate[rows], payment[rows], elapsed)
+        balances[rows] = np.where(elapsed >= 0, restarted, balances[rows])
+    return balances
+
+def amortize_loans(loans, years):
+    """
+    Yearly totals of a monthly amortization: "payment" (regular, final and
+    prepayments), "interest" and year-end "balance", each (loans, years).
+    """
+    result = {key: np.zeros((len(loans), years)) for key in ("payment", "interest", "balance")}
+    for start in range(0, len(loans), LOAN_CHUNK):
+        chunk = loans[start:start + LOAN_CHUNK]
+        balances = loan_balances(chunk, 12 * years)
+        monthly_rate = np.array([l["annual_rate"] for l in chunk], dtype=float).reshape(-1, 1) / 100 / 12
+        interest = balances[:, :-1] * monthly_rate
+        paid = balances[:, :-1] + interest - balances[:, 1:]
+        rows = slice(start, start + len(chunk))
+        result["payment"][rows] = paid.reshape(len(chunk), years, 12).sum(axis=2)
+        result["interest"][rows] = interest.reshape(len(chunk), years, 12).sum(axis=2)
+        result["balance"][rows] = balances[:, 12::12]
+    return result
+
+def profile_debt_schedule(loans_column, years):
+    """Per-profile yearly debt payments and year-end balances, (profiles, years) each."""
+    counts = np.array([len(loans or []) for loans in loans_column], dtype=int)
+    # A profile already past retirement age has a negative horizon and no years to schedule
+    years = max(int(years), 0)
+    payment = np.zeros((len(counts), years))
+    balance = np.zeros((len(counts), years))
+    flat = [loan for loans in loans_column for loan in (loans or [])]
+    if flat and years:
+        schedule = amortize_loans(flat, years)
+        has_loans = counts > 0
+        starts = (np.cumsum(counts) - counts)[has_loans]
+        payment[has_loans] = np.add.reduceat(schedule["payment"], starts, axis=0)
+        balance[has_loans] = np.add.reduceat(schedule["balance"], starts, axis=0)
+    return {"payment": payment, "balance": balance}
+
+def loan_schedule_frame(loan, months=None):
+    """Month-by-month schedule of one loan, up to payoff (or 50 years) by default."""
+    import pandas as pd
+    months = months or 600
+    balances = loan_balances([loan], months)[0]
+    if months == 600 and (balances == 0).any():
+        months = max(int(np.argmax(balances == 0)), 1)
+        balances = balances[:months + 1]
+    interest = balances[:-1] * loan["annual_rate"] / 100 / 12
+    paid = balances[:-1] + interest - balances[1:]
+    return pd.DataFrame({"Month": np.arange(1, months + 1), "Payment": paid, "Interest": interest,
+                         "Principal": paid - interest, "Balance": balances[1:]})
+
+# -----------------------------------------------------------------------------
+# EVENT SCHEDULING
+# -----------------------------------------------------------------------------
+# Life events are typed records in a heap keyed by (year, rank, seq), built once
+# per profile and popped in their year. A marriage is decided in the first year
+# at the marriage age and may be postponed by one year (see
+# handle_marriage_event). Costs are paid from reserved investments (marriage
+# only), then the year's savings, the emergency fund and finally investments.
+# Event strings are only rendered for display.
+ScheduledEvent = namedtuple("ScheduledEvent", ["year", "rank", "seq", "kind", "name", "amount", "income_share", "deferrable"])
+EVENT_RANKS = {"marriage": 0, "child": 1, "unexpected": 2, "custom": 3}
+CHILD_EXPENSE = 200000
+MARRIAGE_MIN_COST = 2000000
+MARRIAGE_INCOME_MULTIPLE = 1.8
+
+def event_cost(event, annual_income):
+    return max(event.amount, event.income_share * annual_income)
+
+def render_event(name, cost):
+    return f"{name} (Cost: ₹{cost:.2f})"
+
+def marriage_year(age_of_marriage, starting_age):
+    """
+    First simulation year at or past the marriage age; -1 when there is none.
+    A marriage age at or before the starting age is rejected, as in
+    AssumptionsAnalysis.handle_marriage_event, so every engine fails alike.
+    """
+    offset = np.ceil(np.asarray(age_of_marriage, dtype=float) - starting_age)
+    if np.any(offset <= 0):
+        raise ValueError("Invalid marriage age.")
+    return np.where(np.isnan(offset), -1, offset).astype(int)
+
+def custom_events_from_inputs(all_inputs):
+    """One-off expenses from all_inputs["custom_events"]: [{"name", "year", "cost"}], year counted from 0."""
+    return [{"name": e.get("name", "Custom Expense"), "year": int(e.get("year", 0)), "cost": float(e.get("cost", 0))}
+            for e in all_inputs.get("custom_events", [])]
+
+class EventSchedule:
+    """Typed life events of one profile, popped year by year from a heap."""
+    def __init__(self, events=()):
+        self.heap = list(events)
+        heapq.heapify(self.heap)
+        self.seq = max((event.seq for event in self.heap), default=-1) + 1
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, year, kind, name, amount=0.0, income_share=0.0, deferrable=False):
+        if year >= 0:
+            heapq.heappush(self.heap, ScheduledEvent(year, EVENT_RANKS[kind], self.seq, kind, name, amount, income_share, deferrable))
+            self.seq += 1
+
+    def pop_due(self, year):
+        """Remove and return the events of `year`, dropping any left from earlier years."""
+        due = []
+        while self.heap and self.heap[0].year <= year:
+            event = heapq.heappop(self.heap)
+            if event.year == year:
+                due.append(event)
+        return due
+
+    def push_marriage(self, profile):
+        self.push(int(marriage_year(profile["age_of_marriage"], profile["starting_age"])), "marriage", "Marriage",
+                  amount=MARRIAGE_MIN_COST, income_share=MARRIAGE_INCOME_MULTIPLE, deferrable=True)
+
+    @classmethod
+    def from_profile(cls, profile, assumptions=None):
+        """
+        Schedule for a profile_from_inputs dict. The unexpected expense is queued
+        for year 0 only; the engine re-queues it every interval years when it fires.
+        """
+        a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+        schedule = cls()
+        schedule.push_marriage(profile)
+        for i, year in enumerate(profile["children_birth_years"] or []):
+            schedule.push(year, "child", f"Child_{i+1}_Expense", amount=CHILD_EXPENSE)
+        if a["unexpected_expense_interval"] > 0:
+            schedule.push(0, "unexpected", "Unexpected Expense", income_share=a["unexpected_expense_rate"])
+        for event in profile["custom_events"] or []:
+            schedule.push(event["year"], "custom", event["name"], amount=event["cost"])
+        return schedule
+
+def profile_event_costs(children_column, custom_column, years):
+    """Child and custom event costs per profile and year, (profiles, years); summed in schedule order."""
+    rows, cols, costs = [], [], []
+    for p, (children, custom) in enumerate(zip(children_column, custom_column)):
+        for year in children or []:
+            rows.append(p)
+            cols.append(year)
+            costs.append(CHILD_EXPENSE)
+        for event in custom or []:
+            rows.append(p)
+            cols.append(event["year"])
+            costs.append(event["cost"])
+    out = np.zeros((len(children_column), years))
+    rows, cols, costs = np.asarray(rows, dtype=int), np.asarray(cols, dtype=int), np.asarray(costs, dtype=float)
+    inside = (cols >= 0) & (cols < years)
+    np.add.at(out, (rows[inside], cols[inside]), costs[inside])
+    return out
+
+def pay_event_costs(earmarked, other, reserved, savings, emergency_fund, investment):
+    """
+    Debit one year's event costs: earmarked (marriage) costs first from reserved
+    investments, the rest from savings, the emergency fund, then investments.
+    Works on scalars and arrays alike; returns the updated balances.
+    """
+    from_reserved = np.minimum(np.maximum(reserved, 0), earmarked)
+    due = earmarked - from_reserved + other
+    from_savings = np.minimum(np.maximum(savings, 0), due)
+    due = due - from_savings
+    from_emergency = np.minimum(np.maximum(emergency_fund, 0), due)
+    return reserved - from_reserved, savings - from_savings, emergency_fund - from_emergency, investment - (due - from_emergency)
+
+# -----------------------------------------------------------------------------
+# SIMULATION ENGINE & OUTPUT MODULE
+# -----------------------------------------------------------------------------
+# Rates and constants used by the projection engines. In the vectorized engine
+# any rate may also be an array broadcastable to (profiles, years).
+DEFAULT_ASSUMPTIONS = {
+    "start_year": 2025,
+    "income_growth": 0.04,
+    "inflation": 0.07,
+    "investment_return": 0.10,
+    "annual_contribution": 100000,
+    "asset_appreciation": 0.05,
+    "deduction_rate": 0.2,
+    "baseline_rent": 30000,
+    "baseline_expense": 30000,
+    "owned_discount": 0.15,
+    "emergency_target": 6 * 30000,
+    "emergency_allocation": 0.3,
+    "unexpected_expense_interval": 3,
+    "unexpected_expense_rate": 0.2,
+    "tax_regime": "new_ay2026_27",
+    # Amortize liabilities and the mortgage month by month (the mortgaged home is
+    # then counted as an asset); False keeps a flat min_payment on a fixed balance.
+    "amortize_liabilities": True,
+    # Debit life event costs from the cash balances; False only lists the events.
+    "apply_event_costs": True,
+}
+
+@timed("projection")
+def simulate_yearly_projection(all_inputs, verbose=False, assumptions=None, trace=None):
+    return list(iter_yearly_projection(all_inputs, verbose=verbose, assumptions=assumptions, trace=trace))
+
+def iter_yearly_projection(all_inputs, verbose=False, assumptions=None, trace=None, start_state=None, checkpoints=None):
+    """
+    Yield each year's projection row as soon as it is computed.
+    If checkpoints is a list, the carried-over state at the start of every year is
+    appended to it; passing one of those states as start_state resumes from that year.
+    """
+    laps = METRICS.laps("projection")
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    calc = DetailedCalculations(verbose=verbose, trace=trace, tax_schedule=get_tax_schedule(a["tax_regime"]))
+    analysis = AssumptionsAnalysis(all_inputs, trace=calc.trace)
+    sim_params = all_inputs.get("simulation_parameters", {})
+    starting_age = sim_params.get("starting_age", 30)
+    years_to_simulate = sim_params.get("years_to_simulate", 35)
+    current_year = a["start_year"]
+
+    # Initial variables
+    emergency_fund = all_inputs.get("emergency_fund", 500000)
+    savings = 0
+    # Sum all initial investments from assets/liabilities module
+    inv_list = all_inputs.get("assets_liabilities_investments", {}).get("investments", [])
+    total_investment = sum(item.get("current_value", 0) for item in inv_list)
+    asset_list = all_inputs.get("assets_liabilities_investments", {}).get("other_assets", [])
+    total_asset_value = sum(item.get("asset_value", 0) for item in asset_list)
+    liab_list = all_inputs.get("assets_liabilities_investments", {}).get("liabilities", [])
+    total_liabilities = sum(item.get("amount", 0) for item in liab_list)
+    debt = None
+    if a["amortize_liabilities"]:
+        debt = profile_debt_schedule([loans_from_inputs(all_inputs)], max(years_to_simulate, 0))
+        debt = {key: values[0].tolist() for key, values in debt.items()}
+        total_asset_value += property_value(all_inputs)
+    emergency_target = a["emergency_target"]  # 6 months baseline by default
+    reserved_investments = all_inputs.get("reserved_investments", 1000000)
+    # Income and expenses grow from the level the earlier years reached
+    income_level = price_level = 1.0
+    schedule = EventSchedule.from_profile(profile_from_inputs(all_inputs), a)
+    if calc.trace.level >= TRACE_SUMMARY:
+        calc.trace.record("event_schedule", "Scheduled {output} life events.", len(schedule))
+
+    current_age_sim = starting_age
+    first_year = 0
+    if start_state is not None:
+        first_year = start_state["sim_year"]
+        current_age_sim = start_state["age"]
+        emergency_fund = start_state["emergency_fund"]
+        total_investment = start_state["total_investment"]
+        total_asset_value = start_state["total_asset_value"]
+        total_liabilities = start_state["total_liabilities"]
+        reserved_investments = start_state["reserved_investments"]
+        income_level, price_level = start_state["income_level"], start_state["price_level"]
+        schedule = EventSchedule(start_state["events"])
+    if laps:
+        laps.lap("setup")
+
+    for sim_year in range(first_year, years_to_simulate):
+        if laps:
+            laps.mark()
+        if checkpoints is not None:
+            checkpoints.append({"sim_year": sim_year, "age": current_age_sim, "emergency_fund": emergency_fund,
+                                "total_investment": total_investment, "total_asset_value": total_asset_value,
+                                "total_liabilities": total_liabilities, "reserved_investments": reserved_investments,
+                                "income_level": income_level, "price_level": price_level, "events": tuple(schedule.heap)})
+        year_notes = []
+        # --- Income Projection ---
+        career = all_inputs.get("career_income_details", {})
+        base_salary = career.get("monthly_salary", 0)
+        bonus_amount = career.get("bonus", {}).get("amount", 0)
+        bonus_freq = career.get("bonus", {}).get("frequency", "annual")
+        conv_dict = {"annual": 12, "quarterly": 3, "monthly": 1}
+        bonus_conversion = conv_dict.get(bonus_freq, 12)
+        monthly_income = calc.compute_monthly_income(base_salary, bonus_amount, bonus_conversion)
+        annual_income = (monthly_income * 12) * income_level
+        annual_income = calc.project_annual_income(annual_income, a["income_growth"])
+        income_level *= 1 + a["income_growth"]
+        if laps:
+            laps.lap("income")
+
+        # --- Expense Projection ---
+        pers = all_inputs.get("personal_information", {})
+        assets_data = all_inputs.get("assets_liabilities_investments", {})
+        housing_status = assets_data.get("housing_status", "Rented")
+        expense = calc.compute_baseline_expense(housing_status, a["baseline_rent"], a["baseline_expense"], a["owned_discount"])
+        expense *= pers.get("city_cost_factor", 1.0)
+        expense = calc.apply_inflation(expense * price_level, a["inflation"])
+        price_level *= 1 + a["inflation"]
+        monthly_expense = expense
+        total_expense = monthly_expense * 12
+
+        # --- Emergency Fund ---
+        surplus = annual_income - total_expense
+        if surplus > 0 and emergency_fund < emergency_target:
+            added = surplus * a["emergency_allocation"]
+            emergency_fund += added
+            year_notes.append(f"Emergency fund increased by {added:.2f}")
+        if laps:
+            laps.lap("expense")
+
+        # --- Debt Repayment ---
+        if debt is None:
+            total_monthly_debt = sum([l.get("min_payment", l.get("amount", 0) / l.get("remaining_term", 1)) for l in liab_list])
+            annual_debt = total_monthly_debt * 12
+        else:
+            annual_debt = debt["payment"][sim_year]
+            total_monthly_debt = annual_debt / 12
+            total_liabilities = debt["balance"][sim_year]
+        dti = calc.calculate_dti(total_monthly_debt, monthly_income)
+        if laps:
+            laps.lap("debt")
+
+        # --- Tax Calculation ---
+        deductions = a["deduction_rate"] * annual_income
+        taxable_income = calc.compute_taxable_income(annual_income, deductions)
+        tax = calc.calculate_tax_liability(taxable_income)
+        if laps:
+            laps.lap("tax")
+
+        # --- Savings ---
+        savings = calc.compute_savings(annual_income, total_expense, annual_debt, tax)
+
+        # --- Investment Growth ---
+        total_investment = calc.project_investment_growth(total_investment, a["annual_contribution"], a["investment_return"])
+
+        # --- Asset Valuation ---
+        total_asset_value = calc.appreciate_asset(total_asset_value, a["asset_appreciation"])
+        if laps:
+            laps.lap("investment")
+
+        # --- Life Events ---
+        events = []
+        earmarked = fixed_cost = unexpected_cost = 0.0
+        for event in schedule.pop_due(sim_year):
+            if event.deferrable:
+                marriage_info = analysis.handle_marriage_event(annual_income, reserved_investments, emergency_fund)
+                if marriage_info["delayed"]:
+                    schedule.push(sim_year + 1, "marriage", "Postponed Marriage", amount=marriage_info["cost"])
+                    continue
+            cost = event_cost(event, annual_income)
+            if event.kind == "marriage":
+                earmarked += cost
+            elif event.kind == "unexpected":
+                unexpected_cost += cost
+                schedule.push(sim_year + a["unexpected_expense_interval"], "unexpected", event.name, income_share=event.income_share)
+            else:
+                fixed_cost += cost
+            events.append((event.name, cost))
+            if calc.trace.level >= TRACE_SUMMARY:
+                calc.trace.record("life_event", "{name} in year {sim_year} costs {output:.2f}", cost, name=event.name, sim_year=sim_year)
+        event_costs = earmarked + (fixed_cost + unexpected_cost)
+        if a["apply_event_costs"] and events:
+            balances = pay_event_costs(earmarked, fixed_cost + unexpected_cost, reserved_investments, savings, emergency_fund, total_investment)
+            reserved_investments, savings, emergency_fund, total_investment = (float(value) for value in balances)
+        if laps:
+            laps.lap("events")
+
+        # --- Corpus Calculation ---
+        corpus = calc.calculate_corpus(savings, total_investment, total_asset_value, total_liabilities)
+        calc.trace_cashflow(annual_income, total_expense, emergency_fund, annual_debt, total_investment)
+
+        row = {
+            "Year": current_year + sim_year,
+            "Age": current_age_sim,
+            "Income": round(annual_income, 2),
+            "Total Expenses": round(total_expense, 2),
+            "Emergency Fund": round(emergency_fund, 2),
+            "Debt (Annual EMI)": round(annual_debt, 2),
+            "Liabilities": round(total_liabilities, 2),
+            "DTI (%)": round(dti * 100, 2),
+            "Tax": round(tax, 2),
+            "Event Costs": round(event_costs, 2),
+            "Savings": round(savings, 2),
+            "Investment Value": round(total_investment, 2),
+            "Asset Value": round(total_asset_value, 2),
+            "Life Events": "; ".join(render_event(name, cost) for name, cost in events) if events else "—",
+            "Corpus": round(corpus, 2),
+            "Notes": " | ".join(year_notes)
+        }
+        if laps:
+            laps.lap("corpus")
+        yield row
+
+        current_age_sim += 1
+    if laps:
+        laps.observe()
+        METRICS.count("projections")
+        METRICS.count("projection_years", max(years_to_simulate - first_year, 0))
+
+# -----------------------------------------------------------------------------
+# VECTORIZED PROJECTION ENGINE
+# -----------------------------------------------------------------------------
+def property_value(all_inputs):
+    md = all_inputs.get("assets_liabilities_investments", {}).get("mortgage_details")
+    return md.get("market_value", 0) if md else 0
+
+def profile_from_inputs(all_inputs):
+    """Flatten an all_inputs dict into the scalar fields the vectorized engine uses."""
+    pers = all_inputs.get("personal_information", {})
+    career = all_inputs.get("career_income_details", {})
+    assets_data = all_inputs.get("assets_liabilities_investments", {})
+    sim_params = all_inputs.get("simulation_parameters", {})
+    bonus = career.get("bonus", {})
+    conv_dict = {"annual": 12, "quarterly": 3, "monthly": 1}
+    liab_list = assets_data.get("liabilities", [])
+    marriage_age = pers.get("age_of_marriage", 1000)
+    return {
+        "starting_age": sim_params.get("starting_age", 30),
+        "years_to_simulate": sim_params.get("years_to_simulate", 35),
+        "monthly_salary": career.get("monthly_salary", 0),
+        "monthly_income": career.get("monthly_salary", 0) + bonus.get("amount", 0) / conv_dict.get(bonus.get("frequency", "annual"), 12),
+        "housing_status": assets_data.get("housing_status", "Rented"),
+        "city_cost_factor": pers.get("city_cost_factor", 1.0),
+        "emergency_fund": all_inputs.get("emergency_fund", 500000),
+        "reserved_investments": all_inputs.get("reserved_investments", 1000000),
+        "total_investment": sum(item.get("current_value", 0) for item in assets_data.get("investments", [])),
+        "total_asset_value": sum(item.get("asset_value", 0) for item in assets_data.get("other_assets", [])),
+        "total_liabilities": sum(item.get("amount", 0) for item in liab_list),
+        "monthly_debt": sum([l.get("min_payment", l.get("amount", 0) / l.get("remaining_term", 1)) for l in liab_list]),
+        "property_value": property_value(all_inputs),
+        "loans": loans_from_inputs(all_inputs),
+        "age_of_marriage": np.nan if marriage_age is None else marriage_age,
+        "children_birth_years": [child.get("age_at_birth", 0) + 1 for child in pers.get("children", [])],
+        "custom_events": custom_events_from_inputs(all_inputs),
+    }
+
+# Ragged per-profile fields, kept as object columns in batch tables
+OBJECT_PROFILE_FIELDS = ("housing_status", "children_birth_years", "loans", "custom_events")
+
+RATE_KEYS = ("income_growth", "inflation", "investment_return", "asset_appreciation")
+
+def _rate(assumptions, key, shape):
+    return np.broadcast_to(np.asarray(assumptions[key], dtype=float), shape)
+
+def price_index(inflation):
+    """
+    Cumulative level of each year relative to the first (which is 1), along the
+    last axis: the price level for inflation, the wage level for income growth.
+    """
+    index = np.ones(inflation.shape)
+    np.cumprod(1 + inflation[..., :-1], axis=-1, out=index[..., 1:])
+    return index
+
+def project_profile_arrays(profiles, years, assumptions=None):
+    """
+    Compute the projection for N profiles at once.
+    profiles maps each numeric field of profile_from_inputs to an array of length N;
+    returns a dict of (N, years) arrays keyed by the projection row field names, plus
+    "Emergency Fund Added", "Marriage Cost" and "Investment Debits" (event costs paid
+    from investments).
+    A single profile with (P, years) rate arrays yields one row per rate path.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    col = lambda name: np.asarray(profiles[name], dtype=float).reshape(-1, 1)
+    monthly_income = col("monthly_income")
+    shape = np.broadcast_shapes((monthly_income.shape[0], years), *(np.shape(a[key]) for key in RATE_KEYS))
+    t = np.arange(years)
+
+    # --- Income & Expense (grown by each year's rate on top of the level reached so far) ---
+    growth, inflation = _rate(a, "income_growth", shape), _rate(a, "inflation", shape)
+    annual_income = ((monthly_income * 12) * price_index(growth)) * (1 + growth)
+    housing = np.char.lower(np.asarray(profiles["housing_status"], dtype=str)).reshape(-1, 1)
+    base_expense = np.where(housing == "rented", a["baseline_rent"],
+                            np.where(housing == "owned", a["baseline_expense"] * (1 - a["owned_discount"]), a["baseline_expense"]))
+    total_expense = (((base_expense * col("city_cost_factor")) * price_index(inflation)) * (1 + inflation)) * 12
+
+    # --- Emergency Fund contributions (applied below while under the target) ---
+    surplus = annual_income - total_expense
+    added = np.where(surplus > 0, surplus * a["emergency_allocation"], 0.0)
+
+    # --- Debt, Tax & Savings ---
+    if a["amortize_liabilities"]:
+        if "annual_debt" in profiles:
+            debt = {"payment": np.asarray(profiles["annual_debt"]), "balance": np.asarray(profiles["liabilities"])}
+        else:
+            debt = profile_debt_schedule(profiles["loans"], years)
+        annual_debt = np.broadcast_to(debt["payment"], shape)
+        liabilities = np.broadcast_to(debt["balance"], shape)
+        dti = np.divide(annual_debt / 12, monthly_income, out=np.zeros(shape), where=monthly_income != 0)
+        asset_start = col("total_asset_value") + col("property_value")
+    else:
+        monthly_debt = col("monthly_debt")
+        annual_debt = np.broadcast_to(monthly_debt * 12, shape)
+        liabilities = np.broadcast_to(col("total_liabilities"), shape)
+        dti = np.broadcast_to(np.divide(monthly_debt, monthly_income, out=np.zeros_like(monthly_income), where=monthly_income != 0), shape)
+        asset_start = col("total_asset_value")
+    taxable_income = annual_income - a["deduction_rate"] * annual_income
+    tax = get_tax_schedule(a["tax_regime"]).tax_array(taxable_income)
+    savings = annual_income - (total_expense + annual_debt + tax)
+
+    # --- Life Event costs: children and custom events are fixed, unexpected ones a share of income ---
+    if "event_costs" in profiles:
+        fixed_costs = np.asarray(profiles["event_costs"])
+    else:
+        fixed_costs = profile_event_costs(profiles["children_birth_years"], profiles["custom_events"], years)
+    interval = a["unexpected_expense_interval"]
+    recurring = (t % interval == 0) if interval > 0 else np.zeros(years, dtype=bool)
+    unexpected = np.where(recurring, np.maximum(0.0, a["unexpected_expense_rate"] * annual_income), 0.0)
+    other_costs = (np.broadcast_to(fixed_costs, shape) + unexpected).T
+    salary = col("monthly_salary")
+    salary_dti = np.divide(col("monthly_debt"), salary, out=np.zeros_like(salary), where=salary != 0)
+    wedding_year = marriage_year(col("age_of_marriage"), col("starting_age"))
+
+    # --- Emergency Fund, Investments, Assets & Events (stepped year by year across all profiles, as in the loop engine) ---
+    rows = shape[0]
+    per_row = lambda values: np.broadcast_to(values, (rows, 1))[:, 0]
+    emergency = per_row(col("emergency_fund"))
+    investment = per_row(col("total_investment"))
+    asset_value = per_row(asset_start)
+    reserved = per_row(col("reserved_investments"))
+    salary_dti = per_row(salary_dti)
+    wedding_year = per_row(wedding_year)
+    wedding_paid_year = np.full(rows, -1)
+    wedding_cost = np.zeros(rows)
+    returns = _rate(a, "investment_return", shape).T
+    appreciation = _rate(a, "asset_appreciation", shape).T
+    income_by_year, surplus_by_year, added_by_year = annual_income.T, surplus.T, added.T
+    savings = np.array(savings.T)
+    out = {name: np.empty((years, rows)) for name in ("Emergency Fund", "Emergency Fund Added", "Investment Value",
+                                                      "Asset Value", "Event Costs", "Marriage Cost", "Investment Debits")}
+    for year in range(years):
+        ef_added = np.where((surplus_by_year[year] > 0) & (emergency < a["emergency_target"]), added_by_year[year], 0.0)
+        emergency = emergency + ef_added
+        investment = investment + a["annual_contribution"] + investment * returns[year]
+        asset_value = asset_value * (1 + appreciation[year])
+        deciding = wedding_year == year
+        if deciding.any():
+            cost = np.maximum(MARRIAGE_INCOME_MULTIPLE * income_by_year[year], MARRIAGE_MIN_COST)
+            delayed = marriage_delayed(cost, reserved, emergency, salary_dti)
+            wedding_cost = np.where(deciding, cost, wedding_cost)
+            wedding_paid_year = np.where(deciding, year + delayed, wedding_paid_year)
+        marriage = np.where(wedding_paid_year == year, wedding_cost, 0.0)
+        out["Investment Debits"][year] = investment
+        if a["apply_event_costs"]:
+            reserved, savings[year], emergency, investment = pay_event_costs(marriage, other_costs[year], reserved,
+                                                                              savings[year], emergency, investment)
+        out["Investment Debits"][year] -= investment
+        out["Emergency Fund"][year] = emergency
+        out["Emergency Fund Added"][year] = ef_added
+        out["Investment Value"][year] = investment
+        out["Asset Value"][year] = asset_value
+        out["Event Costs"][year] = marriage + other_costs[year]
+        out["Marriage Cost"][year] = marriage
+    out = {name: values.T for name, values in out.items()}
+    savings = savings.T
+    total_investment, total_asset_value = out["Investment Value"], out["Asset Value"]
+
+    corpus = savings + total_investment + total_asset_value - liabilities
+    return {
+        "Year": np.broadcast_to(a["start_year"] + t, shape),
+        "Age": col("starting_age").astype(int) + t,
+        "Income": annual_income,
+        "Total Expenses": total_expense,
+        "Emergency Fund": out["Emergency Fund"],
+        "Emergency Fund Added": out["Emergency Fund Added"],
+        "Debt (Annual EMI)": annual_debt,
+        "Liabilities": liabilities,
+        "DTI (%)": dti * 100,
+        "Tax": tax,
+        "Event Costs": out["Event Costs"],
+        "Marriage Cost": out["Marriage Cost"],
+        "Investment Debits": out["Investment Debits"],
+        "Savings": savings,
+        "Investment Value": total_investment,
+        "Asset Value": total_asset_value,
+        "Corpus": corpus,
+    }
+
+def marriage_delayed(cost, reserved_investments, emergency_fund, salary_dti):
+    # Mirrors the funding and delay rules of AssumptionsAnalysis.handle_marriage_event
+    shortfall = (cost > 200000) & (reserved_investments < cost)
+    funded = (cost > 200000) & ~shortfall
+    emergency_fund = np.where(shortfall, emergency_fund - (cost - reserved_investments), emergency_fund)
+    reserved_investments = np.where(funded, reserved_investments - cost, reserved_investments)
+    return (salary_dti > 0.4) | (reserved_investments + emergency_fund < cost)
+
+def vectorized_yearly_projection(all_inputs, assumptions=None):
+    """Array-based equivalent of simulate_yearly_projection returning the same rows."""
+    profile = profile_from_inputs(all_inputs)
+    return simulate_batch_projection({k: [v] for k, v in profile.items()}, assumptions).rows(0)
+
+# -----------------------------------------------------------------------------
+# BATCH SIMULATION
+# -----------------------------------------------------------------------------
+PROFILE_DEFAULTS = profile_from_inputs({})
+NUMERIC_PROFILE_FIELDS = [k for k in PROFILE_DEFAULTS if k not in OBJECT_PROFILE_FIELDS]
+
+def profiles_table(inputs_list):
+    """Build the columnar profile table (one row per client) from all_inputs dicts."""
+    import pandas as pd
+    return pd.DataFrame([profile_from_inputs(inputs) for inputs in inputs_list])
+
+class BatchProjection:
+    """
+    Projection of N profiles over the longest horizon in the batch.
+    Each field is an (N, years) array; cells past a profile's own horizon are
+    outside `mask` (NaN for float fields).
+    """
+    def __init__(self, profiles, arrays, assumptions, index=None):
+        self.profiles = profiles
+        self.arrays = arrays
+        self.assumptions = assumptions
+        self.horizon = np.maximum(profiles["years_to_simulate"].astype(int), 0)
+        self.years = arrays["Year"].shape[1]
+        self.mask = np.arange(self.years) < self.horizon[:, None]
+        self.index = np.arange(len(self.horizon)) if index is None else np.asarray(index)
+        for name, values in arrays.items():
+            if values.dtype.kind == "f":
+                arrays[name] = np.where(self.mask, values, np.nan)
+
+    def __len__(self):
+        return len(self.horizon)
+
+    def __getitem__(self, field):
+        return self.arrays[field]
+
+    def life_events(self, i):
+        """Render the 'Life Events' strings of profile i, one per simulated year (in schedule order)."""
+        a = self.assumptions
+        p = {k: v[i] for k, v in self.profiles.items()}
+        nominal_wedding = int(marriage_year(p["age_of_marriage"], p["starting_age"]))
+        children, custom = {}, {}
+        for c, year in enumerate(p.get("children_birth_years") or []):
+            children.setdefault(year, []).append((f"Child_{c+1}_Expense", CHILD_EXPENSE))
+        for event in p.get("custom_events") or []:
+            custom.setdefault(event["year"], []).append((event["name"], event["cost"]))
+        interval = a["unexpected_expense_interval"]
+        rendered = []
+        for t in range(self.horizon[i]):
+            events = []
+            wedding = self.arrays["Marriage Cost"][i, t]
+            if wedding > 0:
+                events.append(("Marriage" if t == nominal_wedding else "Postponed Marriage", wedding))
+            events.extend(children.get(t, ()))
+            if interval > 0 and t % interval == 0:
+                events.append(("Unexpected Expense", max(0.0, a["unexpected_expense_rate"] * self.arrays["Income"][i, t])))
+            events.extend(custom.get(t, ()))
+            rendered.append("; ".join(render_event(name, cost) for name, cost in events) if events else "—")
+        return rendered
+
+    def notes(self, i):
+        """Render the 'Notes' strings of profile i."""
+        return [f"Emergency fund increased by {added:.2f}" if added else "" for added in self.arrays["Emergency Fund Added"][i, :self.horizon[i]].tolist()]
+
+    def result(self, i):
+        """ProjectionResult of profile i; its float columns are views into the batch arrays."""
+        n = self.horizon[i]
+        columns = {name: self.arrays[name][i, :n] for name in PROJECTION_FIELDS if name in self.arrays}
+        return ProjectionResult(columns, text=lambda: {"Life Events": self.life_events(i), "Notes": self.notes(i)})
+
+    def rows(self, i):
+        """Projection rows of profile i, in the format of simulate_yearly_projection."""
+        return self.result(i).rows()
+
+    def to_frame(self, with_events=False):
+        """Long-format DataFrame with one row per (profile, year) inside each horizon."""
+        import pandas as pd
+        profile_idx, year_idx = np.nonzero(self.mask)
+        frame = {"Profile": self.index[profile_idx]}
+        for name in PROJECTION_FIELDS:
+            if name in self.arrays:
+                frame[name] = self.arrays[name][profile_idx, year_idx]
+        df = pd.DataFrame(frame)
+        if with_events:
+            df["Life Events"] = [event for i in range(len(self)) for event in self.life_events(i)]
+        return df
+
+PROJECTION_FIELDS = ["Year", "Age", "Income", "Total Expenses", "Emergency Fund", "Debt (Annual EMI)", "Liabilities", "DTI (%)", "Tax",
+                     "Event Costs", "Savings", "Investment Value", "Asset Value", "Life Events", "Corpus", "Notes"]
+
+class ProjectionResult:
+    """
+    One projection as a struct of arrays: a typed array per metric (int16 Year
+    and Age, float64 amounts) and the text columns, which may be rendered lazily
+    by the `text` callable. Amounts are kept unrounded; rows() and the display
+    helpers round and format them at the UI boundary.
+    """
+    __slots__ = ("columns", "_text", "_frame")
+    INT_FIELDS = ("Year", "Age")
+    TEXT_FIELDS = ("Life Events", "Notes")
+
+    def __init__(self, columns, text=None):
+        self.columns = {name: values if name in self.TEXT_FIELDS else np.asarray(values, dtype=np.int16 if name in self.INT_FIELDS else None)
+                        for name, values in columns.items()}
+        self._text = text
+        self._frame = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Column-wise container for a list of projection row dicts."""
+        fields = list(rows[0]) if rows else PROJECTION_FIELDS
+        columns = {}
+        for name in fields:
+            values = [row[name] for row in rows]
+            columns[name] = values if name in cls.TEXT_FIELDS else np.array(values, dtype=np.int16 if name in cls.INT_FIELDS else float)
+        return cls(columns)
+
+    def _render_text(self):
+        if self._text is not None:
+            self.columns.update(self._text())
+            self._text = None
+
+    def __len__(self):
+        return len(self.columns["Year"]) if "Year" in self.columns else 0
+
+    def __getitem__(self, field):
+        if field not in self.columns:
+            self._render_text()
+        return self.columns[field]
+
+    @property
+    def fields(self):
+        return [name for name in PROJECTION_FIELDS if name in self.columns or (self._text and name in self.TEXT_FIELDS)]
+
+    def frame(self, fields=None):
+        """
+        DataFrame over the column arrays without copying them. The full frame is
+        built once and reused; pass fields for a narrower one.
+        """
+        import pandas as pd
+        if fields is not None:
+            return pd.DataFrame({name: self[name] for name in fields}, copy=False)
+        if self._frame is None:
+            with METRICS.stage("frame"):
+                self._frame = pd.DataFrame({name: self[name] for name in self.fields}, copy=False)
+        return self._frame
+
+    def rows(self):
+        """Row dicts in the format of simulate_yearly_projection (amounts rounded to 2 decimals)."""
+        columns = {}
+        for name in self.fields:
+            values = self[name]
+            if name in self.TEXT_FIELDS:
+                columns[name] = list(values)
+            else:
+                columns[name] = np.round(values, 2).tolist() if values.dtype.kind == "f" else values.tolist()
+        return [{name: columns[name][t] for name in columns} for t in range(len(self))]
+
+    def __getstate__(self):
+        # Float columns travel as one stacked matrix, which pickles far smaller than separate arrays
+        self._render_text()
+        floats = [name for name, values in self.columns.items() if name not in self.TEXT_FIELDS and values.dtype.kind == "f"]
+        packed = np.stack([self.columns[name] for name in floats]) if floats else None
+        return floats, packed, {name: values for name, values in self.columns.items() if name not in floats}
+
+    def __setstate__(self, state):
+        floats, packed, rest = state
+        self.columns = dict(zip(floats, packed)) if floats else {}
+        self.columns.update(rest)
+        self._text = None
+        self._frame = None
+
+def projection_frame(projection):
+    """DataFrame for a ProjectionResult, a list of row dicts or a DataFrame."""
+    import pandas as pd
+    if isinstance(projection, ProjectionResult):
+        return projection.frame()
+    if isinstance(projection, pd.DataFrame):
+        return projection
+    return pd.DataFrame(projection)
+
+def _profile_column(profiles, name, n):
+    if name in profiles:
+        values = profiles[name]
+        values = values.tolist() if hasattr(values, "tolist") else list(values)
+    else:
+        values = [PROFILE_DEFAULTS[name]] * n
+    if name in OBJECT_PROFILE_FIELDS:
+        return np.fromiter(values, dtype=object, count=n)
+    return np.asarray(values, dtype=float if name == "age_of_marriage" else None)
+
+@timed("batch_projection")
+def simulate_batch_projection(profiles, assumptions=None):
+    """
+    Project every profile of a columnar table (DataFrame or dict of columns named as
+    in profile_from_inputs) in one vectorized pass. Missing columns take the defaults
+    simulate_yearly_projection would use for an empty input.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    n = len(profiles[next(iter(profiles.keys()))])
+    columns = {name: _profile_column(profiles, name, n) for name in PROFILE_DEFAULTS}
+    years = int(max(columns["years_to_simulate"].max(initial=0), 0))
+    arrays = project_profile_arrays(columns, years, a)
+    METRICS.count("batch_profiles", n)
+    return BatchProjection(columns, arrays, a, index=getattr(profiles, "index", None))
+
+# -----------------------------------------------------------------------------
+# MONTE CARLO SIMULATION
+# -----------------------------------------------------------------------------
+MONTE_CARLO_FACTORS = ["investment_return", "inflation", "income_growth"]
+DEFAULT_VOLATILITY = {"investment_return": 0.15, "inflation": 0.02, "income_growth": 0.03}
+
+def draw_rate_paths(rng, n_paths, years, distributions, correlation=None, factors=MONTE_CARLO_FACTORS):
+    """
+    Draw (n_paths, years) rate arrays for each factor (MONTE_CARLO_FACTORS by default).
+    distributions maps a factor to {"dist": "normal" | "lognormal" | "fixed", "mean", "std"};
+    correlation is a factor-by-factor matrix applied to the underlying normal draws.
+    """
+    z = rng.standard_normal((n_paths, years, len(factors)))
+    if correlation is not None:
+        z = z @ np.linalg.cholesky(np.asarray(correlation, dtype=float)).T
+    rates = {}
+    for j, factor in enumerate(factors):
+        spec = distributions[factor]
+        mean, std = spec["mean"], spec.get("std", 0.0)
+        if spec.get("dist", "normal") == "fixed":
+            rates[factor] = np.full((n_paths, years), float(mean))
+            continue
+        if spec.get("dist", "normal") == "lognormal":
+            sigma = np.sqrt(np.log(1 + (std / (1 + mean)) ** 2))
+            r = np.exp(np.log(1 + mean) - sigma ** 2 / 2 + sigma * z[:, :, j]) - 1
+        else:
+            r = mean + std * z[:, :, j]
+        # A rate of -100% or worse would wipe out the balance and break the growth recurrence
+        rates[factor] = np.maximum(r, -0.99)
+    return rates
+
+MONTE_CARLO_BLOCK = 256  # paths drawn from each random stream
+
+def monte_carlo_streams(seed, n_paths):
+    """
+    One child SeedSequence per block of MONTE_CARLO_BLOCK paths. Every engine draws
+    a block from its own stream, so results depend on the seed alone, not on how
+    paths are chunked or spread over workers.
+    """
+    return np.random.SeedSequence(seed).spawn(-(-n_paths // MONTE_CARLO_BLOCK))
+
+def _block_chunk_size(chunk_size):
+    # Chunks hold whole blocks, so no block's draws are split between chunks
+    return max(chunk_size // MONTE_CARLO_BLOCK, 1) * MONTE_CARLO_BLOCK
+
+def draw_path_blocks(streams, start, stop, years, distributions, correlation=None):
+    """Rate paths start:stop (start on a block boundary) drawn block by block from their streams."""
+    blocks = [draw_rate_paths(np.random.default_rng(streams[b]), min(lo + MONTE_CARLO_BLOCK, stop) - lo,
+                              years, distributions, correlation)
+              for b, lo in enumerate(range(start, stop, MONTE_CARLO_BLOCK), start // MONTE_CARLO_BLOCK)]
+    return {factor: np.concatenate([block[factor] for block in blocks]) for factor in MONTE_CARLO_FACTORS}
+
+def monte_carlo_distributions(assumptions, distributions=None):
+    dists = {}
+    for factor in MONTE_CARLO_FACTORS:
+        dists[factor] = {"dist": "normal", "mean": assumptions[factor], "std": DEFAULT_VOLATILITY[factor]}
+        dists[factor].update((distributions or {}).get(factor, {}))
+    return dists
+
+def summarize_monte_carlo(corpus, assumptions, starting_age, percentiles=(5, 25, 50, 75, 95), shortfall_threshold=0.0):
+    """Percentile bands and shortfall probabilities of an (n_paths, years) Corpus matrix."""
+    n_paths, years = corpus.shape
+    short = corpus < shortfall_threshold
+    return {
+        "Year": (assumptions["start_year"] + np.arange(years)).tolist(),
+        "Age": (starting_age + np.arange(years)).tolist(),
+        "paths": n_paths,
+        "percentiles": {p: band for p, band in zip(percentiles, np.percentile(corpus, percentiles, axis=0))} if years and n_paths else {},
+        "shortfall_probability_by_year": short.mean(axis=0) if n_paths else np.zeros(years),
+        "probability_short": float(short.any(axis=1).mean()) if n_paths else 0.0,
+    }
+
+def _monte_carlo_columns(profile, years):
+    # One-row columns for project_profile_arrays; ragged event fields are summed into fixed costs once
+    columns = {k: [v] for k, v in profile.items() if k not in ("children_birth_years", "custom_events")}
+    columns["event_costs"] = profile_event_costs([profile["children_birth_years"]], [profile["custom_events"]], years)
+    return columns
+
+@timed("monte_carlo")
+def simulate_monte_carlo(all_inputs, n_paths=10000, distributions=None, correlation=None, seed=None,
+                         assumptions=None, percentiles=(5, 25, 50, 75, 95), shortfall_threshold=0.0, chunk_size=20000):
+    """
+    Run n_paths stochastic projections of one profile and summarize the Corpus.
+    Factor means default to the assumption set, so scenario rates carry over.
+    Paths are drawn from monte_carlo_streams and projected in chunks of whole blocks, so
+    results do not depend on chunk_size and match parallel_monte_carlo for the same seed.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    dists = monte_carlo_distributions(a, distributions)
+    profile = profile_from_inputs(all_inputs)
+    years = max(int(profile["years_to_simulate"]), 0)
+    profile_cols = _monte_carlo_columns(profile, years)
+    streams = monte_carlo_streams(seed, n_paths)
+    chunk_size = _block_chunk_size(chunk_size)
+    corpus = np.empty((n_paths, years))
+    for start in range(0, n_paths, chunk_size):
+        stop = min(start + chunk_size, n_paths)
+        rates = draw_path_blocks(streams, start, stop, years, dists, correlation)
+        corpus[start:stop] = project_profile_arrays(profile_cols, years, dict(a, **rates))["Corpus"]
+    METRICS.count("monte_carlo_paths", n_paths)
+    return summarize_monte_carlo(corpus, a, profile["starting_age"], percentiles, shortfall_threshold)
+
+def monte_carlo_bands_frame(result):
+    import pandas as pd
+    return pd.DataFrame({"Year": result["Year"], "Age": result["Age"],
+                         **{f"P{p}": band for p, band in result["percentiles"].items()}})
+
+# -----------------------------------------------------------------------------
+# HOUSEHOLD PORTFOLIO
+# -----------------------------------------------------------------------------
+# Tracks each holding separately under its asset class instead of one
+# total_investment at a flat return. The strategy's target allocation steers new
+# money and the periodic rebalancing. The spouse's savings and the dependents'
+# costs flow into the portfolio alongside the base projection's contribution and
+# event-cost debits. Holdings of all households (and all return paths) are
+# (paths, households, holdings) arrays stepped year by year, so dozens of
+# holdings cost no more Python than one. Income, tax and expenses follow the
+# same rules as the projection engines: the spouse's and other income compound
+# with income_growth and the dependents' costs with inflation. With a single
+# asset class at investment_return and no spouse or dependents, the portfolio
+# value equals the projection's Investment Value while that stays positive.
+# Holdings cannot go negative: withdrawals they cannot cover are reported as
+# Shortfall and deducted from the Household Corpus.
+PORTFOLIO_DEFAULTS = {
+    # Arithmetic mean return and volatility per asset class
+    "asset_classes": {
+        "equity": {"mean": 0.12, "std": 0.18},
+        "debt": {"mean": 0.07, "std": 0.03},
+        "gold": {"mean": 0.08, "std": 0.15},
+        "real_estate": {"mean": 0.08, "std": 0.10},
+        "crypto": {"mean": 0.20, "std": 0.70},
+        "cash": {"mean": 0.04, "std": 0.01},
+    },
+    # Asset class of each investment_type offered by the input form
+    "investment_classes": {"stocks": "equity", "mutual funds": "equity", "crypto": "crypto", "fixed deposits": "debt",
+                           "bonds": "debt", "forex": "cash", "gold": "gold", "real estate": "real_estate", "others": "debt"},
+    # Target weights per investment_strategy; classes left out are sold down at rebalancing
+    "strategy_allocations": {
+        "Conservative": {"equity": 0.30, "debt": 0.55, "gold": 0.10, "cash": 0.05},
+        "Moderate": {"equity": 0.55, "debt": 0.30, "gold": 0.10, "real_estate": 0.05},
+        "Aggressive": {"equity": 0.75, "debt": 0.10, "gold": 0.05, "real_estate": 0.05, "crypto": 0.05},
+    },
+    "investment_strategy": "Moderate",
+    # Rebalance to the targets every this many years; 0 only steers new money
+    "rebalance_interval": 1,
+    # Share of the spouse's after-tax income and of other household income that is invested
+    "spouse_savings_rate": 0.5,
+    # Annual cost of a dependent by relationship while younger than until_age
+    "dependent_costs": {
+        "Parent": {"annual_cost": 120000, "until_age": 90},
+        "Child": {"annual_cost": 150000, "until_age": 22},
+        "Sibling": {"annual_cost": 60000, "until_age": 22},
+        "Pet": {"annual_cost": 30000, "until_age": 15},
+    },
+}
+
+def portfolio_assumptions(assumptions=None):
+    return {**DEFAULT_ASSUMPTIONS, **PORTFOLIO_DEFAULTS, **(assumptions or {})}
+
+def household_from_inputs(all_inputs, assumptions=None):
+    """
+    Holdings, strategy, spouse and dependents of one all_inputs dict. The spouse
+    comes from personal_information["spouse"] ({age, monthly_income,
+    retirement_age}) or, failing that, a "Spouse Contribution" income source;
+    other additional income sources count as other household income.
+    """
+    a = portfolio_assumptions(assumptions)
+    pers = all_inputs.get("personal_information", {})
+    investments = all_inputs.get("assets_liabilities_investments", {}).get("investments", [])
+    classes = a["investment_classes"]
+    holdings = []
+    for i, item in enumerate(investments):
+        kind = item.get("investment_type", "others")
+        if classes.get(kind, kind) not in a["asset_classes"]:
+            raise ValueError(f"Investment type '{kind}' has no asset class.")
+        holdings.append((item.get("name", f"{kind.title()} {i+1}"), classes.get(kind, kind), item.get("current_value", 0)))
+    sources = pers.get("additional_income_sources", [])
+    spouse_contribution = sum(src.get("amount", 0) for src in sources if src.get("source") == "Spouse Contribution")
+    age = all_inputs.get("simulation_parameters", {}).get("starting_age", pers.get("age", 30))
+    retirement_age = all_inputs.get("retirement_investment_strategy", {}).get("retirement_age", age + 35)
+    spouse = pers.get("spouse")
+    if spouse is None and spouse_contribution:
+        spouse = {"monthly_income": spouse_contribution}
+    if spouse is not None:
+        spouse = {"age": spouse.get("age", age), "monthly_income": spouse.get("monthly_income", 0),
+                  "retirement_age": spouse.get("retirement_age", retirement_age)}
+    strategy = all_inputs.get("retirement_investment_strategy", {}).get("investment_strategy", a["investment_strategy"])
+    if strategy not in a["strategy_allocations"]:
+        raise ValueError(f"Unknown investment strategy: {strategy}")
+    return {
+        "holdings": holdings,
+        "strategy": strategy,
+        "spouse": spouse,
+        "dependents": [(dep.get("relationship", "Parent"), dep.get("age", 0)) for dep in pers.get("dependents", [])],
+        "other_income": sum(src.get("amount", 0) for src in sources if src.get("source") != "Spouse Contribution"),
+    }
+
+def withdraw_pro_rata(holdings, amount):
+    """
+    rebalance_funds generalized to any number of holdings: take `amount` (per
+    leading index) from every holding in proportion to its value. Where the
+    holdings fall short they are emptied; returns (holdings, unmet amount).
+    """
+    total = holdings.sum(axis=-1)
+    taken = np.minimum(np.maximum(amount, 0.0), np.maximum(total, 0.0))
+    keep = 1 - np.divide(taken, total, out=np.zeros_like(total), where=total > 0)
+    return holdings * keep[..., None], np.maximum(amount, 0.0) - taken
+
+def rebalance_holdings(holdings, holding_class, class_slots, weights):
+    """
+    Move every household to its target class weights (households, classes).
+    Holdings within a class keep their relative sizes; a target class with no
+    holdings is funded through its slot (class_slots[c] is that holding's index).
+    """
+    onehot = holding_class[..., None] == np.arange(weights.shape[-1])
+    class_totals = np.einsum("...nk,nkc->...nc", holdings, onehot.astype(float))
+    target = holdings.sum(axis=-1)[..., None] * weights
+    factor = np.divide(target, class_totals, out=np.zeros_like(target), where=class_totals > 0)
+    holdings = holdings * np.take_along_axis(factor, np.broadcast_to(holding_class, holdings.shape), axis=-1)
+    holdings[..., class_slots] += np.where(class_totals > 0, 0.0, target)
+    return holdings
+
+@timed("portfolio")
+def simulate_household_portfolio(inputs_list, assumptions=None, n_paths=None, seed=None, correlation=None):
+    """
+    Project the portfolio of each household in inputs_list. Without n_paths
+    every class earns its mean return (one path); with n_paths the class
+    returns are drawn (lognormal, optionally correlated across classes in the
+    order of asset_classes) and shared by all households on a path.
+
+    Returns a dict: "classes", "holdings" (names per household), "Year"/"Age"
+    (households, years), "Class Values" (paths, households, years, classes),
+    "Portfolio Value", "Household Corpus" and "Shortfall" (paths, households,
+    years), the path-independent "Contribution", "Spouse Income",
+    "Dependent Costs" and "Other Income" (households, years), and the "base"
+    BatchProjection. Cells past a household's horizon are NaN.
+    """
+    a = portfolio_assumptions(assumptions)
+    households = [household_from_inputs(inputs, a) for inputs in inputs_list]
+    base = simulate_batch_projection(profiles_table(inputs_list), a)
+    classes = list(a["asset_classes"])
+    n, c, years, paths = len(households), len(classes), base.years, n_paths or 1
+    class_index = {name: j for j, name in enumerate(classes)}
+
+    # Holdings padded to the largest household, then one empty slot per class for new money
+    k = max((len(h["holdings"]) for h in households), default=0)
+    values = np.zeros((n, k + c))
+    holding_class = np.tile(np.arange(-k, c) % c, (n, 1))
+    names = []
+    for i, household in enumerate(households):
+        for j, (_, asset_class, value) in enumerate(household["holdings"]):
+            values[i, j] = value
+            holding_class[i, j] = class_index[asset_class]
+        names.append([name for name, _, _ in household["holdings"]])
+    class_slots = np.arange(k, k + c)
+    weights = np.zeros((n, c))
+    for i, household in enumerate(households):
+        for name, weight in a["strategy_allocations"][household["strategy"]].items():
+            weights[i, class_index[name]] = weight
+    weights /= np.maximum(weights.sum(axis=1, keepdims=True), 1e-12)
+
+    # --- Household cash flows, with the projection engines' income, tax and expense rules ---
+    t = np.arange(years)
+    schedule = get_tax_schedule(a["tax_regime"])
+    # Wage and price levels of each year, compounded as for the base projection's income and expenses
+    growth, inflation = _rate(a, "income_growth", (n, years)), _rate(a, "inflation", (n, years))
+    wage_level, price_level = price_index(growth) * (1 + growth), price_index(inflation) * (1 + inflation)
+    spouse_income = np.zeros((n, years))
+    dependent_costs = np.zeros((n, years))
+    other_income = np.array([h["other_income"] for h in households], dtype=float)[:, None] * 12 * wage_level
+    for i, household in enumerate(households):
+        spouse = household["spouse"]
+        if spouse:
+            working = spouse["age"] + t < spouse["retirement_age"]
+            spouse_income[i] = np.where(working, spouse["monthly_income"] * 12 * wage_level[i], 0.0)
+        for relationship, dependent_age in household["dependents"]:
+            cost = a["dependent_costs"].get(relationship)
+            if cost:
+                dependent_costs[i] += np.where(dependent_age + t < cost["until_age"], cost["annual_cost"] * price_level[i], 0.0)
+    spouse_tax = schedule.tax_array(spouse_income * (1 - a["deduction_rate"]))
+    invested = np.nan_to_num(base.arrays["Investment Value"])
+    contribution = (a["annual_contribution"] + a["spouse_savings_rate"] * (spouse_income - spouse_tax + other_income)
+                    - dependent_costs - np.nan_to_num(base.arrays["Investment Debits"]))
+
+    # --- Class returns: means, or drawn paths shared across households ---
+    if n_paths:
+        dists = {name: {"dist": "lognormal", **spec} for name, spec in a["asset_classes"].items()}
+        draws = draw_rate_paths(np.random.default_rng(seed), paths, years, dists, correlation, factors=classes)
+        returns = np.stack([draws[name] for name in classes], axis=-1)
+    else:
+        returns = np.broadcast_to(np.array([a["asset_classes"][name]["mean"] for name in classes]), (1, years, c))
+
+    holdings = np.broadcast_to(values, (paths, n, k + c)).copy()
+    class_values = np.empty((paths, n, years, c))
+    shortfall = np.zeros((paths, n, years))
+    onehot = (holding_class[..., None] == np.arange(c)).astype(float)
+    interval = a["rebalance_interval"]
+    for year in range(years):
+        holdings *= 1 + returns[:, year][:, holding_class]
+        flow = np.broadcast_to(contribution[:, year], (paths, n))
+        holdings[..., class_slots] += np.maximum(flow, 0.0)[..., None] * weights
+        holdings, shortfall[..., year] = withdraw_pro_rata(holdings, -flow)
+        if interval and (year + 1) % interval == 0:
+            holdings = rebalance_holdings(holdings, holding_class, class_slots, weights)
+        class_values[:, :, year] = np.einsum("pnk,nkc->pnc", holdings, onehot)
+
+    portfolio = class_values.sum(axis=-1)
+    outside = ~base.mask
+    corpus = base.arrays["Corpus"] - invested + portfolio - np.cumsum(shortfall, axis=-1)
+    for values_ in (portfolio, corpus, shortfall):
+        values_[:, outside] = np.nan
+    class_values[:, outside] = np.nan
+    cash_flows = {"Contribution": contribution, "Spouse Income": spouse_income, "Dependent Costs": dependent_costs, "Other Income": other_income}
+    for values_ in cash_flows.values():
+        values_[outside] = np.nan
+    return dict({"classes": classes, "holdings": names, "Year": base.arrays["Year"], "Age": base.arrays["Age"],
+                 "Class Values": class_values, "Portfolio Value": portfolio, "Household Corpus": corpus, "Shortfall": shortfall,
+                 "base": base}, **cash_flows)
+
+def asset_class_label(name):
+    return name.replace("_", " ").title()
+
+def portfolio_frame(result, household=0, path=0):
+    """One household's year-by-year portfolio on one path: value per asset class, cash flows and corpus."""
+    import pandas as pd
+    horizon = int(result["base"].horizon[household])
+    frame = pd.DataFrame({"Year": result["Year"][household, :horizon], "Age": result["Age"][household, :horizon]})
+    for j, name in enumerate(result["classes"]):
+        frame[asset_class_label(name)] = result["Class Values"][path, household, :horizon, j]
+    for name in ("Portfolio Value", "Contribution", "Spouse Income", "Dependent Costs", "Other Income", "Household Corpus", "Shortfall"):
+        values = result[name]
+        frame[name] = values[path, household, :horizon] if values.ndim == 3 else values[household, :horizon]
+    return frame
+
+def portfolio_bands(result, household=0, percentiles=(5, 25, 50, 75, 95)):
+    """Household Corpus percentile bands across paths, in the format of simulate_monte_carlo."""
+    horizon = int(result["base"].horizon[household])
+    profile = result["base"].profiles
+    return summarize_monte_carlo(result["Household Corpus"][:, household, :horizon], result["base"].assumptions,
+                                 int(profile["starting_age"][household]), percentiles)
+
+# -----------------------------------------------------------------------------
+# RETIREMENT DECUMULATION
+# -----------------------------------------------------------------------------
+# Carries the Corpus at retirement (the final projection year) on to
+# life_expectancy. Each year's withdrawal is taken at the start of the year and
+# the rest earns investment_return. Withdrawal strategies:
+#   fixed       rate x the corpus at retirement, raised with inflation each year
+#   percentage  rate x the balance at the start of each year
+#   guardrails  fixed, but cut (raised) by guardrail_adjustment whenever the
+#               current withdrawal rate is more than guardrail_band above
+#               (below) rate, after Guyton-Klinger
+#   expenses    the final year's Total Expenses, raised with inflation
+# percentage and guardrails never plan less than spending_floor of the first
+# withdrawal in real terms. A year fails when the balance cannot cover its
+# withdrawal, and every later year then fails too. Balances are
+# (rates, paths) arrays stepped year by year, so every candidate rate of the
+# safe withdrawal rate search runs on the same return paths in one pass. The
+# rate strategies scale with the corpus, so their safe rates do not depend on
+# the corpus level; for fixed withdrawals the largest rate each path sustains
+# has a closed form and the safe rate is a quantile across paths.
+DECUMULATION_DEFAULTS = {
+    "life_expectancy": 85,
+    "withdrawal_strategy": "fixed",
+    "withdrawal_rate": 0.04,
+    "guardrail_band": 0.2,
+    "guardrail_adjustment": 0.1,
+    # Least real withdrawal of the percentage and guardrails strategies, as a share of the first
+    "spending_floor": 0.5,
+    # Share of the final year's Total Expenses still spent in retirement
+    "retirement_expense_ratio": 1.0,
+    # Share of paths that must last to life_expectancy at the safe withdrawal rate
+    "success_target": 0.9,
+}
+WITHDRAWAL_STRATEGIES = ("fixed", "percentage", "guardrails", "expenses")
+
+def decumulation_assumptions(assumptions=None):
+    return {**DEFAULT_ASSUMPTIONS, **DECUMULATION_DEFAULTS, **(assumptions or {})}
+
+def decumulation_paths(corpus, returns, inflation, rate, strategy="fixed", expenses=0.0, assumptions=None, full=True):
+    """
+    Draw down corpus over returns.shape[-1] years. returns and inflation are
+    (paths, years); corpus, rate and expenses broadcast against (paths,), e.g. a
+    (rates, 1) column of candidate rates gives (rates, paths) results.
+
+    Returns "First Failure" (index of the first failed year, years if none) and,
+    with full, "Balance" (start of year), "Withdrawal", "Expenses" and "Failed"
+    per year along a trailing years axis.
+    """
+    a = decumulation_assumptions(assumptions)
+    if strategy not in WITHDRAWAL_STRATEGIES:
+        raise ValueError(f"Unknown withdrawal strategy: {strategy}")
+    years = returns.shape[-1]
+    rate = np.asarray(rate, dtype=float)
+    shape = np.broadcast_shapes(np.shape(corpus), rate.shape, np.shape(expenses), returns.shape[:-1])
+    prices = price_index(inflation)
+    need = np.asarray(expenses, dtype=float)[..., None] * a["retirement_expense_ratio"] * prices
+    # Year-major copies so each step reads contiguous rows
+    growth, indexation, prices_t = np.ascontiguousarray((1 + returns).T), np.ascontiguousarray((1 + inflation).T), prices.T
+    upper, lower = rate * (1 + a["guardrail_band"]), rate * (1 - a["guardrail_band"])
+    cut, raise_ = 1 - a["guardrail_adjustment"], 1 + a["guardrail_adjustment"]
+    # Withdrawals never exceed the balance, so it stays at or above zero once clipped
+    balance = np.maximum(np.broadcast_to(np.asarray(corpus, dtype=float), shape), 0.0)
+    alive = np.ones(shape, dtype=bool)
+    lasted = np.zeros(shape, dtype=int)
+    if full:
+        out = {name: np.empty(shape + (years,)) for name in ("Balance", "Withdrawal")}
+        failed = np.zeros(shape + (years,), dtype=bool)
+    planned = floor = None
+    for t in range(years):
+        if strategy == "percentage":
+            planned = rate * balance
+        elif strategy == "expenses":
+            planned = np.broadcast_to(need[..., t], shape)
+        elif t == 0:
+            planned = rate * balance
+        else:
+            planned = planned * indexation[t - 1]
+            if strategy == "guardrails":
+                # Compares the current withdrawal rate planned / balance with the bands without dividing
+                planned = np.where(planned > upper * balance, planned * cut, np.where(planned < lower * balance, planned * raise_, planned))
+        if t == 0:
+            floor = a["spending_floor"] * planned
+        elif strategy in ("percentage", "guardrails"):
+            planned = np.maximum(planned, floor * prices_t[t])
+        withdrawal = np.minimum(planned, balance)
+        # Relative tolerance so a balance that exactly covers the withdrawal does not fail on rounding
+        failing = withdrawal < planned * (1 - 1e-9)
+        alive &= ~failing
+        lasted += alive
+        if full:
+            out["Balance"][..., t], out["Withdrawal"][..., t], failed[..., t] = balance, withdrawal, failing
+        balance = (balance - withdrawal) * growth[t]
+    result = {"First Failure": lasted}
+    if full:
+        result.update(out, Expenses=np.broadcast_to(need, shape + (years,)), Failed=failed)
+    return result
+
+def fixed_withdrawal_capacity(returns, inflation):
+    """
+    Largest fixed (inflation-indexed) withdrawal rate each path sustains for all
+    of its years: the balance after t years is linear in the rate, and it covers
+    every withdrawal exactly when rate <= 1 / sum(price_s / growth_s) over the
+    years, growth_s being the compounded return before year s.
+    """
+    growth = np.ones(returns.shape)
+    np.cumprod(1 + returns[..., :-1], axis=-1, out=growth[..., 1:])
+    return 1 / (price_index(inflation) / growth).sum(axis=-1)
+
+def retirement_start(all_inputs, assumptions=None, corpus=None):
+    """
+    (retirement age, corpus, annual expenses) at the start of retirement from
+    the final year of the projection; corpus overrides the projected Corpus.
+    """
+    profile = profile_from_inputs(all_inputs)
+    batch = simulate_batch_projection({k: [v] for k, v in profile.items()}, assumptions)
+    horizon = int(batch.horizon[0])
+    if not horizon:
+        raise ValueError("The projection has no years before retirement; no corpus or expenses to start retirement from.")
+    final = corpus if corpus is not None else batch.arrays["Corpus"][0, horizon - 1]
+    return int(profile["starting_age"]) + horizon, float(final), float(batch.arrays["Total Expenses"][0, horizon - 1])
+
+def _decumulation_rates(a, years, n_paths, seed, distributions, correlation):
+    # (paths, years) investment_return and inflation; one path at the means without n_paths
+    dists = monte_carlo_distributions(a, distributions)
+    if n_paths is None:
+        return (np.full((1, years), float(dists["investment_return"]["mean"])),
+                np.full((1, years), float(dists["inflation"]["mean"])))
+    factors = ["investment_return", "inflation"]
+    rates = draw_rate_paths(np.random.default_rng(seed), n_paths, years, dists, correlation, factors=factors)
+    return rates["investment_return"], rates["inflation"]
+
+def _decumulation_setup(all_inputs, assumptions, n_paths, seed, distributions, correlation, corpus):
+    a = decumulation_assumptions(assumptions)
+    retirement_age, corpus, expenses = retirement_start(all_inputs, a, corpus)
+    years = max(int(a["life_expectancy"]) - retirement_age, 0)
+    returns, inflation = _decumulation_rates(a, years, n_paths, seed, distributions, correlation)
+    start_year = a["start_year"] + retirement_age - int(profile_from_inputs(all_inputs)["starting_age"])
+    return dict(a, start_year=start_year), retirement_age, corpus, expenses, returns, inflation
+
+@timed("decumulation")
+def simulate_decumulation(all_inputs, strategy=None, rate=None, n_paths=None, seed=None, distributions=None,
+                          correlation=None, assumptions=None, corpus=None, percentiles=(5, 25, 50, 75, 95)):
+    """
+    Draw down the retirement corpus of one profile to life_expectancy. Without
+    n_paths returns and inflation stay at their means (one path); with n_paths
+    they are drawn as in simulate_monte_carlo.
+
+    Returns the Balance bands in the format of simulate_monte_carlo (shortfall
+    being a failed year so far) plus "success_probability", "depletion_age"
+    (median age of the first failed year, None when most paths last) and the
+    (paths, years) "Balance", "Withdrawal", "Expenses" and "Failed" arrays.
+    """
+    a, retirement_age, corpus, expenses, returns, inflation = _decumulation_setup(
+        all_inputs, assumptions, n_paths, seed, distributions, correlation, corpus)
+    strategy = strategy or a["withdrawal_strategy"]
+    rate = a["withdrawal_rate"] if rate is None else rate
+    paths = decumulation_paths(corpus, returns, inflation, rate, strategy, expenses, a)
+    years = returns.shape[-1]
+    result = summarize_monte_carlo(paths["Balance"], a, retirement_age, percentiles)
+    failed_by = np.cumsum(paths["Failed"], axis=-1) > 0
+    failure_age = np.where(paths["First Failure"] < years, retirement_age + paths["First Failure"], np.inf)
+    median_failure = float(np.median(failure_age)) if len(failure_age) else np.inf
+    METRICS.count("decumulation_paths", len(failure_age))
+    result.update({
+        "shortfall_probability_by_year": failed_by.mean(axis=0),
+        "probability_short": float(failed_by[:, -1].mean()) if years else 0.0,
+        "success_probability": float((paths["First Failure"] == years).mean()),
+        "depletion_age": median_failure if np.isfinite(median_failure) else None,
+        "strategy": strategy, "rate": float(rate), "corpus": corpus, "expenses": expenses,
+        "retirement_age": retirement_age, "life_expectancy": int(a["life_expectancy"]),
+        **{name: paths[name] for name in ("Balance", "Withdrawal", "Expenses", "Failed")},
+    })
+    return result
+
+def decumulation_frame(result):
+    """Per retirement year: median balance, withdrawal and expenses across paths and the share of paths failed so far."""
+    import pandas as pd
+    return pd.DataFrame({"Year": result["Year"], "Age": result["Age"],
+                         "Balance": np.median(result["Balance"], axis=0),
+                         "Withdrawal": np.median(result["Withdrawal"], axis=0),
+                         "Expenses": np.median(result["Expenses"], axis=0),
+                         "Probability Failed": result["shortfall_probability_by_year"]})
+
+@timed("safe_withdrawal_rate")
+def safe_withdrawal_rate(all_inputs, strategy=None, target=None, n_paths=10000, seed=None, distributions=None,
+                         correlation=None, assumptions=None, corpus=None, max_rate=0.2, grid=3, tol=2.5e-4):
+    """
+    Highest withdrawal rate of strategy ("fixed", "percentage" or "guardrails")
+    at which at least target (success_target by default) of the paths last to
+    life_expectancy.
+
+    fixed is solved exactly from fixed_withdrawal_capacity. The others run
+    grid rates spread over (0, max_rate] on all paths in one pass and narrow to
+    the interval below the first rate that misses the target, with grid rates
+    inside it per pass, until it is within tol; a result of max_rate means
+    every searched rate met the target. A corpus at retirement of zero or less
+    gives a rate of 0.
+    """
+    a, retirement_age, corpus, expenses, returns, inflation = _decumulation_setup(
+        all_inputs, assumptions, n_paths, seed, distributions, correlation, corpus)
+    strategy = strategy or a["withdrawal_strategy"]
+    target = a["success_target"] if target is None else target
+    years = returns.shape[-1]
+    n = returns.shape[0]
+    if strategy == "fixed":
+        # The rate every path but the allowed failures sustains
+        capacity = np.sort(fixed_withdrawal_capacity(returns, inflation)) if years else np.full(n, float(max_rate))
+        rate = float(capacity[min(int(np.floor(n * (1 - target) + 1e-9)), n - 1)])
+        evaluations = 1
+    elif strategy in ("percentage", "guardrails"):
+        # Rate 0 always lasts; max_rate is evaluated on the first pass only
+        low, high, evaluations = 0.0, float(max_rate), 0
+        rates = np.linspace(low, high, grid + 1)[1:]
+        while True:
+            lasted = decumulation_paths(1.0, returns, inflation, rates[:, None], strategy, assumptions=a, full=False)["First Failure"]
+            evaluations += len(rates)
+            missed = np.flatnonzero((lasted == years).mean(axis=1) < target)
+            if not len(missed):
+                low = rates[-1]
+            else:
+                high = rates[missed[0]]
+                low = rates[missed[0] - 1] if missed[0] else low
+            if high - low <= tol:
+                break
+            rates = np.linspace(low, high, grid + 2)[1:-1]
+        rate = float(low)
+    else:
+        raise ValueError(f"Strategy '{strategy}' has no withdrawal rate to solve for.")
+    if corpus <= 0:
+        # Nothing to withdraw from: any rate trivially "lasts"
+        rate = 0.0
+    check = decumulation_paths(corpus, returns, inflation, rate, strategy, assumptions=a, full=False)["First Failure"]
+    METRICS.count("decumulation_paths", n * (evaluations + 1))
+    return {"strategy": strategy, "rate": rate, "amount": rate * max(corpus, 0.0), "success_probability": float((check == years).mean()),
+            "target": target, "corpus": corpus, "expenses": expenses, "retirement_age": retirement_age,
+            "life_expectancy": int(a["life_expectancy"]), "paths": n}
+
+# -----------------------------------------------------------------------------
+# GOAL SEEK
+# -----------------------------------------------------------------------------
+# Solves for the input that makes the Corpus of the final projection year (the
+# year before retirement) reach a target. Many profiles are solved together:
+# every iteration is one vectorized engine call with one candidate per profile,
+# on columns whose loan and event schedules are computed once up front.
+# Corpus rises with annual_contribution (exactly linearly, since event costs are
+# paid from investments last) and falls with the expense level; the bracket is
+# grown geometrically and then narrowed with Illinois regula falsi.
+# A projection is a prefix of any longer one, so one run to max_age gives the
+# Corpus for every retirement age.
+GOAL_SEEK_VARIABLES = {
+    # variable: (Corpus rises with it, first bracket width)
+    "annual_contribution": (True, 100000.0),
+    "expense": (False, 30000.0),
+}
+
+def _projection_columns(profiles, years, a):
+    # Engine columns for profile_from_inputs dicts with the loan and event schedules computed once
+    columns = {name: np.array([profile[name] for profile in profiles], dtype=float) for name in NUMERIC_PROFILE_FIELDS}
+    columns["housing_status"] = np.array([profile["housing_status"] for profile in profiles], dtype=str)
+    columns["event_costs"] = profile_event_costs([p["children_birth_years"] for p in profiles], [p["custom_events"] for p in profiles], years)
+    if a["amortize_liabilities"]:
+        debt = profile_debt_schedule([profile["loans"] for profile in profiles], years)
+        columns["annual_debt"], columns["liabilities"] = debt["payment"], debt["balance"]
+    return columns
+
+def _goal_seek_assumptions(a, variable, values):
+    if variable == "annual_contribution":
+        return dict(a, annual_contribution=values)
+    # The expense level is the monthly base expense (rent for renters) before city factor and inflation
+    return dict(a, baseline_rent=values.reshape(-1, 1), baseline_expense=values.reshape(-1, 1))
+
+@timed("goal_seek")
+def goal_seek(inputs_list, target_corpus, variable="annual_contribution", retirement_age=None, assumptions=None,
+              tol=1.0, corpus_tol=1.0, max_evaluations=60, max_age=100):
+    """
+    Solve for variable in every all_inputs dict so the Corpus at retirement
+    reaches target_corpus (a scalar or one target per profile).
+
+    variable is "annual_contribution" (smallest yearly contribution), "expense"
+    (largest monthly base expense) or "retirement_age" (earliest age up to
+    max_age). retirement_age overrides each profile's horizon for the first two.
+    Returns one dict per profile: value, corpus, status ("solved",
+    "already_met", "unreachable" or "unbounded") and the shared evaluation count.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    profiles = [profile_from_inputs(inputs) for inputs in inputs_list]
+    n = len(profiles)
+    target = np.broadcast_to(np.asarray(target_corpus, dtype=float), (n,))
+    start_age = np.array([profile["starting_age"] for profile in profiles], dtype=int)
+    if variable == "retirement_age":
+        horizon = np.maximum(max_age - start_age, 0)
+    elif retirement_age is not None:
+        horizon = np.maximum(np.broadcast_to(np.asarray(retirement_age, dtype=int), (n,)) - start_age, 0)
+    else:
+        horizon = np.array([max(int(profile["years_to_simulate"]), 0) for profile in profiles], dtype=int)
+    years = int(horizon.max(initial=0))
+    columns = _projection_columns(profiles, years, a)
+    results = [{"variable": variable, "target": float(target[i]), "value": None, "corpus": None,
+                "status": "unreachable", "evaluations": 0} for i in range(n)]
+    if not n or not years:
+        return results
+
+    if variable == "retirement_age":
+        corpus = project_profile_arrays(columns, years, a)["Corpus"]
+        reached = (corpus >= target[:, None]) & (np.arange(years) < horizon[:, None])
+        for i in np.flatnonzero(reached.any(axis=1)):
+            t = int(np.argmax(reached[i]))
+            results[i].update(value=int(start_age[i] + t + 1), corpus=float(corpus[i, t]), status="solved")
+        for result in results:
+            result["evaluations"] = 1
+        return results
+    if variable not in GOAL_SEEK_VARIABLES:
+        raise ValueError(f"Unknown goal seek variable '{variable}'; use one of {sorted(GOAL_SEEK_VARIABLES) + ['retirement_age']}.")
+    increasing, width = GOAL_SEEK_VARIABLES[variable]
+    last = np.maximum(horizon - 1, 0)
+    evaluations = 0
+
+    def shortfall(values, rows):
+        # Corpus minus target at retirement for the given profile rows; >= 0 means the target is met
+        nonlocal evaluations
+        evaluations += 1
+        subset = {name: values_[rows] for name, values_ in columns.items()}
+        corpus = project_profile_arrays(subset, years, _goal_seek_assumptions(a, variable, values))["Corpus"]
+        return corpus[np.arange(len(rows)), last[rows]] - target[rows]
+
+    # feasible/infeasible hold a point on each side of the crossing and its shortfall
+    rows = np.flatnonzero(horizon > 0)
+    zero = np.zeros(len(rows))
+    g_zero = shortfall(zero, rows)
+    if increasing:
+        met = g_zero >= 0
+        for i, g in zip(rows[met], g_zero[met]):
+            results[i].update(value=0.0, corpus=float(g + target[i]), status="already_met")
+        rows, infeasible, g_infeasible = rows[~met], zero[~met], g_zero[~met]
+        feasible, g_feasible = np.full(len(rows), np.nan), np.full(len(rows), np.nan)
+    else:
+        rows, feasible, g_feasible = rows[g_zero >= 0], zero[g_zero >= 0], g_zero[g_zero >= 0]
+        infeasible, g_infeasible = np.full(len(rows), np.nan), np.full(len(rows), np.nan)
+
+    # Bracket: double the step from 0 until each profile's target flips
+    step = np.full(len(rows), width)
+    open_ = np.ones(len(rows), dtype=bool)
+    while open_.any() and evaluations < max_evaluations:
+        idx = np.flatnonzero(open_)
+        g = shortfall(step[idx], rows[idx])
+        flipped = (g >= 0) if increasing else (g < 0)
+        done, grow = idx[flipped], idx[~flipped]
+        if increasing:
+            feasible[done], g_feasible[done] = step[done], g[flipped]
+            infeasible[grow], g_infeasible[grow] = step[grow], g[~flipped]
+        else:
+            infeasible[done], g_infeasible[done] = step[done], g[flipped]
+            feasible[grow], g_feasible[grow] = step[grow], g[~flipped]
+        open_[done] = False
+        step[grow] *= 2
+    bracketed = ~open_
+    for i in rows[open_]:
+        results[i]["status"] = "unreachable" if increasing else "unbounded"
+    rows, feasible, g_feasible = rows[bracketed], feasible[bracketed], g_feasible[bracketed]
+    infeasible, g_infeasible = infeasible[bracketed], g_infeasible[bracketed]
+
+    # Illinois regula falsi, each step kept at least tol/4 inside the bracket. The
+    # secant uses weighted copies of the shortfalls; a bracket end kept twice in a
+    # row has its weight halved so the other end keeps moving.
+    w_feasible, w_infeasible = g_feasible.copy(), g_infeasible.copy()
+    kept = np.zeros(len(rows), dtype=int)
+    active = (np.abs(feasible - infeasible) > tol) & (g_feasible > corpus_tol)
+    while active.any() and evaluations < max_evaluations:
+        idx = np.flatnonzero(active)
+        lo, hi = np.minimum(feasible[idx], infeasible[idx]), np.maximum(feasible[idx], infeasible[idx])
+        x = feasible[idx] - w_feasible[idx] * (feasible[idx] - infeasible[idx]) / (w_feasible[idx] - w_infeasible[idx])
+        x = np.clip(x, lo + tol / 4, hi - tol / 4)
+        g = shortfall(x, rows[idx])
+        ok = g >= 0
+        w_infeasible[idx[ok & (kept[idx] == 1)]] /= 2
+        w_feasible[idx[~ok & (kept[idx] == -1)]] /= 2
+        feasible[idx[ok]], g_feasible[idx[ok]], w_feasible[idx[ok]] = x[ok], g[ok], g[ok]
+        infeasible[idx[~ok]], g_infeasible[idx[~ok]], w_infeasible[idx[~ok]] = x[~ok], g[~ok], g[~ok]
+        kept[idx] = np.where(ok, 1, -1)
+        active[idx] = (np.abs(feasible[idx] - infeasible[idx]) > tol) & (g_feasible[idx] > corpus_tol)
+    for j, i in enumerate(rows):
+        results[i].update(value=float(feasible[j]), corpus=float(g_feasible[j] + target[i]), status="solved")
+    for result in results:
+        result["evaluations"] = evaluations
+    return results
+
+# -----------------------------------------------------------------------------
+# SENSITIVITY ANALYSIS
+# -----------------------------------------------------------------------------
+# A scenario sets any of SWEEP_FACTORS; all scenarios of all profiles run as the
+# rows of one project_profile_arrays call. Rates become per-row (rows, 1) arrays,
+# so a swept inflation or income growth compounds through price_index year on
+# year exactly as in a single projection. The city factor becomes a per-row
+# column, and retirement ages read the Corpus off one projection to the latest
+# age, so loans, events and taxes are never re-derived per scenario.
+SWEEP_FACTORS = RATE_KEYS + ("annual_contribution", "city_cost_factor", "retirement_age")
+
+def _sweep_base(profile, a, factor):
+    if factor == "city_cost_factor":
+        return profile["city_cost_factor"]
+    if factor == "retirement_age":
+        return profile["starting_age"] + profile["years_to_simulate"]
+    return a[factor]
+
+@timed("sensitivity")
+def scenario_corpus(profiles, scenarios, assumptions=None):
+    """
+    Corpus at retirement (final projection year) of every profile_from_inputs
+    dict under R scenarios, as an (N, R) array. scenarios maps factors of
+    SWEEP_FACTORS to R values, or (N, R) values for per-profile scenarios.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    unknown = set(scenarios) - set(SWEEP_FACTORS)
+    if unknown:
+        raise ValueError(f"Unknown sweep factors {sorted(unknown)}; use any of {list(SWEEP_FACTORS)}.")
+    n = len(profiles)
+    r = np.shape(next(iter(scenarios.values())))[-1] if scenarios else 1
+    start = np.array([profile["starting_age"] for profile in profiles], dtype=int)
+    own_age = start + np.array([max(int(profile["years_to_simulate"]), 0) for profile in profiles], dtype=int)
+    ret_age = np.broadcast_to(np.asarray(scenarios.get("retirement_age", own_age[:, None])), (n, r)).astype(int)
+    horizon = np.maximum(ret_age - start[:, None], 0).reshape(-1)
+    years = int(horizon.max(initial=0))
+    if not n or not years:
+        return np.full((n, r), np.nan)
+    columns = {name: np.repeat(values, r, axis=0) for name, values in _projection_columns(profiles, years, a).items()}
+    for factor, values in scenarios.items():
+        values = np.broadcast_to(np.asarray(values, dtype=float), (n, r)).reshape(-1)
+        if factor == "city_cost_factor":
+            columns[factor] = values
+        elif factor == "annual_contribution":
+            a[factor] = values
+        elif factor in RATE_KEYS:
+            a[factor] = values.reshape(-1, 1)
+    corpus = project_profile_arrays(columns, years, a)["Corpus"]
+    final = corpus[np.arange(n * r), np.maximum(horizon - 1, 0)]
+    return np.where(horizon > 0, final, np.nan).reshape(n, r)
+
+def sensitivity_grid(inputs_list, axes, assumptions=None):
+    """
+    Corpus at retirement over the Cartesian grid of axes ({factor: values}) for
+    every all_inputs dict. "corpus" has shape (profiles, len(axis 1), ...);
+    "base" holds each profile's unswept value of every axis.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    profiles = [profile_from_inputs(inputs) for inputs in inputs_list]
+    names = list(axes)
+    values = [np.asarray(axes[name], dtype=float) for name in names]
+    mesh = np.meshgrid(*values, indexing="ij")
+    corpus = scenario_corpus(profiles, {name: grid.reshape(-1) for name, grid in zip(names, mesh)}, a)
+    return {"axes": dict(zip(names, values)), "corpus": corpus.reshape((len(profiles),) + tuple(len(v) for v in values)),
+            "base": [{name: _sweep_base(profile, a, name) for name in names} for profile in profiles]}
+
+def tornado_sensitivity(inputs_list, ranges, assumptions=None):
+    """
+    One-at-a-time sensitivity: the Corpus at retirement with each factor of
+    ranges ({factor: (low, high)}) set to its low and high value while the others
+    keep their base value. Base and swings for all profiles run as one batch.
+    """
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    profiles = [profile_from_inputs(inputs) for inputs in inputs_list]
+    names = list(ranges)
+    base = np.array([[_sweep_base(profile, a, name) for name in names] for profile in profiles], dtype=float).reshape(len(profiles), len(names))
+    # Scenario 0 is the base, then the low and high of each factor in turn
+    scenarios = {}
+    for j, name in enumerate(names):
+        values = np.repeat(base[:, j:j + 1], 1 + 2 * len(names), axis=1)
+        values[:, 1 + 2 * j], values[:, 2 + 2 * j] = ranges[name]
+        scenarios[name] = values
+    corpus = scenario_corpus(profiles, scenarios, a)
+    return {"factors": names, "low": [ranges[name][0] for name in names], "high": [ranges[name][1] for name in names],
+            "base": base, "base_corpus": corpus[:, 0], "corpus_low": corpus[:, 1::2], "corpus_high": corpus[:, 2::2]}
+
+def default_sensitivity_axes(all_inputs, assumptions=None, steps=5):
+    """Symmetric axes around a profile's own assumptions, each with its base value in the middle."""
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    profile = profile_from_inputs(all_inputs)
+    offsets = np.arange(steps) - steps // 2
+    return {
+        "investment_return": a["investment_return"] + 0.01 * offsets,
+        "inflation": a["inflation"] + 0.01 * offsets,
+        "income_growth": a["income_growth"] + 0.01 * offsets,
+        "city_cost_factor": profile["city_cost_factor"] * (1 + 0.1 * offsets),
+        "retirement_age": _sweep_base(profile, a, "retirement_age") + 2 * offsets,
+    }
+
+def sensitivity_frame(grid, profile=0):
+    """Long DataFrame of one profile's grid: one column per axis plus Corpus."""
+    import pandas as pd
+    mesh = np.meshgrid(*grid["axes"].values(), indexing="ij")
+    return pd.DataFrame({**{name: values.reshape(-1) for name, values in zip(grid["axes"], mesh)},
+                         "Corpus": grid["corpus"][profile].reshape(-1)})
+
+def tornado_frame(tornado, profile=0):
+    """One row per factor, widest Corpus swing first."""
+    import pandas as pd
+    df = pd.DataFrame({"Factor": tornado["factors"], "Low": tornado["low"], "High": tornado["high"],
+                       "Base": tornado["base"][profile], "Corpus at Low": tornado["corpus_low"][profile],
+                       "Corpus at High": tornado["corpus_high"][profile]})
+    df["Swing"] = (df["Corpus at High"] - df["Corpus at Low"]).abs()
+    df["Base Corpus"] = tornado["base_corpus"][profile]
+    return df.sort_values("Swing", ascending=False, ignore_index=True)
+
+def sensitivity_heatmap(grid, x, y, profile=0):
+    """Corpus heatmap over axes x and y, the other axes held at the grid value nearest their base."""
+    import altair as alt
+    df = sensitivity_frame(grid, profile)
+    for name, values in grid["axes"].items():
+        if name not in (x, y):
+            df = df[df[name] == values[np.argmin(np.abs(values - grid["base"][profile][name]))]]
+    return alt.Chart(df).mark_rect().encode(
+        x=alt.X(f"{x}:O", title=x),
+        y=alt.Y(f"{y}:O", title=y, sort="descending"),
+        color=alt.Color("Corpus:Q", title="Corpus (₹)"),
+        tooltip=[x, y, alt.Tooltip("Corpus:Q", format=",.0f")]
+    ).properties(title=f"Corpus at Retirement by {x} and {y}")
+
+def tornado_chart(tornado, profile=0):
+    """Bars from the Corpus at each factor's low value to its high value, widest swing on top."""
+    import altair as alt
+    df = tornado_frame(tornado, profile)
+    bars = alt.Chart(df).mark_bar().encode(
+        x=alt.X("Corpus at Low:Q", title="Corpus at Retirement (₹)"),
+        x2="Corpus at High:Q",
+        y=alt.Y("Factor:N", sort=list(df["Factor"])),
+        tooltip=["Factor", "Low", "High", alt.Tooltip("Corpus at Low:Q", format=",.0f"), alt.Tooltip("Corpus at High:Q", format=",.0f")]
+    )
+    base = alt.Chart(df).mark_rule(color="black").encode(x="Base Corpus:Q")
+    return (bars + base).properties(title="Corpus Sensitivity (Tornado)")
+
+# -----------------------------------------------------------------------------
+# ENGINE VERSION
+# -----------------------------------------------------------------------------
+# Bump when engine changes alter results, so cached projections are not reused.
+ENGINE_VERSION = "5"
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return {"__array__": value.shape, "data": _canonical(value.tolist())}
+    if isinstance(value, np.generic):
+        return _canonical(value.item())
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else repr(value)
+    return value
+
+def content_hash(value):
+    """SHA-256 of the canonical JSON of a value, stable across key order and float spelling."""
+    encoded = json.dumps(_canonical(value), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def engine_fingerprint(assumptions=None):
+    """
+    ENGINE_VERSION plus a hash of the tax slabs the assumptions resolve to, so
+    editing a regime in tax_regimes.json invalidates cached and stored
+    projections without a version bump.
+    """
+    schedule = get_tax_schedule(dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))["tax_regime"])
+    return f"{ENGINE_VERSION}:{content_hash([schedule.uppers.tolist(), schedule.rates.tolist()])[:16]}"
+
+# -----------------------------------------------------------------------------
+# INCREMENTAL RE-SIMULATION
+# -----------------------------------------------------------------------------
+_MISSING = object()
+
+# Inputs whose effect starts late in the horizon; any other change counts from year 0
+LATE_EFFECT_INPUTS = {
+    ("personal_information", "age_of_marriage"),
+    ("reserved_investments",),
+    ("simulation_parameters", "years_to_simulate"),
+    ("retirement_investment_strategy", "retirement_age"),
+}
+
+def _flatten_inputs(value, path=()):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(_flatten_inputs(item, path + (key,)))
+        return flat
+    return {path: _canonical(value)}
+
+def first_changed_year(old_inputs, new_inputs, old_assumptions=None, new_assumptions=None):
+    """
+    Earliest simulation year whose row can differ between two runs, or None if
+    nothing changes. Marriage inputs count from the earlier marriage age and a new
+    retirement age only from the shorter horizon; every other change counts from year 0.
+    """
+    old_a = dict(DEFAULT_ASSUMPTIONS, **(old_assumptions or {}))
+    new_a = dict(DEFAULT_ASSUMPTIONS, **(new_assumptions or {}))
+    if _canonical(old_a) != _canonical(new_a):
+        return 0
+    old_flat, new_flat = _flatten_inputs(old_inputs), _flatten_inputs(new_inputs)
+    changed = {path for path in old_flat.keys() | new_flat.keys() if old_flat.get(path, _MISSING) != new_flat.get(path, _MISSING)}
+    if not changed:
+        return None
+    if changed - LATE_EFFECT_INPUTS:
+        return 0
+    old_p, new_p = profile_from_inputs(old_inputs), profile_from_inputs(new_inputs)
+    year = max(old_p["years_to_simulate"], new_p["years_to_simulate"])
+    if changed & {("personal_information", "age_of_marriage"), ("reserved_investments",)}:
+        for age in (old_p["age_of_marriage"], new_p["age_of_marriage"]):
+            if age == age:
+                year = min(year, int(ceil(age - old_p["starting_age"])))
+    year = min(year, old_p["years_to_simulate"], new_p["years_to_simulate"])
+    return max(year, 0)
+
+class IncrementalProjection:
+    """
+    Keeps the rows and per-year state checkpoints of the last run so that a
+    what-if edit only re-simulates from the first year it affects.
+    """
+    def __init__(self, all_inputs=None, assumptions=None):
+        self.inputs = None
+        self.assumptions = {}
+        self.rows = []
+        self.checkpoints = []
+        self.recomputed_from = 0
+        if all_inputs is not None:
+            self.update(all_inputs, assumptions)
+
+    def iter_update(self, all_inputs, assumptions=None):
+        """
+        Yield the updated projection row by row: reused years first, then the
+        re-simulated ones as they are computed. Consume it fully.
+        """
+        assumptions = dict(assumptions or {})
+        if self.inputs is None:
+            year = 0
+        else:
+            year = first_changed_year(self.inputs, all_inputs, self.assumptions, assumptions)
+            old = profile_from_inputs(self.inputs)
+            old_wedding = int(marriage_year(old["age_of_marriage"], old["starting_age"]))
+        self.inputs = copy.deepcopy(all_inputs)
+        self.assumptions = assumptions
+        if year is None:
+            self.recomputed_from = len(self.rows)
+            yield from list(self.rows)
+            return
+        if year >= len(self.checkpoints):
+            # Horizon extended: redo the last simulated year to recover the state after it
+            year = max(len(self.checkpoints) - 1, 0)
+        start_state = self.checkpoints[year] if year > 0 else None
+        if start_state is not None and (old_wedding < 0 or year <= old_wedding):
+            # No marriage decided yet, so reserved investments and the marriage event come from the new inputs
+            profile = profile_from_inputs(self.inputs)
+            schedule = EventSchedule(event for event in start_state["events"] if not event.deferrable)
+            schedule.push_marriage(profile)
+            start_state = dict(start_state, reserved_investments=profile["reserved_investments"], events=tuple(schedule.heap))
+        self.rows = self.rows[:year]
+        self.checkpoints = self.checkpoints[:year]
+        self.recomputed_from = year
+        yield from list(self.rows)
+        for row in iter_yearly_projection(self.inputs, assumptions=self.assumptions,
+                                          start_state=start_state, checkpoints=self.checkpoints):
+            self.rows.append(row)
+            yield row
+
+    def update(self, all_inputs, assumptions=None):
+        """Re-project for new inputs, reusing unaffected years; returns the rows."""
+        for _ in self.iter_update(all_inputs, assumptions):
+            pass
+        return self.rows
@@ -0,0 +1,261 @@
+"""
+Streaming sinks (CSV, Parquet, Excel, Arrow IPC, partitioned Parquet) that
+write projections as they are produced, and export_projection for whole frames.
+pandas and pyarrow are imported by the sinks that need them.
+"""
+import os
+
+from financial_core import PROJECTION_FIELDS, simulate_batch_projection
+
+# Public names
+__all__ = [
+    "CSVSink", "ParquetSink", "stream_projection", "iter_batch_projection", "stream_batch_projection",
+    "PROJECTION_DTYPES", "XLSX_MAX_ROWS", "compact_projection_frame", "XLSXSink", "ArrowSink", "PartitionedParquetSink",
+    "EXPORT_SINKS", "export_projection",
+]
+
+# -----------------------------------------------------------------------------
+# STREAMING OUTPUT
+# -----------------------------------------------------------------------------
+# Sinks accept rows (dicts in the projection row format) or whole DataFrames and
+# write them out as they arrive, so nothing has to hold the full projection.
+class CSVSink:
+    def __init__(self, target, fields=None):
+        self.fields = fields or PROJECTION_FIELDS
+        self.owns_file = isinstance(target, (str, os.PathLike))
+        self.file = open(target, "w", newline="", encoding="utf-8") if self.owns_file else target
+        self.header_written = False
+
+    def write_rows(self, rows):
+        import pandas as pd
+        self.write_frame(pd.DataFrame(rows, columns=self.fields))
+
+    def write_frame(self, df):
+        df.to_csv(self.file, index=False, header=not self.header_written)
+        self.header_written = True
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+
+def _arrow_table(pa, df):
+    # Fixed int32 dictionary indices, so chunks with different category counts share one schema
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fields = [pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type)) if pa.types.is_dictionary(f.type) else f
+              for f in table.schema]
+    return table.cast(pa.schema(fields))
+
+class ParquetSink:
+    """Appends each write as a row group; needs pyarrow."""
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as exc:
+            raise ImportError("ParquetSink requires pyarrow (pip install pyarrow).") from exc
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    def write_rows(self, rows):
+        import pandas as pd
+        self.write_frame(pd.DataFrame(rows))
+
+    def write_frame(self, df):
+        table = _arrow_table(self.pa, df)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def stream_projection(rows, sinks, batch_size=1):
+    """Drain a row iterator into sinks in groups of batch_size; returns the row count."""
+    count = 0
+    pending = []
+    for row in rows:
+        pending.append(row)
+        count += 1
+        if len(pending) >= batch_size:
+            for sink in sinks:
+                sink.write_rows(pending)
+            pending = []
+    if pending:
+        for sink in sinks:
+            sink.write_rows(pending)
+    return count
+
+def _slice_profiles(profiles, start, stop):
+    if hasattr(profiles, "iloc"):
+        return profiles.iloc[start:stop]
+    return {name: values[start:stop] for name, values in profiles.items()}
+
+def iter_batch_projection(profiles, assumptions=None, chunk_size=10000):
+    """Yield a BatchProjection for each consecutive chunk of the profile table."""
+    n = len(profiles[next(iter(profiles.keys()))])
+    for start in range(0, n, chunk_size):
+        yield simulate_batch_projection(_slice_profiles(profiles, start, start + chunk_size), assumptions)
+
+def stream_batch_projection(profiles, sinks, assumptions=None, chunk_size=10000, with_events=False):
+    """Project a profile table chunk by chunk, writing each chunk's long frame to the sinks."""
+    count = 0
+    for batch in iter_batch_projection(profiles, assumptions, chunk_size):
+        frame = batch.to_frame(with_events=with_events)
+        for sink in sinks:
+            sink.write_frame(frame)
+        count += len(frame)
+    return count
+
+# -----------------------------------------------------------------------------
+# EXPORT FORMATS
+# -----------------------------------------------------------------------------
+# Typed exports for downstream analytics: small integer and categorical columns
+# instead of formatted strings, written chunk by chunk like the sinks above.
+PROJECTION_DTYPES = {"Year": "int16", "Age": "int16", "DTI (%)": "float32", "Life Events": "category",
+                     "Notes": "category", "client": "category", "scenario": "category"}
+XLSX_MAX_ROWS = 1048576
+
+def compact_projection_frame(df, money_dtype="float64"):
+    """
+    Cast a projection frame to compact dtypes. Amounts stay float64 by default:
+    float32 only keeps whole rupees above about 1.6 crore.
+    """
+    dtypes = {}
+    for col in df.columns:
+        if col in PROJECTION_DTYPES:
+            dtypes[col] = PROJECTION_DTYPES[col]
+        elif df[col].dtype.kind == "f" or (col in PROJECTION_FIELDS and df[col].dtype.kind in "iu"):
+            dtypes[col] = money_dtype
+    return df.astype(dtypes)
+
+class XLSXSink:
+    """
+    Streams rows into an .xlsx workbook in constant memory (openpyxl write-only
+    mode), continuing on a new sheet past Excel's row limit. Needs openpyxl.
+    """
+    def __init__(self, target, fields=None, sheet="Projection"):
+        try:
+            from openpyxl import Workbook
+        except ImportError as exc:
+            raise ImportError("XLSXSink requires openpyxl (pip install openpyxl).") from exc
+        self.target = target
+        self.fields = fields or PROJECTION_FIELDS
+        self.sheet_name = sheet
+        self.workbook = Workbook(write_only=True)
+        self.sheets = 0
+        self.sheet_rows = XLSX_MAX_ROWS
+
+    def _next_sheet(self):
+        self.sheets += 1
+        title = self.sheet_name if self.sheets == 1 else f"{self.sheet_name} {self.sheets}"
+        self.sheet = self.workbook.create_sheet(title)
+        self.sheet.append(list(self.fields))
+        self.sheet_rows = 1
+
+    def write_rows(self, rows):
+        import pandas as pd
+        self.write_frame(pd.DataFrame(rows, columns=self.fields))
+
+    def write_frame(self, df):
+        df = df.reindex(columns=self.fields)
+        for col in df.columns:
+            if df[col].dtype.kind not in "iub":
+                df[col] = df[col].astype(object).where(df[col].notna(), None)
+        for row in df.itertuples(index=False, name=None):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._next_sheet()
+            self.sheet.append(row)
+            self.sheet_rows += 1
+
+    def close(self):
+        if not self.sheets:
+            self._next_sheet()
+        self.workbook.save(self.target)
+
+class ArrowSink:
+    """Appends each write as record batches of an Arrow IPC stream; needs pyarrow."""
+    def __init__(self, target, compact=True):
+        try:
+            import pyarrow
+            import pyarrow.ipc
+        except ImportError as exc:
+            raise ImportError("ArrowSink requires pyarrow (pip install pyarrow).") from exc
+        self.pa = pyarrow
+        self.target = target
+        self.compact = compact
+        self.writer = None
+
+    def write_rows(self, rows):
+        import pandas as pd
+        self.write_frame(pd.DataFrame(rows))
+
+    def write_frame(self, df):
+        table = _arrow_table(self.pa, compact_projection_frame(df) if self.compact else df)
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = self.pa.ipc.new_stream(self.target, self.schema)
+        self.writer.write_table(table.cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class PartitionedParquetSink:
+    """
+    Writes batch output as a hive-partitioned Parquet dataset
+    (root/client=.../scenario=.../part-*.parquet) with compact column types.
+    The client partition comes from client_column (Profile in batch frames).
+    """
+    def __init__(self, root, scenario="base", client_column="Profile", partition_cols=("client", "scenario"), compact=True):
+        try:
+            import pyarrow
+            import pyarrow.dataset
+        except ImportError as exc:
+            raise ImportError("PartitionedParquetSink requires pyarrow (pip install pyarrow).") from exc
+        self.pa = pyarrow
+        self.ds = pyarrow.dataset
+        self.root = root
+        self.scenario = scenario
+        self.client_column = client_column
+        self.partition_cols = list(partition_cols)
+        self.compact = compact
+        self.parts = 0
+
+    def write_rows(self, rows):
+        import pandas as pd
+        self.write_frame(pd.DataFrame(rows))
+
+    def write_frame(self, df):
+        df = df.rename(columns={self.client_column: "client"})
+        if "client" not in df:
+            df["client"] = 0
+        df["scenario"] = self.scenario
+        if self.compact:
+            df = compact_projection_frame(df)
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        partitions = 1
+        for col in self.partition_cols:
+            partitions *= df[col].nunique()
+        self.ds.write_dataset(table, self.root, format="parquet", partitioning=self.partition_cols,
+                              partitioning_flavor="hive", basename_template=f"part-{self.parts}-{{i}}.parquet",
+                              existing_data_behavior="overwrite_or_ignore", max_partitions=max(partitions, 1))
+        self.parts += 1
+
+    def close(self):
+        pass
+
+EXPORT_SINKS = {".xlsx": XLSXSink, ".arrow": ArrowSink, ".arrows": ArrowSink, ".csv": CSVSink, ".parquet": ParquetSink}
+
+def export_projection(df, target):
+    """Write one projection frame to target, choosing the format from its extension."""
+    ext = os.path.splitext(str(target))[1].lower()
+    if ext not in EXPORT_SINKS:
+        raise ValueError(f"Unsupported export format '{ext}'; use one of {sorted(EXPORT_SINKS)}.")
+    sink = EXPORT_SINKS[ext](target)
+    try:
+        sink.write_frame(df if ext in (".csv", ".xlsx") else compact_projection_frame(df))
+    finally:
+        sink.close()
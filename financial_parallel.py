@@ -0,0 +1,196 @@
+"""
+Batch projections and Monte Carlo runs of financial_core sharded over a process
+pool, with the scaling benchmark used to pick worker counts.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from financial_core import (BatchProjection, DEFAULT_ASSUMPTIONS, NUMERIC_PROFILE_FIELDS, PROFILE_DEFAULTS,
+                            _block_chunk_size, _monte_carlo_columns, _profile_column, draw_path_blocks,
+                            monte_carlo_distributions, monte_carlo_streams, profile_debt_schedule, profile_event_costs,
+                            profile_from_inputs, project_profile_arrays, summarize_monte_carlo, timed)
+
+# Public names
+__all__ = [
+    "PARALLEL_DEFAULTS", "HOUSING_CODES", "OUTPUT_FIELDS", "parallel_batch_projection", "parallel_monte_carlo",
+    "benchmark_parallel_scaling",
+]
+
+# -----------------------------------------------------------------------------
+# PARALLEL EXECUTION
+# -----------------------------------------------------------------------------
+# Work is split into fixed-size chunks of profiles or paths. Inputs and outputs
+# travel through shared memory as float arrays; only names, shapes and row
+# ranges are pickled. Chunks are merged by position, and Monte Carlo chunks hold
+# whole blocks of monte_carlo_streams, so results depend on the seed alone and
+# match simulate_monte_carlo.
+PARALLEL_DEFAULTS = {"workers": os.cpu_count() or 1, "chunk_size": 20000}
+HOUSING_CODES = ["rented", "owned", "other"]
+OUTPUT_FIELDS = ["Income", "Total Expenses", "Emergency Fund", "Emergency Fund Added", "Debt (Annual EMI)", "Liabilities", "DTI (%)",
+                 "Tax", "Event Costs", "Marriage Cost", "Investment Debits", "Savings", "Investment Value", "Asset Value", "Corpus"]
+
+def _shared_array(shape, name=None):
+    nbytes = max(int(np.prod(shape)) * 8, 1)
+    shm = shared_memory.SharedMemory(name=name, create=name is None, size=nbytes if name is None else 0)
+    return shm, np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+def _release(shms, unlink=False):
+    for shm in shms:
+        try:
+            shm.close()
+        except BufferError:
+            pass  # a view is still held by an exception traceback; the mapping goes with the process
+        if unlink:
+            shm.unlink()
+
+def _run_chunks(worker, tasks, workers):
+    if workers <= 1 or len(tasks) <= 1:
+        return [worker(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        return list(pool.map(worker, tasks))
+
+def _fill_batch_chunk(shms, profile_name, shared_names, out_names, n, years, start, stop, assumptions):
+    shm, matrix = _shared_array((n, len(NUMERIC_PROFILE_FIELDS) + 1), profile_name)
+    shms.append(shm)
+    chunk = {name: matrix[start:stop, j] for j, name in enumerate(NUMERIC_PROFILE_FIELDS)}
+    chunk["housing_status"] = np.asarray(HOUSING_CODES)[matrix[start:stop, -1].astype(int)]
+    for field, name in shared_names.items():
+        shm, shared = _shared_array((n, years), name)
+        shms.append(shm)
+        chunk[field] = shared[start:stop]
+    arrays = project_profile_arrays(chunk, years, assumptions)
+    for field, name in out_names.items():
+        shm, out = _shared_array((n, years), name)
+        shms.append(shm)
+        out[start:stop] = arrays[field]
+
+def _batch_chunk(task):
+    shms = []
+    try:
+        _fill_batch_chunk(shms, *task)
+    finally:
+        _release(shms)
+    return task[6] - task[5]
+
+def _parallel_batch(shms, profiles, columns, n, years, a, fields, workers, chunk_size):
+    shm, matrix = _shared_array((n, len(NUMERIC_PROFILE_FIELDS) + 1))
+    shms.append(shm)
+    for j, name in enumerate(NUMERIC_PROFILE_FIELDS):
+        matrix[:, j] = columns[name]
+    housing = np.char.lower(np.asarray(columns["housing_status"], dtype=str))
+    matrix[:, -1] = np.where(housing == "rented", 0, np.where(housing == "owned", 1, 2))
+    # Loans and events are ragged per profile, so their schedules are built here and shared as arrays
+    schedules = {"event_costs": profile_event_costs(columns["children_birth_years"], columns["custom_events"], years)}
+    if a["amortize_liabilities"]:
+        debt = profile_debt_schedule(columns["loans"], years)
+        schedules["annual_debt"], schedules["liabilities"] = debt["payment"], debt["balance"]
+        del debt
+    shared_names = {}
+    for field, values in schedules.items():
+        shm, shared = _shared_array((n, years))
+        shms.append(shm)
+        shared[:] = values
+        shared_names[field] = shm.name
+    del schedules, shared
+    arrays = {}
+    out_names = {}
+    for field in fields:
+        shm, arrays[field] = _shared_array((n, years))
+        shms.append(shm)
+        out_names[field] = shm.name
+    tasks = []
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        chunk_a = {k: v[start:stop] if np.ndim(v) == 2 and np.shape(v)[0] == n else v for k, v in a.items()}
+        tasks.append((shms[0].name, shared_names, out_names, n, years, start, stop, chunk_a))
+    _run_chunks(_batch_chunk, tasks, workers)
+    t = np.arange(years)
+    arrays["Year"] = np.broadcast_to(a["start_year"] + t, (n, years))
+    arrays["Age"] = columns["starting_age"].astype(int).reshape(-1, 1) + t
+    # BatchProjection masks float fields into fresh arrays, so nothing keeps a view of shared memory
+    return BatchProjection(columns, arrays, a, index=getattr(profiles, "index", None))
+
+@timed("parallel_batch_projection")
+def parallel_batch_projection(profiles, assumptions=None, workers=None, chunk_size=None, fields=None):
+    """
+    simulate_batch_projection sharded over a process pool.
+    fields limits which float outputs are computed (all by default; rows() needs all of them).
+    Per-profile rate arrays of shape (N, years) in assumptions are sliced per chunk.
+    """
+    workers = workers or PARALLEL_DEFAULTS["workers"]
+    chunk_size = chunk_size or PARALLEL_DEFAULTS["chunk_size"]
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    n = len(profiles[next(iter(profiles.keys()))])
+    columns = {name: _profile_column(profiles, name, n) for name in PROFILE_DEFAULTS}
+    years = int(max(columns["years_to_simulate"].max(initial=0), 0))
+    shms = []
+    try:
+        return _parallel_batch(shms, profiles, columns, n, years, a, list(fields or OUTPUT_FIELDS), workers, chunk_size)
+    finally:
+        _release(shms, unlink=True)
+
+def _fill_monte_carlo_chunk(shms, profile_cols, out_name, n_paths, years, start, stop, streams, dists, correlation, assumptions):
+    shm, corpus = _shared_array((n_paths, years), out_name)
+    shms.append(shm)
+    rates = draw_path_blocks(streams, start, stop, years, dists, correlation)
+    corpus[start:stop] = project_profile_arrays(profile_cols, years, dict(assumptions, **rates))["Corpus"]
+
+def _monte_carlo_chunk(task):
+    shms = []
+    try:
+        _fill_monte_carlo_chunk(shms, *task)
+    finally:
+        _release(shms)
+    return task[5] - task[4]
+
+def _parallel_monte_carlo(shms, profile, n_paths, years, a, dists, correlation, seed, percentiles,
+                          shortfall_threshold, workers, chunk_size):
+    shm, corpus = _shared_array((n_paths, years))
+    shms.append(shm)
+    profile_cols = _monte_carlo_columns(profile, years)
+    streams = monte_carlo_streams(seed, n_paths)
+    chunk_size = _block_chunk_size(chunk_size)
+    tasks = []
+    for start in range(0, n_paths, chunk_size):
+        stop = min(start + chunk_size, n_paths)
+        tasks.append((profile_cols, shm.name, n_paths, years, start, stop, streams, dists, correlation, a))
+    _run_chunks(_monte_carlo_chunk, tasks, workers)
+    return summarize_monte_carlo(corpus, a, profile["starting_age"], percentiles, shortfall_threshold)
+
+@timed("parallel_monte_carlo")
+def parallel_monte_carlo(all_inputs, n_paths=100000, distributions=None, correlation=None, seed=None,
+                         assumptions=None, percentiles=(5, 25, 50, 75, 95), shortfall_threshold=0.0,
+                         workers=None, chunk_size=None):
+    """simulate_monte_carlo with path chunks spread over a process pool."""
+    workers = workers or PARALLEL_DEFAULTS["workers"]
+    chunk_size = chunk_size or PARALLEL_DEFAULTS["chunk_size"]
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    profile = profile_from_inputs(all_inputs)
+    years = max(int(profile["years_to_simulate"]), 0)
+    shms = []
+    try:
+        return _parallel_monte_carlo(shms, profile, n_paths, years, a, monte_carlo_distributions(a, distributions),
+                                     correlation, seed, percentiles, shortfall_threshold, workers, chunk_size)
+    finally:
+        _release(shms, unlink=True)
+
+def benchmark_parallel_scaling(profiles, worker_counts=None, chunk_size=None, repeat=3, fields=("Corpus",)):
+    """Time parallel_batch_projection for each worker count; returns one dict per count."""
+    worker_counts = worker_counts or sorted({1, 2, 4, PARALLEL_DEFAULTS["workers"]})
+    n = len(profiles[next(iter(profiles.keys()))])
+    profile_years = float(np.maximum(np.asarray(profiles["years_to_simulate"]), 0).sum())
+    results = []
+    for workers in worker_counts:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parallel_batch_projection(profiles, workers=workers, chunk_size=chunk_size, fields=list(fields))
+            best = min(best, time.perf_counter() - start)
+        results.append({"workers": workers, "profiles": n, "seconds": best, "profile_years_per_sec": profile_years / best})
+    for row in results:
+        row["speedup"] = results[0]["seconds"] / row["seconds"]
+    return results
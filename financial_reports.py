@@ -0,0 +1,437 @@
+"""
+PDF and Excel reports of projections, bulk report generation, and the
+downsampled chart data and Altair charts shown by the app. fpdf, pandas and
+altair are imported by the functions that use them.
+"""
+import hashlib
+import io
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from financial_core import _canonical, asset_class_label, portfolio_frame, projection_frame, timed
+from financial_export import XLSXSink
+from financial_parallel import PARALLEL_DEFAULTS
+
+# Public names
+__all__ = [
+    "PDF_REPORT_DEFAULTS", "PDF_CORE_TEXT", "PDF_WIDTH_CACHE_SIZE", "PDFReportTemplate", "pdf_report_template",
+    "batch_reports", "bulk_pdf_reports", "benchmark_pdf_reports", "generate_excel_report", "generate_pdf_report",
+    "CHART_MAX_POINTS", "CHART_PERCENTILES", "chart_data_key", "cached_chart_frame", "lttb_indices", "downsample_frame",
+    "percentile_band_frame", "batch_band_frame", "band_chart", "portfolio_allocation_chart", "projection_charts",
+]
+
+# -----------------------------------------------------------------------------
+# PDF REPORTS
+# -----------------------------------------------------------------------------
+# Cells are formatted once per column into a string table, measured with the
+# font's character widths and drawn with pdf.text (much cheaper than pdf.cell).
+# Columns that do not fit the page width continue in further column groups, each
+# repeating the Year column, and every page repeats the header.
+PDF_REPORT_DEFAULTS = {"orientation": "L", "font": "helvetica", "font_size": 7, "font_path": None,
+                       "margin": 10, "padding": 1.2, "max_column_width": 70, "key_column": "Year"}
+# Core PDF fonts only cover Latin-1
+PDF_CORE_TEXT = str.maketrans({"₹": "Rs.", "—": "-", "–": "-"})
+PDF_WIDTH_CACHE_SIZE = 200000
+
+class PDFReportTemplate:
+    """
+    Page geometry, font metrics and measured strings shared by every report it
+    renders. Build one per process and reuse it; font_path embeds a TrueType
+    font (needed to print ₹) at a noticeably higher cost per report.
+    """
+    def __init__(self, **options):
+        self.options = dict(PDF_REPORT_DEFAULTS, **options)
+        probe = self._new_document()
+        self.page_width, self.page_height = probe.w, probe.h
+        self.line_height = probe.font_size * 1.25
+        self.widths = {}
+        self.pages_rendered = 0
+        if self.options["font_path"]:
+            self.measure = probe.get_string_width
+        else:
+            self.char_widths = probe.current_font.cw
+            self.size_mm = probe.font_size / 1000
+            self.measure = self._core_width
+
+    def _new_document(self):
+        from fpdf import FPDF
+        o = self.options
+        pdf = FPDF(orientation=o["orientation"])
+        pdf.set_auto_page_break(False)
+        pdf.set_margins(o["margin"], o["margin"])
+        if o["font_path"]:
+            pdf.add_font("report", "", o["font_path"])
+            pdf.set_font("report", size=o["font_size"])
+        else:
+            pdf.set_font(o["font"], size=o["font_size"])
+        return pdf
+
+    def _core_width(self, text):
+        cw = self.char_widths
+        return sum(cw.get(ch, 600) for ch in text) * self.size_mm
+
+    def text_width(self, text):
+        width = self.widths.get(text)
+        if width is None:
+            if len(self.widths) >= PDF_WIDTH_CACHE_SIZE:
+                self.widths.clear()
+            width = self.widths[text] = self.measure(text)
+        return width
+
+    def string_table(self, projection_df):
+        """Format every column once: {column: [cell strings]} plus the numeric columns."""
+        table, numeric = {}, set()
+        for col in projection_df.columns:
+            values = projection_df[col]
+            if values.dtype.kind == "f":
+                cells = ["" if v != v else f"{v:,.2f}" for v in values.tolist()]
+                numeric.add(col)
+            elif values.dtype.kind in "iu":
+                cells = [str(v) for v in values.tolist()]
+                numeric.add(col)
+            else:
+                cells = ["" if v is None else str(v) for v in values.tolist()]
+            if not self.options["font_path"]:
+                cells = [c.translate(PDF_CORE_TEXT).encode("latin-1", "replace").decode("latin-1") for c in cells]
+            table[str(col)] = cells
+        return table, numeric
+
+    def wrap(self, text, width):
+        """Split text into lines no wider than width (words longer than a line are cut)."""
+        width += 1e-6
+        if not text or self.text_width(text) <= width:
+            return [text]
+        lines, line = [], ""
+        for word in text.split(" "):
+            candidate = f"{line} {word}" if line else word
+            if self.text_width(candidate) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            while self.text_width(word) > width and len(word) > 1:
+                cut = len(word) - 1
+                while cut > 1 and self.text_width(word[:cut]) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+            line = word
+        lines.append(line)
+        return lines
+
+    def layout(self, table):
+        """Column widths and the column groups that fit side by side on a page."""
+        o = self.options
+        pad = 2 * o["padding"]
+        usable = self.page_width - 2 * o["margin"]
+        widths = {}
+        for col, cells in table.items():
+            content = max((self.text_width(c) for c in cells), default=0)
+            header = max(self.text_width(word) for word in col.split(" "))
+            widths[col] = min(max(content, header) + pad, o["max_column_width"], usable)
+        key = o["key_column"] if o["key_column"] in table else None
+        groups, group, used = [], [], widths[key] if key else 0
+        for col in table:
+            if col == key:
+                continue
+            if group and used + widths[col] > usable:
+                groups.append(group)
+                group, used = [], widths[key] if key else 0
+            group.append(col)
+            used += widths[col]
+        if group or not groups:
+            groups.append(group)
+        if key:
+            groups = [[key] + g for g in groups]
+        return widths, groups
+
+    def _draw_block(self, pdf, top, columns, widths, header, rows, numeric):
+        """Draw the header and rows (lists of wrapped lines per column) starting at top."""
+        o = self.options
+        x0, pad, lh = o["margin"], o["padding"], self.line_height
+        right = x0 + sum(widths[c] for c in columns)
+        y = top
+        for r, (height, cells) in enumerate([header] + rows):
+            x = x0
+            for col, lines in zip(columns, cells):
+                align_right = r > 0 and col in numeric
+                for k, line in enumerate(lines):
+                    if line:
+                        tx = x + widths[col] - pad - self.text_width(line) if align_right else x + pad
+                        pdf.text(tx, y + pad + (k + 0.8) * lh, line)
+                x += widths[col]
+            y += height
+            pdf.line(x0, y, right, y)
+        pdf.line(x0, top, right, top)
+        x = x0
+        for col in columns:
+            pdf.line(x, top, x, y)
+            x += widths[col]
+        pdf.line(right, top, right, y)
+
+    def _render(self, projection_df, title=None):
+        o = self.options
+        table, numeric = self.string_table(projection_df)
+        widths, groups = self.layout(table)
+        pad, lh = 2 * o["padding"], self.line_height
+        bottom = self.page_height - o["margin"]
+        n = len(projection_df)
+        pdf = self._new_document()
+        for g, columns in enumerate(groups):
+            header_cells = [self.wrap(col, widths[col] - pad) for col in columns]
+            header = (max(len(c) for c in header_cells) * lh + pad, header_cells)
+            rows = []
+            for i in range(n):
+                cells = [self.wrap(table[col][i], widths[col] - pad) for col in columns]
+                rows.append((max(len(c) for c in cells) * lh + pad, cells))
+            start = 0
+            while True:
+                pdf.add_page()
+                top = o["margin"]
+                if title and start == 0:
+                    label = title if len(groups) == 1 else f"{title} (columns {g + 1}/{len(groups)})"
+                    if not o["font_path"]:
+                        label = label.translate(PDF_CORE_TEXT).encode("latin-1", "replace").decode("latin-1")
+                    pdf.text(o["margin"], top + lh, label)
+                    top += 2 * lh
+                y, stop = top + header[0], start
+                while stop < n and (stop == start or y + rows[stop][0] <= bottom):
+                    y += rows[stop][0]
+                    stop += 1
+                self._draw_block(pdf, top, columns, widths, header, rows[start:stop], numeric)
+                start = stop
+                if start >= n:
+                    break
+        self.pages_rendered += pdf.pages_count
+        return pdf
+
+    def render(self, projection_df, title=None):
+        """PDF bytes of a projection table, paginated and split into column groups."""
+        return bytes(self._render(projection_df, title).output())
+
+_PDF_TEMPLATE = None
+
+def pdf_report_template():
+    """Process-wide default template, so metrics and measured strings are shared."""
+    global _PDF_TEMPLATE
+    if _PDF_TEMPLATE is None:
+        _PDF_TEMPLATE = PDFReportTemplate()
+    return _PDF_TEMPLATE
+
+def batch_reports(batch, name="client_{}"):
+    """(name, rows) pairs for every profile of a BatchProjection, for bulk_pdf_reports."""
+    for i in range(len(batch)):
+        yield name.format(batch.index[i]), batch.rows(i)
+
+def _pdf_report_chunk(task):
+    import pandas as pd
+    reports, options, directory = task
+    template = PDFReportTemplate(**options) if options else pdf_report_template()
+    pages_before = template.pages_rendered
+    rendered = []
+    for name, projection in reports:
+        data = template.render(pd.DataFrame(projection), title=f"Financial Projection - {name}")
+        if directory:
+            with open(os.path.join(directory, f"{name}.pdf"), "wb") as f:
+                f.write(data)
+            data = None
+        rendered.append((name, data))
+    return rendered, template.pages_rendered - pages_before
+
+def bulk_pdf_reports(reports, target, workers=None, chunk_size=16, options=None):
+    """
+    Render many client reports in parallel. `reports` yields (name, projection)
+    pairs (rows or a DataFrame), e.g. batch_reports(batch). `target` is a .zip
+    path (one PDF per client inside) or a directory. Returns timing statistics.
+    """
+    import zipfile
+    workers = workers or PARALLEL_DEFAULTS["workers"]
+    to_zip = str(target).endswith(".zip")
+    directory = None if to_zip else str(target)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    reports = list(reports)
+    tasks = [(reports[i:i + chunk_size], options, directory) for i in range(0, len(reports), chunk_size)]
+    start = time.perf_counter()
+    pages = 0
+    # PDF streams are already deflated, so the archive only stores them
+    archive = zipfile.ZipFile(target, "w", zipfile.ZIP_STORED) if to_zip else None
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(tasks))) if workers > 1 and len(tasks) > 1 else None
+    try:
+        for rendered, chunk_pages in (pool.map if pool else map)(_pdf_report_chunk, tasks):
+            pages += chunk_pages
+            if archive:
+                for name, data in rendered:
+                    archive.writestr(f"{name}.pdf", data)
+    finally:
+        if pool:
+            pool.shutdown()
+        if archive:
+            archive.close()
+    seconds = time.perf_counter() - start
+    return {"reports": len(reports), "pages": pages, "seconds": seconds, "pages_per_sec": pages / seconds if seconds else float("inf")}
+
+def benchmark_pdf_reports(reports, target, worker_counts=None, repeat=3, chunk_size=16):
+    """Pages per second of bulk_pdf_reports for each worker count."""
+    worker_counts = worker_counts or sorted({1, PARALLEL_DEFAULTS["workers"]})
+    reports = list(reports)
+    results = []
+    for workers in worker_counts:
+        best = None
+        for _ in range(repeat):
+            stats = bulk_pdf_reports(reports, target, workers=workers, chunk_size=chunk_size)
+            if best is None or stats["seconds"] < best["seconds"]:
+                best = stats
+        results.append(dict(best, workers=workers))
+    return results
+
+@timed("excel_report")
+def generate_excel_report(projection_df):
+    projection_df = projection_frame(projection_df)
+    buffer = io.BytesIO()
+    sink = XLSXSink(buffer, fields=list(projection_df.columns))
+    sink.write_frame(projection_df)
+    sink.close()
+    return buffer.getvalue()
+
+@timed("pdf_report")
+def generate_pdf_report(projection_df):
+    projection_df = projection_frame(projection_df)
+    return pdf_report_template().render(projection_df, title="Financial Projection Report")
+
+# -----------------------------------------------------------------------------
+# CHART DATA
+# -----------------------------------------------------------------------------
+# Charts are drawn from frames aggregated here rather than from raw rows: per-year
+# percentile bands across many profiles or paths, and LTTB-downsampled series for
+# long ones, so what reaches Vega stays within CHART_MAX_POINTS however large the
+# result. Aggregated frames can be cached under a digest of their source arrays.
+CHART_MAX_POINTS = 2000
+CHART_PERCENTILES = (5, 25, 50, 75, 95)
+
+def chart_data_key(kind, *arrays, **params):
+    """Digest of the array contents, shapes and dtypes and the aggregation parameters."""
+    digest = hashlib.sha256(json.dumps({"kind": kind, "params": _canonical(params)}, sort_keys=True, default=str).encode("utf-8"))
+    for values in arrays:
+        values = np.ascontiguousarray(values)
+        digest.update(f"{values.dtype.str}{values.shape}".encode("utf-8"))
+        digest.update(values)
+    return digest.hexdigest()
+
+def cached_chart_frame(cache, build, *arrays, **params):
+    """build(*arrays, **params), looked up in cache (a ProjectionCache, or None for no caching) by content."""
+    if cache is None:
+        return build(*arrays, **params)
+    return cache.get_or_compute(chart_data_key(build.__qualname__, *arrays, **params), lambda: build(*arrays, **params))
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the threshold points Largest-Triangle-Three-Buckets keeps to draw
+    y over x: the ends, plus the point of each bucket of interior points forming
+    the largest triangle with the previous pick and the next bucket's mean.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    picked = 0
+    for b in range(threshold - 2):
+        lo, hi = edges[b], edges[b + 1]
+        next_x, next_y = (mean_x[b + 1], mean_y[b + 1]) if b + 3 < threshold else (x[-1], y[-1])
+        area = np.abs((x[picked] - next_x) * (y[lo:hi] - y[picked]) - (x[picked] - x[lo:hi]) * (next_y - y[picked]))
+        picked = lo + int(np.argmax(area))
+        keep[b + 1] = picked
+    return keep
+
+def downsample_frame(df, x, columns=None, max_points=CHART_MAX_POINTS, by=None):
+    """
+    At most max_points rows of df, sorted by x, chosen by LTTB on each of columns
+    (default: every numeric column but x) with the budget shared between them.
+    With by, each series gets an equal share of the budget.
+    """
+    import pandas as pd
+    if by is not None:
+        groups = [group for _, group in df.groupby(by, sort=False)]
+        budget = max(max_points // max(len(groups), 1), 3)
+        return pd.concat([downsample_frame(group, x, columns, budget) for group in groups], ignore_index=True)
+    if len(df) <= max_points:
+        return df
+    df = df.sort_values(x, kind="stable")
+    columns = columns or [col for col in df.columns if col != x and df[col].dtype.kind in "iuf"]
+    xs = df[x].to_numpy(dtype=float)
+    budget = max(max_points // max(len(columns), 1), 3)
+    keep = np.unique(np.concatenate([lttb_indices(xs, df[col].to_numpy(dtype=float), budget) for col in columns]))
+    return df.iloc[keep].reset_index(drop=True)
+
+def percentile_band_frame(values, x, percentiles=CHART_PERCENTILES, x_name="Year"):
+    """Per-column percentiles, mean and count over the rows of an (N, len(x)) array, ignoring NaN cells."""
+    import pandas as pd
+    values = np.asarray(values, dtype=float)
+    counts = (~np.isnan(values)).sum(axis=0)
+    if counts.min(initial=len(values)) == len(values):
+        bands, mean = np.percentile(values, percentiles, axis=0), values.mean(axis=0)
+    else:
+        # Columns past every horizon are all NaN and stay NaN
+        with np.errstate(all="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            bands, mean = np.nanpercentile(values, percentiles, axis=0), np.nanmean(values, axis=0)
+    return pd.DataFrame({x_name: np.asarray(x), **{f"P{p}": band for p, band in zip(percentiles, bands)}, "Mean": mean, "Count": counts})
+
+def batch_band_frame(batch, field="Corpus", percentiles=CHART_PERCENTILES, cache=None):
+    """Per-year percentile bands of a field across every profile of a BatchProjection."""
+    x = batch.assumptions["start_year"] + np.arange(batch.years)
+    return cached_chart_frame(cache, percentile_band_frame, batch.arrays[field], x, percentiles=tuple(percentiles))
+
+def band_chart(bands, title, y_title="Financial Corpus (₹)"):
+    """Outer and inner percentile bands with the median line, from a percentile band frame."""
+    import altair as alt
+    levels = sorted(int(col[1:]) for col in bands.columns if col.startswith("P") and col[1:].isdigit())
+    base = alt.Chart(bands).encode(x="Year:O")
+    layers = [base.mark_area(opacity=0.2).encode(y=alt.Y(f"P{levels[0]}:Q", title=y_title), y2=f"P{levels[-1]}:Q",
+                                                 tooltip=["Year", f"P{levels[0]}", f"P{levels[-1]}"])]
+    if len(levels) >= 4:
+        layers.append(base.mark_area(opacity=0.3).encode(y=f"P{levels[1]}:Q", y2=f"P{levels[-2]}:Q"))
+    if 50 in levels:
+        layers.append(base.mark_line(point=True).encode(y="P50:Q", tooltip=["Year", "P50"]))
+    return alt.layer(*layers).properties(title=title)
+
+def portfolio_allocation_chart(result, household=0, path=0):
+    """Stacked area of one household's portfolio by asset class."""
+    import altair as alt
+    classes = [asset_class_label(name) for name in result["classes"]]
+    frame = portfolio_frame(result, household, path).melt(id_vars="Year", value_vars=classes, var_name="Asset Class", value_name="Value")
+    return alt.Chart(frame).mark_area().encode(
+        x="Year:O",
+        y=alt.Y("Value:Q", stack=True, title="Portfolio Value (₹)"),
+        color=alt.Color("Asset Class:N", sort=classes),
+        tooltip=["Year", "Asset Class", alt.Tooltip("Value:Q", format=",.0f")]
+    ).properties(title="Portfolio by Asset Class")
+
+@timed("charts")
+def projection_charts(projection):
+    """Corpus line chart and investment bar chart of a projection."""
+    import altair as alt
+    df = downsample_frame(projection_frame(projection)[["Year", "Corpus", "Income", "Savings", "Investment Value"]], "Year")
+    line_chart = alt.Chart(df).mark_line(point=True).encode(
+        x="Year:O",
+        y=alt.Y("Corpus:Q", title="Financial Corpus (₹)"),
+        tooltip=["Year", "Corpus", "Income", "Savings"]
+    ).properties(title="Corpus Evolution Over Simulation Years")
+    bar_chart = alt.Chart(df).mark_bar().encode(
+        x="Year:O",
+        y=alt.Y("Investment Value:Q", title="Investment Value (₹)"),
+        tooltip=["Year", "Investment Value"]
+    ).properties(title="Investment Value Over Time")
+    return line_chart, bar_chart
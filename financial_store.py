@@ -0,0 +1,375 @@
+"""
+Result cache (in memory and on disk) and the SQLite store of client profiles,
+input versions and projection results. Both key results on the engine
+fingerprint, so a changed engine or tax slab never serves stale projections.
+"""
+import json
+import logging
+import os
+import pickle
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from financial_core import (DEFAULT_ASSUMPTIONS, PROJECTION_FIELDS, ProjectionResult, _canonical, content_hash,
+                            engine_fingerprint, simulate_monte_carlo, simulate_yearly_projection)
+
+logger = logging.getLogger(__name__)
+
+# Public names
+__all__ = [
+    "projection_cache_key", "ProjectionCache", "cached_yearly_projection", "cached_monte_carlo", "pack_projection",
+    "unpack_projection", "ProjectionStore",
+]
+
+# -----------------------------------------------------------------------------
+# RESULT CACHE
+# -----------------------------------------------------------------------------
+def projection_cache_key(kind, all_inputs, assumptions=None, **params):
+    """Content hash of the inputs, the full assumption set, the engine fingerprint and any run parameters."""
+    a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+    return content_hash({
+        "kind": kind,
+        "engine": engine_fingerprint(a),
+        "inputs": all_inputs,
+        "assumptions": a,
+        "params": params,
+    })
+
+_MISSING = object()
+
+class ProjectionCache:
+    """
+    Two-tier cache of simulation results: an in-memory LRU of max_entries and,
+    when disk_dir is given, pickled files evicted oldest-first once they exceed
+    max_disk_bytes.
+    """
+    def __init__(self, max_entries=128, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key, default=None):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats["hits"] += 1
+            return self.memory[key]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                logger.warning(f"Discarding unreadable cache entry {path}")
+            else:
+                os.utime(path)
+                self.stats["disk_hits"] += 1
+                self._remember(key, value)
+                return value
+        self.stats["misses"] += 1
+        return default
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._disk_path(key))
+            self._evict_disk()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(os.path.join(self.disk_dir, name))
+            total -= size
+            self.stats["disk_evictions"] += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+def cached_yearly_projection(all_inputs, cache, assumptions=None):
+    """simulate_yearly_projection through a ProjectionCache; returns fresh row dicts."""
+    key = projection_cache_key("yearly_projection", all_inputs, assumptions)
+    rows = cache.get_or_compute(key, lambda: simulate_yearly_projection(all_inputs, assumptions=assumptions))
+    return [dict(row) for row in rows]
+
+def cached_monte_carlo(all_inputs, cache, assumptions=None, **params):
+    """simulate_monte_carlo through a ProjectionCache; cached only when a seed is given."""
+    if params.get("seed") is None:
+        return simulate_monte_carlo(all_inputs, assumptions=assumptions, **params)
+    key = projection_cache_key("monte_carlo", all_inputs, assumptions, **params)
+    return cache.get_or_compute(key, lambda: simulate_monte_carlo(all_inputs, assumptions=assumptions, **params))
+
+# -----------------------------------------------------------------------------
+# PROJECTION STORE
+# -----------------------------------------------------------------------------
+# Client profiles, their input versions and projection results in SQLite.
+# Inputs, assumption sets and projections are stored once by content hash (a
+# projection is unique per input version, scenario, assumption hash and engine
+# version); every save appends a dated row to a log pointing at them, so "as of"
+# queries see the history even when a client's inputs go back to an earlier
+# version. Run rows carry the final and minimum Corpus, so cross-client questions
+# ("who is short of target?") are answered from indexes without unpacking or
+# re-simulating anything. Projections are packed column bytes, not pickles.
+def pack_projection(result):
+    """Compressed bytes of a ProjectionResult: a JSON header with the text columns, then float64 and int16 columns."""
+    fields = result.fields
+    ints = [name for name in fields if name in ProjectionResult.INT_FIELDS]
+    floats = [name for name in fields if name not in ints and name not in ProjectionResult.TEXT_FIELDS]
+    header = json.dumps({"fields": fields, "floats": floats, "ints": ints, "length": len(result),
+                         "text": {name: list(result[name]) for name in fields if name in ProjectionResult.TEXT_FIELDS}}).encode("utf-8")
+    float_bytes = np.array([result[name] for name in floats], dtype="<f8").tobytes()
+    int_bytes = np.array([result[name] for name in ints], dtype="<i2").tobytes()
+    return zlib.compress(len(header).to_bytes(4, "little") + header + float_bytes + int_bytes, 1)
+
+def unpack_projection(blob):
+    data = zlib.decompress(blob)
+    size = int.from_bytes(data[:4], "little")
+    header = json.loads(data[4:4 + size])
+    n, offset = header["length"], 4 + size
+    floats = np.frombuffer(data, dtype="<f8", count=len(header["floats"]) * n, offset=offset).reshape(len(header["floats"]), n)
+    ints = np.frombuffer(data, dtype="<i2", count=len(header["ints"]) * n, offset=offset + floats.nbytes).reshape(len(header["ints"]), n)
+    columns = dict(zip(header["floats"], floats))
+    columns.update(zip(header["ints"], ints))
+    columns.update(header["text"])
+    return ProjectionResult({name: columns[name] for name in header["fields"]})
+
+class ProjectionStore:
+    """
+    Embedded store of profiles and results (path is a SQLite file, or
+    ":memory:"). Bulk paths (save_profiles, save_results, save_batch,
+    load_results) run in one transaction / one query each.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS input_versions (
+        version_id INTEGER PRIMARY KEY, client_id TEXT NOT NULL, inputs_hash TEXT NOT NULL, inputs TEXT NOT NULL,
+        UNIQUE (client_id, inputs_hash));
+    CREATE TABLE IF NOT EXISTS profile_saves (
+        client_id TEXT NOT NULL, version_id INTEGER NOT NULL REFERENCES input_versions (version_id), created REAL NOT NULL);
+    CREATE TABLE IF NOT EXISTS assumption_sets (assumptions_hash TEXT PRIMARY KEY, assumptions TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS projections (
+        projection_id INTEGER PRIMARY KEY, version_id INTEGER NOT NULL REFERENCES input_versions (version_id),
+        scenario TEXT NOT NULL, assumptions_hash TEXT NOT NULL REFERENCES assumption_sets (assumptions_hash),
+        engine_version TEXT NOT NULL, years INTEGER NOT NULL, projection BLOB NOT NULL,
+        UNIQUE (version_id, scenario, assumptions_hash, engine_version));
+    CREATE TABLE IF NOT EXISTS results (
+        result_id INTEGER PRIMARY KEY, client_id TEXT NOT NULL, scenario TEXT NOT NULL, assumptions_hash TEXT NOT NULL,
+        projection_id INTEGER NOT NULL REFERENCES projections (projection_id), created REAL NOT NULL,
+        final_corpus REAL, min_corpus REAL);
+    CREATE INDEX IF NOT EXISTS saves_by_client ON profile_saves (client_id, created);
+    CREATE INDEX IF NOT EXISTS results_by_client ON results (client_id, scenario, created);
+    CREATE INDEX IF NOT EXISTS results_by_assumptions ON results (assumptions_hash, scenario, created);
+    CREATE INDEX IF NOT EXISTS results_by_corpus ON results (scenario, final_corpus);
+    """
+    # Latest result per client as of a time, for one scenario (and optionally one assumption set)
+    LATEST = """
+    SELECT * FROM (
+        SELECT r.*, ROW_NUMBER() OVER (PARTITION BY r.client_id ORDER BY r.created DESC, r.result_id DESC) AS recency
+        FROM results r WHERE r.scenario = ? AND r.created <= ? {where})
+    WHERE recency = 1 ORDER BY client_id
+    """
+
+    def __init__(self, path=":memory:"):
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        self.db.execute("CREATE TEMP TABLE keys (client_id TEXT, key TEXT)")
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _join_keys(self, pairs, query, params=()):
+        # Bulk lookup: load (client_id, key) pairs into a temp table and join against it
+        self.db.execute("DELETE FROM keys")
+        self.db.executemany("INSERT INTO keys VALUES (?, ?)", pairs)
+        return self.db.execute(query, params).fetchall()
+
+    @staticmethod
+    def _as_of(as_of):
+        return float("inf") if as_of is None else as_of
+
+    # -- profiles -------------------------------------------------------------
+    def _save_profiles(self, profiles, created):
+        rows = [(str(client_id), content_hash(inputs), inputs) for client_id, inputs in profiles.items()]
+        self.db.executemany("INSERT OR IGNORE INTO input_versions (client_id, inputs_hash, inputs) VALUES (?, ?, ?)",
+                            [(client_id, key, json.dumps(inputs)) for client_id, key, inputs in rows])
+        versions = dict(self._join_keys([r[:2] for r in rows], "SELECT v.client_id, v.version_id FROM keys k JOIN input_versions v "
+                                                               "ON v.client_id = k.client_id AND v.inputs_hash = k.key"))
+        self.db.executemany("INSERT INTO profile_saves VALUES (?, ?, ?)", [(client_id, versions[client_id], created) for client_id in versions])
+        return versions
+
+    def save_profiles(self, profiles, created=None):
+        """Store {client_id: all_inputs}; returns {client_id: version_id}, reusing versions with identical inputs."""
+        with self.db:
+            return self._save_profiles(profiles, time.time() if created is None else created)
+
+    def save_profile(self, client_id, all_inputs, created=None):
+        return self.save_profiles({client_id: all_inputs}, created)[str(client_id)]
+
+    def load_profile(self, client_id, as_of=None):
+        """Latest all_inputs saved for a client (as of a time), or None."""
+        row = self.db.execute("""
+            SELECT v.inputs FROM profile_saves s JOIN input_versions v ON v.version_id = s.version_id
+            WHERE s.client_id = ? AND s.created <= ? ORDER BY s.created DESC, s.rowid DESC LIMIT 1""",
+            (str(client_id), self._as_of(as_of))).fetchone()
+        return json.loads(row["inputs"]) if row else None
+
+    def profile_history(self, client_id):
+        """(created, version_id, inputs_hash) of every save of a client, oldest first."""
+        return [tuple(row) for row in self.db.execute("""
+            SELECT s.created, s.version_id, v.inputs_hash FROM profile_saves s JOIN input_versions v ON v.version_id = s.version_id
+            WHERE s.client_id = ? ORDER BY s.created, s.rowid""", (str(client_id),))]
+
+    # -- results --------------------------------------------------------------
+    def save_results(self, records, scenario="base", assumptions=None, created=None):
+        """
+        Store (client_id, all_inputs, ProjectionResult) records computed under one
+        scenario and assumption set, dated created (default now). Projections
+        already stored for the same inputs, assumptions and engine version are
+        referenced rather than packed again.
+        """
+        created = time.time() if created is None else created
+        records = {str(client_id): (inputs, result) for client_id, inputs, result in records}
+        a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+        a_hash = content_hash(a)
+        projection_query = ("SELECT k.client_id, p.projection_id FROM keys k JOIN projections p ON p.version_id = CAST(k.key AS INTEGER) "
+                            "AND p.scenario = ? AND p.assumptions_hash = ? AND p.engine_version = ?")
+        engine = engine_fingerprint(a)
+        projection_params = (scenario, a_hash, engine)
+        with self.db:
+            versions = self._save_profiles({client_id: inputs for client_id, (inputs, _) in records.items()}, created)
+            self.db.execute("INSERT OR IGNORE INTO assumption_sets VALUES (?, ?)", (a_hash, json.dumps(_canonical(a), sort_keys=True)))
+            keys = [(client_id, str(version)) for client_id, version in versions.items()]
+            stored = dict(self._join_keys(keys, projection_query, projection_params))
+            self.db.executemany("INSERT OR IGNORE INTO projections (version_id, scenario, assumptions_hash, engine_version, years, projection) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                [(versions[client_id], scenario, a_hash, engine, len(result), pack_projection(result))
+                                 for client_id, (_, result) in records.items() if client_id not in stored])
+            projection_ids = dict(self._join_keys(keys, projection_query, projection_params)) if len(stored) < len(records) else stored
+            rows = []
+            for client_id, (_, result) in records.items():
+                corpus = result["Corpus"] if len(result) else None
+                rows.append((client_id, scenario, a_hash, projection_ids[client_id], created,
+                             None if corpus is None else float(corpus[-1]), None if corpus is None else float(corpus.min())))
+            self.db.executemany("INSERT INTO results (client_id, scenario, assumptions_hash, projection_id, created, final_corpus, min_corpus) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def save_batch(self, batch, profiles, scenario="base", created=None):
+        """Store every projection of a BatchProjection; profiles is {client_id: all_inputs} in batch order."""
+        records = [(client_id, inputs, batch.result(i)) for i, (client_id, inputs) in enumerate(profiles.items())]
+        return self.save_results(records, scenario, batch.assumptions, created)
+
+    def find_result(self, client_id, all_inputs, assumptions=None, scenario="base"):
+        """Stored projection for exactly these inputs and assumptions under the current engine, or None."""
+        a = dict(DEFAULT_ASSUMPTIONS, **(assumptions or {}))
+        row = self.db.execute("""
+            SELECT p.projection FROM projections p JOIN input_versions v ON v.version_id = p.version_id
+            WHERE v.client_id = ? AND v.inputs_hash = ? AND p.scenario = ? AND p.assumptions_hash = ? AND p.engine_version = ?""",
+            (str(client_id), content_hash(all_inputs), scenario, content_hash(a), engine_fingerprint(a))).fetchone()
+        return unpack_projection(row["projection"]) if row else None
+
+    def get_or_simulate(self, client_id, all_inputs, assumptions=None, scenario="base"):
+        """The stored projection for these inputs, simulating and storing it only when missing."""
+        result = self.find_result(client_id, all_inputs, assumptions, scenario)
+        if result is None:
+            result = ProjectionResult.from_rows(simulate_yearly_projection(all_inputs, assumptions=assumptions))
+            self.save_results([(client_id, all_inputs, result)], scenario, assumptions)
+        return result
+
+    def result_history(self, client_id, scenario="base"):
+        """Every stored result of a client for a scenario, oldest first: created, assumptions_hash, final and minimum Corpus."""
+        return [dict(row) for row in self.db.execute("""
+            SELECT created, assumptions_hash, final_corpus, min_corpus FROM results
+            WHERE client_id = ? AND scenario = ? ORDER BY created, result_id""", (str(client_id), scenario))]
+
+    def _latest(self, scenario, as_of, assumptions, columns="*", join=""):
+        where, args = "", [scenario, self._as_of(as_of)]
+        if assumptions is not None:
+            where = "AND r.assumptions_hash = ?"
+            args.append(content_hash(dict(DEFAULT_ASSUMPTIONS, **assumptions)))
+        return self.db.execute(f"SELECT {columns} FROM ({self.LATEST.format(where=where)}) latest {join}", args)
+
+    def summaries(self, scenario="base", as_of=None, assumptions=None):
+        """Latest result per client as of a time: client_id, created, assumptions_hash, final and minimum Corpus."""
+        return [dict(row) for row in self._latest(scenario, as_of, assumptions,
+                                                  "client_id, created, assumptions_hash, final_corpus, min_corpus")]
+
+    def clients_below(self, target, scenario="base", as_of=None, assumptions=None, field="final_corpus"):
+        """(client_id, corpus) of clients whose latest final (or minimum, with field="min_corpus") Corpus is below target."""
+        if field not in ("final_corpus", "min_corpus"):
+            raise ValueError("field must be 'final_corpus' or 'min_corpus'.")
+        return [tuple(row) for row in self._latest(scenario, as_of, assumptions, f"client_id, {field}")
+                if row[field] is not None and row[field] < target]
+
+    def load_results(self, client_ids=None, scenario="base", as_of=None, assumptions=None):
+        """{client_id: ProjectionResult} of the latest results as of a time, for the given clients or all of them."""
+        rows = self._latest(scenario, as_of, assumptions, "latest.client_id, p.projection",
+                            "JOIN projections p ON p.projection_id = latest.projection_id")
+        wanted = None if client_ids is None else {str(client_id) for client_id in client_ids}
+        return {client_id: unpack_projection(blob) for client_id, blob in rows if wanted is None or client_id in wanted}
+
+    def results_frame(self, client_ids=None, scenario="base", as_of=None, assumptions=None):
+        """Long DataFrame of the latest results with a Client column."""
+        import pandas as pd
+        frames = [result.frame().assign(Client=client_id) for client_id, result in
+                  self.load_results(client_ids, scenario, as_of, assumptions).items()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Client"] + PROJECTION_FIELDS)
+
+    def compare(self, client_ids=None, scenario="base", before=None, after=None, assumptions=None):
+        """
+        Latest result per client as of `before` against the latest as of `after`
+        (default now): {client_id: (before_final_corpus, after_final_corpus)}.
+        """
+        old = {row["client_id"]: row["final_corpus"] for row in self.summaries(scenario, before, assumptions)}
+        new = {row["client_id"]: row["final_corpus"] for row in self.summaries(scenario, after, assumptions)}
+        wanted = new.keys() | old.keys() if client_ids is None else [str(client_id) for client_id in client_ids]
+        return {client_id: (old.get(client_id), new.get(client_id)) for client_id in sorted(wanted)}
@@ -0,0 +1,411 @@
+"""
+Local HTTP/JSON projection service built on asyncio and the headless engine.
+
+    python projection_service.py --port 8765 --workers 4
+
+POST /project      {"inputs": all_inputs, "assumptions": {...}}  -> {"rows": [...]}
+                   {"profiles": [all_inputs, ...], "assumptions": {...}} -> {"results": [{"rows": [...]}, ...]}
+POST /monte-carlo  {"inputs": all_inputs, "assumptions": {...}, "paths": 10000, "seed": 1}  (paths up to max_paths)
+GET  /stats        latency percentiles, batch sizes, queue depth and cache hits
+GET  /metrics      stage timing histograms and counters in Prometheus text (with --metrics)
+GET  /health
+
+Projection requests that arrive within a short window are micro-batched: every
+profile collected in the window with the same assumptions goes through one
+vectorized batch call in a worker process, which also encodes the JSON, so the
+event loop only parses requests and writes bytes. At most `max_pending` profiles
+may wait or run at once; beyond that requests get 503 with Retry-After.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from financial_core import METRICS, PROFILE_DEFAULTS, profile_from_inputs, simulate_batch_projection, simulate_monte_carlo
+from financial_parallel import PARALLEL_DEFAULTS
+from financial_store import ProjectionCache, projection_cache_key
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DEFAULTS = {"batch_window": 0.005, "max_batch": 512, "max_pending": 4096, "max_body": 8 * 1024 * 1024,
+                    "idle_timeout": 30.0, "cache_entries": 4096, "max_paths": 100000}
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class Overloaded(Exception):
+    """Raised when accepting a request would exceed the pending-work limit."""
+
+# -----------------------------------------------------------------------------
+# WORKER JOBS
+# -----------------------------------------------------------------------------
+# Run in the process pool. Profiles travel as all_inputs dicts and results come
+# back as encoded JSON bodies; the batch table is a dict of columns, so workers
+# only need numpy. With metrics enabled, each job also returns the worker's
+# stage timings since its last job, merged into the service's registry.
+def _init_worker(metrics):
+    METRICS.enable(metrics)
+
+def _worker_metrics():
+    return METRICS.snapshot(reset=True) if METRICS.enabled else None
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def _project_batch(inputs_list, assumptions):
+    profiles = [profile_from_inputs(inputs) for inputs in inputs_list]
+    table = {name: [profile[name] for profile in profiles] for name in PROFILE_DEFAULTS}
+    batch = simulate_batch_projection(table, assumptions)
+    with METRICS.stage("service.encode"):
+        bodies = [json.dumps({"rows": batch.rows(i)}).encode() for i in range(len(batch))]
+    return bodies, _worker_metrics()
+
+def _monte_carlo_job(inputs, assumptions, paths, seed):
+    result = simulate_monte_carlo(inputs, n_paths=paths, seed=seed, assumptions=assumptions)
+    return json.dumps(result, default=_json_default).encode(), _worker_metrics()
+
+# -----------------------------------------------------------------------------
+# STATISTICS
+# -----------------------------------------------------------------------------
+class LatencyStats:
+    """Latencies of the most recent `window` requests per route, summarized as percentiles."""
+    def __init__(self, window=10000, percentiles=(50, 90, 99)):
+        self.window = window
+        self.percentiles = percentiles
+        self.samples = {}
+        self.counts = {}
+
+    def observe(self, route, seconds):
+        self.samples.setdefault(route, deque(maxlen=self.window)).append(seconds)
+        self.counts[route] = self.counts.get(route, 0) + 1
+
+    def summary(self):
+        out = {}
+        for route, samples in self.samples.items():
+            ms = np.fromiter(samples, dtype=float, count=len(samples)) * 1000
+            out[route] = dict({"count": self.counts[route], "max_ms": float(ms.max())},
+                              **{f"p{p}_ms": float(v) for p, v in zip(self.percentiles, np.percentile(ms, self.percentiles))})
+        return out
+
+# -----------------------------------------------------------------------------
+# MICRO-BATCHING
+# -----------------------------------------------------------------------------
+class MicroBatcher:
+    """
+    Collects profiles for up to `window` seconds (or `max_batch` profiles) after
+    the first one arrives, then runs each group of equal assumptions as one batch
+    in the executor. At most `max_inflight` batches run at once; while they do,
+    new profiles keep queueing, so batches grow with load. A batch that fails
+    is rerun one profile at a time, so only the requests at fault get errors.
+    """
+    def __init__(self, executor, window=0.005, max_batch=512, max_inflight=2):
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue()
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.batch_sizes = deque(maxlen=1000)
+        self.batches = 0
+        self.retried = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def submit(self, inputs, assumptions):
+        """Future for the encoded {"rows": ...} body of one profile."""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((inputs, assumptions, future))
+        return future
+
+    async def _collect(self):
+        items = [await self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        while len(items) < self.max_batch and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+            groups = {}
+            for item in items:
+                groups.setdefault(json.dumps(item[1], sort_keys=True, default=str), []).append(item)
+            for group in groups.values():
+                await self.inflight.acquire()
+                asyncio.get_running_loop().create_task(self._execute(group))
+
+    async def _execute(self, group):
+        try:
+            self.batches += 1
+            self.batch_sizes.append(len(group))
+            await self._project_group(group)
+        finally:
+            self.inflight.release()
+
+    async def _project_group(self, group):
+        loop = asyncio.get_running_loop()
+        try:
+            bodies, worker_metrics = await loop.run_in_executor(self.executor, _project_batch, [item[0] for item in group], group[0][1])
+        except Exception as exc:
+            if len(group) > 1:
+                # One bad profile fails its whole batch; rerun each profile alone so only its request gets the error
+                self.retried += len(group)
+                await asyncio.gather(*(self._project_group([item]) for item in group))
+                return
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        METRICS.merge(worker_metrics)
+        for (_, _, future), body in zip(group, bodies):
+            if not future.done():
+                future.set_result(body)
+
+# -----------------------------------------------------------------------------
+# SERVICE
+# -----------------------------------------------------------------------------
+class ProjectionService:
+    def __init__(self, workers=None, executor=None, metrics=False, **options):
+        self.options = dict(SERVICE_DEFAULTS, **options)
+        self.workers = workers or PARALLEL_DEFAULTS["workers"]
+        if metrics:
+            METRICS.enable()
+        # Workers come from a fork server: a plain fork would copy open client sockets
+        # into each worker, and a "Connection: close" response would never see EOF
+        self.executor = executor or ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"),
+                                                        initializer=_init_worker, initargs=(METRICS.enabled,))
+        self.owns_executor = executor is None
+        self.batcher = None
+        self.connections = set()
+        self.pending = 0
+        self.rejected = 0
+        self.latency = LatencyStats()
+        self.cache = ProjectionCache(max_entries=self.options["cache_entries"]) if self.options["cache_entries"] else None
+        self.routes = {("POST", "/project"): self.project, ("POST", "/monte-carlo"): self.monte_carlo,
+                       ("GET", "/stats"): self.stats, ("GET", "/metrics"): self.metrics, ("GET", "/health"): self.health}
+        self.content_types = {"/metrics": "text/plain; version=0.0.4; charset=utf-8"}
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.batcher = MicroBatcher(self.executor, self.options["batch_window"], self.options["max_batch"],
+                                    max_inflight=self.workers * 2)
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._connection, host, port)
+        logger.info(f"Serving projections on {', '.join(str(s.getsockname()) for s in self.server.sockets)}")
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        for task in self.connections:
+            task.cancel()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await self.server.wait_closed()
+        await self.batcher.stop()
+        if self.owns_executor:
+            self.executor.shutdown()
+
+    def _reserve(self, count):
+        if self.pending + count > self.options["max_pending"]:
+            self.rejected += 1
+            raise Overloaded(f"{self.pending} profiles pending; retry later.")
+        self.pending += count
+
+    # -- routes -------------------------------------------------------------
+    async def project(self, request):
+        assumptions = request.get("assumptions") or {}
+        single = "profiles" not in request
+        profiles = [request.get("inputs") or {}] if single else request["profiles"]
+        if not isinstance(profiles, list) or not all(isinstance(p, dict) for p in profiles):
+            raise ValueError("'profiles' must be a list of all_inputs objects.")
+        self._reserve(len(profiles))
+        try:
+            bodies = await asyncio.gather(*(self._project_one(inputs, assumptions) for inputs in profiles))
+        finally:
+            self.pending -= len(profiles)
+        return bodies[0] if single else b'{"results": [' + b", ".join(bodies) + b"]}"
+
+    async def _project_one(self, inputs, assumptions):
+        key = projection_cache_key("service_rows", inputs, assumptions) if self.cache else None
+        body = self.cache.get(key) if key else None
+        if body is None:
+            body = await self.batcher.submit(inputs, assumptions)
+            if key:
+                self.cache.put(key, body)
+        return body
+
+    async def monte_carlo(self, request):
+        paths, seed = request.get("paths", 10000), request.get("seed")
+        # bool is an int subclass, so true/false are excluded explicitly
+        if isinstance(paths, bool) or not isinstance(paths, int) or not 1 <= paths <= self.options["max_paths"]:
+            raise ValueError(f"'paths' must be an integer from 1 to {self.options['max_paths']}.")
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            raise ValueError("'seed' must be a non-negative integer.")
+        self._reserve(1)
+        try:
+            loop = asyncio.get_running_loop()
+            body, worker_metrics = await loop.run_in_executor(self.executor, _monte_carlo_job, request.get("inputs") or {},
+                                                              request.get("assumptions") or {}, paths, seed)
+            METRICS.merge(worker_metrics)
+            return body
+        finally:
+            self.pending -= 1
+
+    async def stats(self, request):
+        sizes = self.batcher.batch_sizes
+        return json.dumps({
+            "latency": self.latency.summary(),
+            "pending": self.pending,
+            "queued": self.batcher.queue.qsize(),
+            "rejected": self.rejected,
+            "batches": self.batcher.batches,
+            "retried": self.batcher.retried,
+            "mean_batch_size": float(np.mean(sizes)) if sizes else 0.0,
+            "cache": dict(self.cache.stats) if self.cache else None,
+        }).encode()
+
+    async def metrics(self, request):
+        return METRICS.to_prometheus().encode()
+
+    async def health(self, request):
+        return b'{"status": "ok"}'
+
+    # -- HTTP ---------------------------------------------------------------
+    async def dispatch(self, method, path, body):
+        """(status, body, extra headers) for one request."""
+        route = path.split("?", 1)[0]
+        handler = self.routes.get((method, route))
+        if handler is None:
+            if any(r == route for _, r in self.routes):
+                return 405, _error("Method not allowed."), {}
+            return 404, _error(f"No route {route}."), {}
+        start = time.perf_counter()
+        try:
+            request = json.loads(body) if body else {}
+            if not isinstance(request, dict):
+                raise ValueError("Request body must be a JSON object.")
+            content_type = self.content_types.get(route)
+            return 200, await handler(request), {"Content-Type": content_type} if content_type else {}
+        except Overloaded as exc:
+            return 503, _error(str(exc)), {"Retry-After": "1"}
+        except ValueError as exc:
+            return 400, _error(str(exc)), {}
+        except Exception as exc:
+            logger.exception(f"{method} {route} failed")
+            return 500, _error(f"{type(exc).__name__}: {exc}"), {}
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.observe(route, elapsed)
+            if METRICS.enabled:
+                METRICS.observe(f"service.{route}", elapsed)
+
+    async def _connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.options["idle_timeout"])
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    await _respond(writer, 400, _error("Malformed request."), close=True)
+                    break
+                if method == "POST" and "content-length" not in headers:
+                    await _respond(writer, 411, _error("Content-Length required."), close=True)
+                    break
+                if length < 0:
+                    await _respond(writer, 400, _error("Invalid Content-Length."), close=True)
+                    break
+                if length > self.options["max_body"]:
+                    await _respond(writer, 413, _error("Request body too large."), close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                status, payload, extra = await self.dispatch(method, path, body)
+                await _respond(writer, status, payload, extra, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Cancelled only when the service closes; the connection just ends
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+def _error(message):
+    return json.dumps({"error": message}).encode()
+
+async def _respond(writer, status, body, extra=None, close=False):
+    headers = {"Content-Type": "application/json", "Content-Length": str(len(body)), "Connection": "close" if close else "keep-alive"}
+    headers.update(extra or {})
+    head = f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+async def serve(host="127.0.0.1", port=8765, workers=None, **options):
+    service = ProjectionService(workers=workers, **options)
+    server = await service.start(host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve financial projections over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--batch-window-ms", type=float, default=SERVICE_DEFAULTS["batch_window"] * 1000)
+    parser.add_argument("--max-batch", type=int, default=SERVICE_DEFAULTS["max_batch"])
+    parser.add_argument("--max-pending", type=int, default=SERVICE_DEFAULTS["max_pending"])
+    parser.add_argument("--max-paths", type=int, default=SERVICE_DEFAULTS["max_paths"], help="largest Monte Carlo request")
+    parser.add_argument("--metrics", action="store_true", help="collect stage timings, served at /metrics")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, batch_window=args.batch_window_ms / 1000,
+                          max_batch=args.max_batch, max_pending=args.max_pending, max_paths=args.max_paths, metrics=args.metrics))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,17 @@
+import os
 import streamlit as st
 import pandas as pd
-import altair as alt
 import logging
-from math import ceil
-from fpdf import FPDF
-import io
 
-# -----------------------------------------------------------------------------
-# Global Logging Setup (for development only; logs are printed in console)
-# -----------------------------------------------------------------------------
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# The engine and the modules around it are headless; the app builds its UI on them
+from financial_core import (METRICS, METRICS_ENV, IncrementalProjection, ProjectionResult, decumulation_frame,
+                            default_sensitivity_axes, get_tax_schedule, goal_seek, loan_schedule_frame, loans_from_inputs,
+                            monte_carlo_bands_frame, portfolio_bands, portfolio_frame, projection_frame, safe_withdrawal_rate,
+                            sensitivity_grid, sensitivity_heatmap, simulate_decumulation, simulate_household_portfolio,
+                            tax_regime_names, tornado_chart, tornado_frame, tornado_sensitivity)
+from financial_reports import (band_chart, generate_excel_report, generate_pdf_report, portfolio_allocation_chart,
+                               projection_charts)
+from financial_store import ProjectionCache, ProjectionStore, cached_monte_carlo, projection_cache_key
 
 # -----------------------------------------------------------------------------
 # Input Module
@@ -32,6 +34,13 @@ class InputModule:
             personal['age_of_marriage'] = st.sidebar.number_input("Desired Age of Marriage", min_value=personal['age']+1, value=32)
         else:
             personal['age_of_marriage'] = None
+            # Spouse details feed the household portfolio's cash flows
+            st.sidebar.markdown("**Spouse Details**")
+            personal['spouse'] = {
+                "age": st.sidebar.number_input("Spouse Age", min_value=18, max_value=100, value=personal['age'], key="spouse_age"),
+                "monthly_income": st.sidebar.number_input("Spouse Monthly Income (₹)", min_value=0.0, value=0.0, key="spouse_income"),
+                "retirement_age": st.sidebar.number_input("Spouse Retirement Age", min_value=40, max_value=100, value=60, key="spouse_ret_age"),
+            }
         
         # Children: allow adding children with age at birth
         st.sidebar.markdown("**Children Details**")
@@ -134,7 +143,12 @@ class InputModule:
             interest_rate = st.sidebar.number_input(f"Liability {i+1} Interest Rate (%)", min_value=0.0, value=9.0, key=f"liab_rate_{i}")
             remaining_term = st.sidebar.number_input(f"Liability {i+1} Remaining Term (months)", min_value=1, value=36, key=f"liab_term_{i}")
             amount = st.sidebar.number_input(f"Liability {i+1} Amount (₹)", min_value=0.0, value=300000.0, key=f"liab_amt_{i}")
-            liabilities.append({"liability_name": liab_name, "interest_rate": interest_rate, "remaining_term": remaining_term, "amount": amount, "min_payment": 10000})
+            prepayment = st.sidebar.number_input(f"Liability {i+1} Prepayment (₹)", min_value=0.0, value=0.0, key=f"liab_prepay_{i}")
+            prepay_month = st.sidebar.number_input(f"Liability {i+1} Prepayment Month", min_value=1, value=12, key=f"liab_prepay_month_{i}")
+            liability = {"liability_name": liab_name, "interest_rate": interest_rate, "remaining_term": remaining_term, "amount": amount, "min_payment": 10000}
+            if prepayment > 0:
+                liability["prepayments"] = [{"month": int(prepay_month), "amount": prepayment}]
+            liabilities.append(liability)
         assets_data["liabilities"] = liabilities
 
         self.inputs["assets_liabilities_investments"] = assets_data
@@ -162,384 +176,122 @@ class InputModule:
         self.inputs["emergency_fund"] = 500000
         return self.inputs
 
-# -----------------------------------------------------------------------------
-# ASSUMPTIONS & ANALYSIS MODULE
-# -----------------------------------------------------------------------------
-class AssumptionsAnalysis:
-    def __init__(self, inputs):
-        self.inputs = inputs
-        self.logs = []
-
-    def log(self, message):
-        self.logs.append(message)
-        logging.info(message)
-
-    def handle_marriage_event(self, annual_income):
-        pers = self.inputs.get("personal_information", {})
-        marriage_age = pers.get("age_of_marriage")
-        current_age = pers.get("age")
-        if marriage_age is None or marriage_age <= current_age:
-            raise ValueError("Invalid marriage age.")
-        years_until_marriage = marriage_age - current_age
-        scheduled_year = years_until_marriage
-        self.log(f"Marriage scheduled in simulation year: {scheduled_year}")
-
-        cost = max(1.8 * annual_income, 2000000)
-        self.log(f"Calculated marriage cost: {cost:.2f}")
-
-        reserved_inv = self.inputs.get("reserved_investments", 1000000)
-        emergency = self.inputs.get("emergency_fund", 500000)
-        if cost > 200000:
-            if reserved_inv >= cost:
-                funding_source = "Reserved Investments"
-                reserved_inv -= cost
-            else:
-                shortfall = cost - reserved_inv
-                funding_source = "Reserved Investments & Emergency Fund"
-                emergency -= shortfall
-            self.log(f"Marriage funded by {funding_source}. Updated reserves: Investments {reserved_inv}, Emergency {emergency}")
-        dti = self.calculate_DTI()
-        if dti > 0.4 or (reserved_inv + emergency) < cost:
-            self.log("Marriage event delayed due to insufficient funds or high DTI.")
-            scheduled_year += 1
-        return {"event": "Marriage", "scheduled_year": scheduled_year, "cost": cost, "logs": self.logs.copy()}
-
-    def handle_children_events(self):
-        pers = self.inputs.get("personal_information", {})
-        children = pers.get("children", [])
-        events = []
-        for i, child in enumerate(children):
-            scheduled_year = child.get("age_at_birth", 0) + 1
-            cost = 200000
-            events.append({"event": f"Child_{i+1}_Expense", "scheduled_year": scheduled_year, "cost": cost})
-            self.log(f"Scheduled one-time expense for Child {i+1} in year {scheduled_year} with cost {cost}.")
-        return events
-
-    def handle_unexpected_events(self, total_income, sim_year):
-        events = []
-        if sim_year % 3 == 0:
-            cost = 0.2 * total_income
-            events.append({"event": "Unexpected Expense", "scheduled_year": sim_year, "cost": cost})
-            self.log(f"Unexpected expense scheduled in year {sim_year} with cost {cost:.2f}.")
-        return events
-
-    def calculate_DTI(self):
-        career = self.inputs.get("career_income_details", {})
-        monthly_income = career.get("monthly_salary", 0)
-        liab = self.inputs.get("assets_liabilities_investments", {}).get("liabilities", [])
-        total_debt = sum([l.get("min_payment", l.get("amount", 0)/l.get("remaining_term", 1)) for l in liab])
-        dti = total_debt / monthly_income if monthly_income else 0
-        self.log(f"Calculated DTI: {dti:.2f}")
-        return dti
 
 # -----------------------------------------------------------------------------
-# DETAILED CALCULATION FORMULAS MODULE
+# STREAMLIT OUTPUT
 # -----------------------------------------------------------------------------
-class DetailedCalculations:
-    def __init__(self, verbose=False):
-        self.verbose = verbose
-        self.logs = []
-
-    def log(self, message):
-        self.logs.append(message)
-        logging.info(message)
-        if self.verbose:
-            st.write(message)
-
-    # Income Projection
-    def compute_monthly_income(self, base_salary, bonus, bonus_conversion_factor):
-        monthly_income = base_salary + (bonus / bonus_conversion_factor)
-        self.log(f"Monthly Income: {base_salary} + ({bonus}/{bonus_conversion_factor}) = {monthly_income:.2f}")
-        return monthly_income
-
-    def project_annual_income(self, current_income, growth_rate):
-        new_income = current_income * (1 + growth_rate)
-        self.log(f"Annual Income Projection: {current_income:.2f} * (1 + {growth_rate}) = {new_income:.2f}")
-        return new_income
-
-    def update_income_for_role_change(self, current_income, increment_rate):
-        new_income = current_income * (1 + increment_rate)
-        self.log(f"Role-based Income Update: {current_income:.2f} * (1 + {increment_rate}) = {new_income:.2f}")
-        return new_income
-
-    # Expense Adjustments
-    def compute_baseline_expense(self, housing_status, baseline_rent, baseline_expense):
-        if housing_status.lower() == "rented":
-            expense = baseline_rent
-            self.log(f"Baseline Expense (Rented): {expense:.2f}")
-        elif housing_status.lower() == "owned":
-            discount = 0.15
-            expense = baseline_expense * (1 - discount)
-            self.log(f"Baseline Expense (Owned): {baseline_expense:.2f}*(1-{discount}) = {expense:.2f}")
-        else:
-            expense = baseline_expense
-            self.log(f"Baseline Expense (Other): {expense:.2f}")
-        return expense
-
-    def apply_inflation(self, expense, inflation_rate):
-        new_expense = expense * (1 + inflation_rate)
-        self.log(f"Expense with Inflation: {expense:.2f}*(1+{inflation_rate}) = {new_expense:.2f}")
-        return new_expense
-
-    def compute_marriage_cost(self, annual_income):
-        cost = max(1.8 * annual_income, 2000000)
-        self.log(f"Marriage Cost: max(1.8*{annual_income:.2f},2000000) = {cost:.2f}")
-        return cost
-
-    def compute_child_event_cost(self):
-        cost = 200000
-        self.log("Child Event Cost: ₹200000")
-        return cost
-
-    # Debt & EMI Calculation
-    def calculate_emi(self, principal, annual_interest_rate, number_months):
-        monthly_rate = (annual_interest_rate / 100) / 12
-        self.log(f"Monthly Interest Rate: {monthly_rate:.6f}")
-        factor = (1 + monthly_rate) ** number_months
-        emi = (principal * monthly_rate * factor) / (factor - 1)
-        self.log(f"EMI Calculation: {emi:.2f}")
-        return emi
-
-    def calculate_dti(self, total_monthly_debt_payments, gross_monthly_income):
-        dti = total_monthly_debt_payments / gross_monthly_income if gross_monthly_income else 0
-        self.log(f"DTI Calculation: {dti:.2f}")
-        return dti
-
-    # Asset Valuation
-    def appreciate_asset(self, asset_value, appreciation_rate):
-        new_value = asset_value * (1 + appreciation_rate)
-        self.log(f"Asset Appreciation: {asset_value}*(1+{appreciation_rate}) = {new_value:.2f}")
-        return new_value
-
-    def depreciate_asset(self, asset_value, depreciation_rate):
-        new_value = asset_value * (1 - depreciation_rate)
-        self.log(f"Asset Depreciation: {asset_value}*(1-{depreciation_rate}) = {new_value:.2f}")
-        return new_value
-
-    # Tax Calculation
-    def compute_taxable_income(self, total_income, allowable_deductions):
-        taxable_income = total_income - allowable_deductions
-        self.log(f"Taxable Income: {total_income} - {allowable_deductions} = {taxable_income}")
-        return taxable_income
-
-    def calculate_tax_liability(self, taxable_income):
-        tax = 0
-        slabs = [(400000, 0), (800000, 0.05), (1200000, 0.10), (1600000, 0.15), (2000000, 0.20), (2400000, 0.25)]
-        if taxable_income <= 400000:
-            tax = 0
-        else:
-            previous = 400000
-            for upper, rate in slabs[1:]:
-                if taxable_income > upper:
-                    taxable_at_rate = upper - previous
-                else:
-                    taxable_at_rate = max(taxable_income - previous, 0)
-                slab_tax = taxable_at_rate * rate
-                self.log(f"Tax for slab {previous}-{upper} at {rate*100}%: {slab_tax}")
-                tax += slab_tax
-                previous = upper
-                if taxable_income <= upper:
-                    break
-            if taxable_income > 2400000:
-                extra = taxable_income - 2400000
-                extra_tax = extra * 0.30
-                self.log(f"Tax for amount above 2400000 at 30%: {extra_tax}")
-                tax += extra_tax
-        self.log(f"Total Tax Liability: {tax:.2f}")
-        return tax
-
-    # Savings, Investment & Rebalancing
-    def compute_savings(self, total_income, total_expenses, debt_payments, taxes):
-        savings = total_income - (total_expenses + debt_payments + taxes)
-        self.log(f"Savings: {savings:.2f}")
-        return savings
-
-    def project_investment_growth(self, current_investment, new_contributions, expected_return):
-        growth = current_investment * expected_return
-        new_value = current_investment + new_contributions + growth
-        self.log(f"Investment Growth: {current_investment}+{new_contributions}+{growth:.2f} = {new_value:.2f}")
-        return new_value
-
-    def rebalance_funds(self, savings, investment_value, withdrawal_amount):
-        total_funds = savings + investment_value
-        if withdrawal_amount > total_funds:
-            self.log("Insufficient funds to rebalance.")
-            return savings, investment_value
-        ratio_savings = savings / total_funds
-        ratio_inv = investment_value / total_funds
-        withdraw_savings = withdrawal_amount * ratio_savings
-        withdraw_inv = withdrawal_amount * ratio_inv
-        new_savings = savings - withdraw_savings
-        new_investment = investment_value - withdraw_inv
-        self.log(f"Rebalance: Withdraw {withdrawal_amount} -> Savings: {withdraw_savings:.2f}, Investments: {withdraw_inv:.2f}")
-        return new_savings, new_investment
-
-    def trace_cashflow(self, income, expenses, emergency, debt_payment, investment):
-        self.log(f"Cashflow: Income={income}, Expenses={expenses}, Emergency={emergency}, Debt Payment={debt_payment}, Investments={investment}")
-        return {"income": income, "expenses": expenses, "emergency": emergency, "debt_payment": debt_payment, "investments": investment}
-
-    def calculate_corpus(self, savings, investment_growth, asset_appreciation, liabilities):
-        corpus = savings + investment_growth + asset_appreciation - liabilities
-        self.log(f"Corpus: {corpus:.2f}")
-        return corpus
+class StreamlitProjectionSink:
+    """Live table and Corpus chart that are redrawn as rows arrive."""
+    def __init__(self, chart_field="Corpus"):
+        self.chart_field = chart_field
+        self.table = st.empty()
+        self.chart = st.empty()
+        self.shown = None
 
-# -----------------------------------------------------------------------------
-# SIMULATION ENGINE & OUTPUT MODULE
-# -----------------------------------------------------------------------------
-def simulate_yearly_projection(all_inputs, verbose=False):
-    calc = DetailedCalculations(verbose=verbose)
-    analysis = AssumptionsAnalysis(all_inputs)
-    sim_params = all_inputs.get("simulation_parameters", {})
-    starting_age = sim_params.get("starting_age", 30)
-    years_to_simulate = sim_params.get("years_to_simulate", 35)
-    current_year = 2025
-
-    # Initial variables
-    emergency_fund = all_inputs.get("emergency_fund", 500000)
-    savings = 0
-    # Sum all initial investments from assets/liabilities module
-    inv_list = all_inputs.get("assets_liabilities_investments", {}).get("investments", [])
-    total_investment = sum(item.get("current_value", 0) for item in inv_list)
-    asset_list = all_inputs.get("assets_liabilities_investments", {}).get("other_assets", [])
-    total_asset_value = sum(item.get("asset_value", 0) for item in asset_list)
-    liab_list = all_inputs.get("assets_liabilities_investments", {}).get("liabilities", [])
-    total_liabilities = sum(item.get("amount", 0) for item in liab_list)
-    emergency_target = 6 * 30000  # 6 months baseline (can be adjusted)
-
-    projection = []
-    current_age_sim = starting_age
-
-    for sim_year in range(years_to_simulate):
-        year_notes = []
-        # --- Income Projection ---
-        career = all_inputs.get("career_income_details", {})
-        base_salary = career.get("monthly_salary", 0)
-        bonus_amount = career.get("bonus", {}).get("amount", 0)
-        bonus_freq = career.get("bonus", {}).get("frequency", "annual")
-        conv_dict = {"annual": 12, "quarterly": 3, "monthly": 1}
-        bonus_conversion = conv_dict.get(bonus_freq, 12)
-        monthly_income = calc.compute_monthly_income(base_salary, bonus_amount, bonus_conversion)
-        annual_income = monthly_income * 12
-        annual_income = calc.project_annual_income(annual_income, 0.04)  # 4% growth
-
-        # --- Expense Projection ---
-        pers = all_inputs.get("personal_information", {})
-        assets_data = all_inputs.get("assets_liabilities_investments", {})
-        housing_status = assets_data.get("housing_status", "Rented")
-        baseline_rent = 30000
-        baseline_expense = 30000
-        expense = calc.compute_baseline_expense(housing_status, baseline_rent, baseline_expense)
-        expense *= pers.get("city_cost_factor", 1.0)
-        expense = calc.apply_inflation(expense, 0.07)  # 7% inflation
-        monthly_expense = expense
-        total_expense = monthly_expense * 12
-
-        # --- Emergency Fund ---
-        surplus = annual_income - total_expense
-        if surplus > 0 and emergency_fund < emergency_target:
-            added = surplus * 0.3
-            emergency_fund += added
-            year_notes.append(f"Emergency fund increased by {added:.2f}")
-        ef_met = emergency_fund >= emergency_target
-
-        # --- Debt Repayment ---
-        total_monthly_debt = sum([l.get("min_payment", l.get("amount", 0) / l.get("remaining_term", 1)) for l in liab_list])
-        annual_debt = total_monthly_debt * 12
-        dti = calc.calculate_dti(total_monthly_debt, monthly_income)
-
-        # --- Tax Calculation ---
-        deductions = 0.2 * annual_income
-        taxable_income = calc.compute_taxable_income(annual_income, deductions)
-        tax = calc.calculate_tax_liability(taxable_income)
-
-        # --- Savings ---
-        savings = calc.compute_savings(annual_income, total_expense, annual_debt, tax)
-
-        # --- Investment Growth ---
-        total_investment = calc.project_investment_growth(total_investment, 100000, 0.10)
-
-        # --- Asset Valuation ---
-        total_asset_value = calc.appreciate_asset(total_asset_value, 0.05)
-
-        # --- Life Events ---
-        events = []
-        pers_age = pers.get("age")
-        if current_age_sim >= pers.get("age_of_marriage", 1000):
-            marriage_info = analysis.handle_marriage_event(annual_income)
-            events.append(f"Marriage (Cost: ₹{marriage_info['cost']:.2f}) scheduled in year {marriage_info['scheduled_year']}")
-        child_events = analysis.handle_children_events()
-        for ev in child_events:
-            events.append(f"{ev['event']} in year {ev['scheduled_year']} (Cost: ₹{ev['cost']})")
-        unexpected_events = analysis.handle_unexpected_events(annual_income, sim_year)
-        for ev in unexpected_events:
-            events.append(f"{ev['event']} (Cost: ₹{ev['cost']:.2f})")
-
-        # --- Corpus Calculation ---
-        corpus = calc.calculate_corpus(savings, total_investment, total_asset_value, total_liabilities)
-        cashflow = calc.trace_cashflow(annual_income, total_expense, emergency_fund, annual_debt, total_investment)
-
-        projection.append({
-            "Year": current_year + sim_year,
-            "Age": current_age_sim,
-            "Income": round(annual_income, 2),
-            "Total Expenses": round(total_expense, 2),
-            "Emergency Fund": round(emergency_fund, 2),
-            "Debt (Annual EMI)": round(annual_debt, 2),
-            "DTI (%)": round(dti * 100, 2),
-            "Tax": round(tax, 2),
-            "Savings": round(savings, 2),
-            "Investment Value": round(total_investment, 2),
-            "Asset Value": round(total_asset_value, 2),
-            "Life Events": "; ".join(events) if events else "—",
-            "Corpus": round(corpus, 2),
-            "Notes": " | ".join(year_notes)
-        })
-
-        current_age_sim += 1
-
-    return projection
-
-def generate_excel_report(projection_df):
-    return projection_df.to_excel(index=False)
-
-def generate_pdf_report(projection_df):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=10)
-    line_height = pdf.font_size * 2.5
-    col_width = pdf.epw / len(projection_df.columns)
-    # Header
-    for col in projection_df.columns:
-        pdf.cell(col_width, line_height, col, border=1)
-    pdf.ln(line_height)
-    # Rows
-    for i in range(len(projection_df)):
-        for col in projection_df.columns:
-            pdf.cell(col_width, line_height, str(projection_df.iloc[i][col]), border=1)
-        pdf.ln(line_height)
-    pdf_buffer = io.BytesIO()
-    pdf.output(pdf_buffer)
-    return pdf_buffer.getvalue()
+    def write_rows(self, rows):
+        self.write_frame(pd.DataFrame(rows))
+
+    def write_frame(self, df):
+        self.shown = df if self.shown is None else pd.concat([self.shown, df], ignore_index=True)
+        self.table.dataframe(self.shown)
+        self.chart.line_chart(self.shown[["Year", self.chart_field]].set_index("Year"))
+
+    def close(self):
+        pass
 
 def display_projection_table(projection):
-    df = pd.DataFrame(projection)
-    st.dataframe(df)
+    df = projection_frame(projection)
+    money = {col: st.column_config.NumberColumn(format="%.2f") for col in df.columns if df[col].dtype.kind == "f"}
+    st.dataframe(df, column_config=money)
     return df
 
 def display_charts(projection):
-    df = pd.DataFrame(projection)
-    line_chart = alt.Chart(df).mark_line(point=True).encode(
-        x="Year:O",
-        y=alt.Y("Corpus:Q", title="Financial Corpus (₹)"),
-        tooltip=["Year", "Corpus", "Income", "Savings"]
-    ).properties(title="Corpus Evolution Over Simulation Years")
-    st.altair_chart(line_chart, use_container_width=True)
-    bar_chart = alt.Chart(df).mark_bar().encode(
-        x="Year:O",
-        y=alt.Y("Investment Value:Q", title="Investment Value (₹)"),
-        tooltip=["Year", "Investment Value"]
-    ).properties(title="Investment Value Over Time")
-    st.altair_chart(bar_chart, use_container_width=True)
+    for chart in projection_charts(projection):
+        st.altair_chart(chart, use_container_width=True)
+
+def display_monte_carlo(result):
+    st.metric("Probability of Running Short Before Retirement", f"{result['probability_short'] * 100:.1f}%")
+    # The paths arrive already summarized into percentile bands, so the chart size does not grow with n_paths
+    chart = band_chart(monte_carlo_bands_frame(result), f"Corpus Percentile Bands ({result['paths']} paths)")
+    st.altair_chart(chart, use_container_width=True)
+
+def display_portfolio(inputs, assumptions, n_paths, seed):
+    result = simulate_household_portfolio([inputs], assumptions, n_paths=n_paths or None, seed=seed)
+    frame = portfolio_frame(result)
+    flat = result["base"].arrays["Investment Value"][0, len(frame) - 1] if len(frame) else 0.0
+    final = frame["Portfolio Value"].iloc[-1] if len(frame) else 0.0
+    st.metric("Final Portfolio Value", f"₹{final:,.2f}", f"₹{final - flat:,.2f} vs a flat {assumptions['investment_return'] * 100:.0f}% return")
+    if frame["Shortfall"].sum() > 0:
+        st.warning(f"Withdrawals of ₹{frame['Shortfall'].sum():,.2f} could not be covered by the portfolio.")
+    st.altair_chart(portfolio_allocation_chart(result), use_container_width=True)
+    if n_paths:
+        display_monte_carlo(portfolio_bands(result))
+    st.dataframe(frame)
+
+WITHDRAWAL_LABELS = {"fixed": "Fixed (inflation-indexed)", "percentage": "Percentage of Balance",
+                     "guardrails": "Guardrails", "expenses": "Projected Expenses"}
+
+def display_decumulation(inputs, assumptions, strategy, rate, n_paths, seed):
+    result = simulate_decumulation(inputs, strategy, rate, n_paths=n_paths, seed=seed, assumptions=assumptions)
+    st.metric(f"Probability the Corpus Lasts to Age {result['life_expectancy']}", f"{result['success_probability'] * 100:.1f}%")
+    if result["depletion_age"] is not None:
+        st.warning(f"On the median path withdrawals can no longer be met from age {result['depletion_age']:.0f}.")
+    if strategy != "expenses":
+        safe = safe_withdrawal_rate(inputs, strategy, n_paths=n_paths, seed=seed, assumptions=assumptions)
+        st.metric("Safe Withdrawal Rate", f"{safe['rate'] * 100:.2f}%", f"₹{safe['amount']:,.2f} in the first year")
+        st.caption(f"Highest rate at which {safe['target'] * 100:.0f}% of {safe['paths']} paths last to age {safe['life_expectancy']}.")
+    chart = band_chart(monte_carlo_bands_frame(result), f"Retirement Balance Bands ({result['paths']} paths)", "Balance (₹)")
+    st.altair_chart(chart, use_container_width=True)
+    st.dataframe(decumulation_frame(result))
+
+GOAL_SEEK_LABELS = {"annual_contribution": "Annual Contribution", "expense": "Monthly Expense Level", "retirement_age": "Retirement Age"}
+
+def display_goal_seek(result):
+    label = GOAL_SEEK_LABELS[result["variable"]]
+    if result["status"] == "solved":
+        value = f"{result['value']}" if result["variable"] == "retirement_age" else f"₹{result['value']:,.2f}"
+        st.metric(label, value)
+        st.caption(f"Corpus at retirement: ₹{result['corpus']:,.2f} ({result['evaluations']} engine evaluations)")
+    elif result["status"] == "already_met":
+        st.success(f"The target of ₹{result['target']:,.2f} is met without any additional contribution.")
+    elif result["status"] == "unbounded":
+        st.success(f"The target of ₹{result['target']:,.2f} is met at any expense level searched.")
+    else:
+        st.warning(f"The target of ₹{result['target']:,.2f} cannot be reached by changing the {label.lower()}.")
+
+# Factors swept by default_sensitivity_axes
+SENSITIVITY_AXES = ["investment_return", "inflation", "income_growth", "city_cost_factor", "retirement_age"]
+
+def display_sensitivity(inputs, assumptions, x, y):
+    axes = default_sensitivity_axes(inputs, assumptions)
+    grid = sensitivity_grid([inputs], axes, assumptions)
+    tornado = tornado_sensitivity([inputs], {name: (values.min(), values.max()) for name, values in axes.items()}, assumptions)
+    st.altair_chart(sensitivity_heatmap(grid, x, y), use_container_width=True)
+    st.altair_chart(tornado_chart(tornado), use_container_width=True)
+    st.dataframe(tornado_frame(tornado), column_config={"Swing": st.column_config.NumberColumn(format="%.2f")})
+
+# SQLite file holding saved client profiles and their projection history. It sits
+# next to this file, whatever directory the app is launched from; set the
+# FINANCIAL_PROJECTION_STORE environment variable to keep it elsewhere.
+PROJECTION_STORE_ENV = "FINANCIAL_PROJECTION_STORE"
+PROJECTION_STORE_PATH = os.environ.get(PROJECTION_STORE_ENV) or os.path.join(os.path.dirname(os.path.abspath(__file__)), "projections.db")
+
+def display_client_history(store, client_id, scenario):
+    import datetime
+    history = pd.DataFrame(store.result_history(client_id, scenario))
+    if len(history) < 2:
+        st.caption(f"Saved as the first {scenario} projection for client {client_id}.")
+        return
+    history["Saved"] = [datetime.datetime.fromtimestamp(t) for t in history["created"]]
+    previous, latest = history["final_corpus"].iloc[-2], history["final_corpus"].iloc[-1]
+    st.metric("Final Corpus vs Previous Save", f"₹{latest:,.2f}", f"₹{latest - previous:,.2f}")
+    st.line_chart(history.set_index("Saved")["final_corpus"].rename("Final Corpus"))
+    st.caption(f"{len(history)} saved projections, {len(store.profile_history(client_id))} input versions saved.")
+
+@st.cache_resource
+def get_projection_cache():
+    # One cache per server process, shared across reruns and sessions
+    return ProjectionCache(max_entries=256)
 
 # -----------------------------------------------------------------------------
 # USER LOGIN & SESSION MANAGEMENT
@@ -560,6 +312,8 @@ def login():
 # MAIN APPLICATION WITH MODERN UI/UX USING STREAMLIT
 # -----------------------------------------------------------------------------
 def main():
+    # Development logging to the console; configured here rather than at import so the engine stays quiet
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
     st.set_page_config(page_title="Financial Planning Simulation Tool", layout="wide")
     st.title("Financial Planning Simulation Tool")
     st.markdown("This tool projects your financial situation from now until retirement. Configure your parameters on the sidebar.")
@@ -588,29 +342,138 @@ def main():
 
     # Collect all inputs through forms in the sidebar
     input_module = InputModule()
-    inputs = input_module.collect_all_inputs()
+    with METRICS.stage("app.input_collection"):
+        inputs = input_module.collect_all_inputs()
 
     # Adjust simulation parameters based on scenario selections
     sim_params = inputs.get("simulation_parameters", {})
     years_to_sim = sim_params.get("years_to_simulate", 35)
     st.sidebar.markdown(f"**Years to Simulate:** {years_to_sim}")
+    tax_regimes = tax_regime_names()
+    tax_regime = st.sidebar.selectbox("Tax Regime", options=tax_regimes, index=tax_regimes.index(get_tax_schedule().name))
+    assumptions = {"income_growth": income_growth, "investment_return": inv_return, "tax_regime": tax_regime}
+
+    # Monte Carlo settings
+    st.sidebar.subheader("Monte Carlo Analysis")
+    run_monte_carlo = st.sidebar.checkbox("Run Monte Carlo", value=False)
+    if run_monte_carlo:
+        n_paths = st.sidebar.number_input("Number of Paths", min_value=1000, max_value=100000, value=10000, step=1000)
+        mc_seed = st.sidebar.number_input("Random Seed", min_value=0, value=42, step=1)
+
+    # Household portfolio settings
+    st.sidebar.subheader("Household Portfolio")
+    run_portfolio = st.sidebar.checkbox("Project Household Portfolio", value=False)
+    if run_portfolio:
+        portfolio_paths = st.sidebar.number_input("Return Paths (0 for mean returns)", min_value=0, max_value=50000, value=0, step=1000)
+        portfolio_seed = st.sidebar.number_input("Portfolio Seed", min_value=0, value=7, step=1)
+
+    # Retirement drawdown settings
+    st.sidebar.subheader("Retirement Drawdown")
+    run_decumulation = st.sidebar.checkbox("Simulate Retirement Withdrawals", value=False)
+    if run_decumulation:
+        withdrawal_strategy = st.sidebar.selectbox("Withdrawal Strategy", options=list(WITHDRAWAL_LABELS), format_func=WITHDRAWAL_LABELS.get)
+        withdrawal_rate = st.sidebar.number_input("Withdrawal Rate (%)", min_value=0.0, max_value=20.0, value=4.0, step=0.25)
+        life_expectancy = st.sidebar.number_input("Life Expectancy", min_value=50, max_value=110, value=85)
+        drawdown_paths = st.sidebar.number_input("Drawdown Paths", min_value=1000, max_value=100000, value=10000, step=1000)
+        drawdown_seed = st.sidebar.number_input("Drawdown Seed", min_value=0, value=11, step=1)
+
+    # Sensitivity settings
+    st.sidebar.subheader("Sensitivity Analysis")
+    run_sensitivity = st.sidebar.checkbox("Run Sensitivity Sweep", value=False)
+    if run_sensitivity:
+        heatmap_x = st.sidebar.selectbox("Heatmap X Axis", options=SENSITIVITY_AXES, index=0)
+        heatmap_y = st.sidebar.selectbox("Heatmap Y Axis", options=[name for name in SENSITIVITY_AXES if name != heatmap_x], index=3)
+
+    # Goal seek settings
+    st.sidebar.subheader("Goal Seek")
+    run_goal_seek = st.sidebar.checkbox("Solve for a Target Corpus", value=False)
+    if run_goal_seek:
+        goal_variable = st.sidebar.selectbox("Solve For", options=list(GOAL_SEEK_LABELS), format_func=GOAL_SEEK_LABELS.get)
+        target_corpus = st.sidebar.number_input("Target Corpus (₹)", min_value=0.0, value=50000000.0, step=1000000.0)
+
+    # Client records: projections are saved per client so later runs can be compared
+    st.sidebar.subheader("Client Records")
+    client_id = st.sidebar.text_input("Client ID", help="Leave blank to run without saving").strip()
+
+    cache = get_projection_cache()
+    st.sidebar.caption(f"Cache: {cache.stats['hits'] + cache.stats['disk_hits']} hits, "
+                       f"{cache.stats['misses']} misses ({cache.hit_rate() * 100:.0f}% hit rate)")
 
     # Button to start the simulation
     if st.button("Run Simulation"):
         with st.spinner("Simulating..."):
-            projection = simulate_yearly_projection(inputs, verbose=False)
-            df_projection = pd.DataFrame(projection)
-            st.success("Simulation complete!")
             st.subheader("Year-by-Year Financial Projection")
-            display_projection_table(projection)
+            live_sink = StreamlitProjectionSink()
+            cache_key = projection_cache_key("projection_result", inputs, assumptions)
+            result = cache.get(cache_key)
+            if result is not None:
+                live_sink.write_frame(result.frame())
+            else:
+                # Re-simulate only from the first year affected by what changed since the last run
+                incremental = st.session_state.setdefault("incremental_projection", IncrementalProjection())
+                projection = []
+                for row in incremental.iter_update(inputs, assumptions):
+                    projection.append(row)
+                    live_sink.write_rows([row])
+                result = ProjectionResult.from_rows(projection)
+                cache.put(cache_key, result)
+            # One DataFrame over the result's arrays serves the charts and every export
+            df_projection = result.frame()
+            st.success("Simulation complete!")
             st.subheader("Financial Charts")
-            display_charts(projection)
-
-            # Download Buttons for Excel and PDF reports
-            excel_data = df_projection.to_csv(index=False).encode("utf-8")
-            st.download_button("Download Report as CSV", excel_data, "financial_projection.csv", "text/csv")
+            with METRICS.stage("app.charts"):
+                display_charts(result)
+            if client_id:
+                with ProjectionStore(PROJECTION_STORE_PATH) as store:
+                    store.save_results([(client_id, inputs, result)], scenario, assumptions)
+                    st.subheader(f"History for Client {client_id}")
+                    display_client_history(store, client_id, scenario)
+            loans = loans_from_inputs(inputs)
+            if loans and assumptions.get("amortize_liabilities", True):
+                with st.expander("Loan Amortization Schedules"):
+                    for loan in loans:
+                        st.write(f"**{loan['name']}**")
+                        st.dataframe(loan_schedule_frame(loan))
+
+            # Download Buttons for Excel, CSV and PDF reports
+            excel_data = generate_excel_report(df_projection)
+            st.download_button("Download Report as Excel", excel_data, "financial_projection.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            csv_data = df_projection.to_csv(index=False, float_format="%.2f").encode("utf-8")
+            st.download_button("Download Report as CSV", csv_data, "financial_projection.csv", "text/csv")
             pdf_data = generate_pdf_report(df_projection)
             st.download_button("Download Report as PDF", pdf_data, "financial_projection.pdf", "application/pdf")
 
+        if run_monte_carlo:
+            with st.spinner("Running Monte Carlo paths..."):
+                mc_result = cached_monte_carlo(inputs, cache, assumptions=assumptions, n_paths=int(n_paths), seed=int(mc_seed))
+            st.subheader("Monte Carlo Analysis")
+            display_monte_carlo(mc_result)
+
+        if run_portfolio:
+            with st.spinner("Projecting the household portfolio..."):
+                st.subheader("Household Portfolio")
+                display_portfolio(inputs, assumptions, int(portfolio_paths), int(portfolio_seed))
+
+        if run_decumulation:
+            with st.spinner("Simulating retirement withdrawals..."):
+                st.subheader("Retirement Drawdown")
+                display_decumulation(inputs, dict(assumptions, life_expectancy=int(life_expectancy)), withdrawal_strategy,
+                                     withdrawal_rate / 100, int(drawdown_paths), int(drawdown_seed))
+
+        if run_sensitivity:
+            with st.spinner("Sweeping assumptions..."):
+                st.subheader("Sensitivity Analysis")
+                display_sensitivity(inputs, assumptions, heatmap_x, heatmap_y)
+
+        if run_goal_seek:
+            goal = goal_seek([inputs], target_corpus, variable=goal_variable, assumptions=assumptions)[0]
+            st.subheader("Goal Seek")
+            display_goal_seek(goal)
+
+        # Stage timings of this session so far, for the file named by FINANCIAL_METRICS
+        if METRICS.enabled and os.environ.get(METRICS_ENV):
+            METRICS.write(os.environ[METRICS_ENV])
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,44 @@
+"""
+Tests for the benchmark harness. Run with `python -m pytest -q`.
+
+Only small cases run here; the point is that cases set up, throughput is
+reported and baselines flag regressions, not the timings themselves.
+"""
+import json
+
+import benchmarks
+
+def test_synthetic_profiles_are_seeded():
+    assert benchmarks.synthetic_profiles(5, seed=1, years=20) == benchmarks.synthetic_profiles(5, seed=1, years=20)
+    assert benchmarks.synthetic_profiles(5, seed=1) != benchmarks.synthetic_profiles(5, seed=2)
+    assert {p["simulation_parameters"]["years_to_simulate"] for p in benchmarks.synthetic_profiles(5, years=20)} == {20}
+
+def test_case_keys_are_unique():
+    keys = [benchmarks.case_key(name, params) for name, params, _ in benchmarks.benchmark_cases()]
+    assert len(keys) == len(set(keys))
+
+def test_run_benchmarks_selects_cases_and_reports_throughput():
+    results = benchmarks.run_benchmarks(only=r"^(tax_|safe_withdrawal_rate\[.*fixed)", quick=True, repeat=1, memory=True)
+    assert [r["name"] for r in results] == ["safe_withdrawal_rate", "tax_scalar", "tax_array"]
+    for r in results:
+        assert r["seconds"] > 0 and r["throughput"] > 0 and r["peak_mb"] >= 0
+
+def test_baseline_comparison_flags_regressions(tmp_path):
+    path = tmp_path / "baseline.json"
+    results = benchmarks.run_benchmarks(only="^tax_", quick=True, repeat=1)
+    benchmarks.save_baseline(results, path)
+    assert json.loads(path.read_text())["engine_version"] == benchmarks.fp.ENGINE_VERSION
+    assert benchmarks.compare_baseline([dict(r) for r in results], path) == []
+    slower = [dict(r, seconds=r["seconds"] * 2) for r in results]
+    assert [r["key"] for r in benchmarks.compare_baseline(slower, path)] == [r["key"] for r in results]
+    assert all(abs(r["ratio"] - 2) < 1e-9 for r in slower)
+
+def test_main_exits_nonzero_on_regression(tmp_path, capsys):
+    path = tmp_path / "baseline.json"
+    assert benchmarks.main(["--quick", "--only", "^tax_array", "--repeat", "1", "--save", str(path)]) == 0
+    baseline = json.loads(path.read_text())
+    for result in baseline["results"].values():
+        result["seconds"] /= 1000
+    path.write_text(json.dumps(baseline))
+    assert benchmarks.main(["--quick", "--only", "^tax_array", "--repeat", "1", "--compare", str(path)]) == 1
+    assert "1 regression(s)" in capsys.readouterr().out
@@ -0,0 +1,873 @@
+"""
+Tests for the headless engine and the modules around it. Run with `python -m pytest -q`.
+
+Most tests compare the per-profile loop engine (simulate_yearly_projection)
+with the vectorized engines on seeded random profiles, since the loop engine
+is the reference the others must reproduce row for row.
+"""
+import copy
+import json
+import math
+import random
+import re
+
+import numpy as np
+import pytest
+
+import financial_cli
+import financial_core as fc
+import financial_export
+import financial_parallel
+import financial_reports
+import financial_store
+
+# -----------------------------------------------------------------------------
+# RANDOM PROFILES
+# -----------------------------------------------------------------------------
+def random_inputs(rng):
+    """One all_inputs dict with random career, family, housing, loans and events."""
+    age = rng.randint(18, 60)
+    retirement_age = rng.randint(max(50, age + 1), 80)
+    years = retirement_age - age
+    employment = rng.choice(["Job", "Job", "Business", "Unemployed"])
+    career = {"employment_type": employment}
+    if employment == "Job":
+        career["monthly_salary"] = rng.uniform(0, 600000)
+        career["bonus"] = {"frequency": rng.choice(["annual", "quarterly", "monthly"]), "amount": rng.uniform(0, 200000)}
+    elif employment == "Business":
+        career["annual_inhand_income"] = rng.uniform(0, 5e6)
+    else:
+        career["unemployed_monthly_income"] = rng.uniform(0, 30000)
+    housing = rng.choice(["Rented", "Owned", "Owned by Parents"])
+    mortgage = None
+    if housing == "Owned" and rng.random() < 0.7:
+        mortgage = {"emi_amount": rng.uniform(1e4, 6e4), "remaining_term": rng.randint(12, 300), "loan_interest_rate": rng.uniform(6, 10),
+                    "principal": rng.uniform(1e6, 8e6), "market_value": rng.uniform(2e6, 1.2e7)}
+    liabilities = [{"liability_name": f"Loan {i+1}", "interest_rate": rng.uniform(0, 16), "remaining_term": rng.randint(1, 300),
+                    "amount": rng.uniform(0, 1e6), "min_payment": rng.uniform(0, 50000)} for i in range(rng.randint(0, 3))]
+    return {
+        "personal_information": {
+            "age": age,
+            "city_cost_factor": rng.choice([1.2, 1.0, 0.9]),
+            "marital_status": rng.choice(["Married", "Not Married"]),
+            "age_of_marriage": age + rng.randint(1, 30),
+            "children": [{"age_at_birth": rng.randint(0, 40)} for _ in range(rng.randint(0, 3))],
+            "dependents": [{"relationship": rng.choice(["Parent", "Sibling", "Pet", "Child"]), "age": rng.randint(1, 80)}
+                           for _ in range(rng.randint(0, 2))],
+            "additional_income_sources": [],
+        },
+        "career_income_details": career,
+        "assets_liabilities_investments": {
+            "housing_status": housing,
+            "mortgage_details": mortgage,
+            "investments": [{"investment_type": "mutual funds", "current_value": rng.uniform(0, 1e6)} for _ in range(rng.randint(0, 3))],
+            "other_assets": [{"asset_name": "Car", "asset_value": rng.uniform(0, 1e6)} for _ in range(rng.randint(0, 3))],
+            "liabilities": liabilities,
+        },
+        "retirement_investment_strategy": {"retirement_age": retirement_age, "investment_strategy": "Moderate"},
+        "simulation_parameters": {"years_to_simulate": years, "starting_age": age},
+        "emergency_fund": rng.choice([500000, rng.uniform(0, 300000)]),
+        "reserved_investments": rng.uniform(0, 3e6),
+        "custom_events": [{"name": "Planned Expense", "year": rng.randint(0, years - 1), "cost": rng.uniform(1e5, 2e6)}
+                          for _ in range(rng.randint(0, 2))],
+    }
+
+def random_profiles(n, seed=0):
+    rng = random.Random(seed)
+    return [random_inputs(rng) for _ in range(n)]
+
+ASSUMPTION_SETS = [
+    {},
+    {"amortize_liabilities": False},
+    {"tax_regime": "old", "income_growth": 0.06, "investment_return": 0.12},
+    {"inflation": 0.02, "annual_contribution": 250000, "apply_event_costs": False},
+]
+
+def assert_rows_match(expected, actual):
+    assert len(expected) == len(actual)
+    for year, (a, b) in enumerate(zip(expected, actual)):
+        assert a.keys() == b.keys(), year
+        for key in a:
+            if isinstance(a[key], str):
+                # Event descriptions embed amounts whose last digit may round differently
+                assert re.sub(r"\d", "", a[key]) == re.sub(r"\d", "", b[key]), (year, key, a[key], b[key])
+            else:
+                assert math.isclose(a[key], b[key], rel_tol=1e-9, abs_tol=0.011), (year, key, a[key], b[key])
+
+# -----------------------------------------------------------------------------
+# ENGINE PARITY
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("assumptions", ASSUMPTION_SETS)
+def test_vectorized_engine_matches_loop_engine(assumptions):
+    for inputs in random_profiles(60, seed=1):
+        assert_rows_match(fc.simulate_yearly_projection(inputs, assumptions=assumptions),
+                          fc.vectorized_yearly_projection(inputs, assumptions))
+
+@pytest.mark.parametrize("assumptions", ASSUMPTION_SETS)
+def test_batch_engine_matches_loop_engine(assumptions):
+    profiles = random_profiles(60, seed=2)
+    batch = fc.simulate_batch_projection(fc.profiles_table(profiles), assumptions)
+    for i, inputs in enumerate(profiles):
+        assert_rows_match(fc.simulate_yearly_projection(inputs, assumptions=assumptions), batch.rows(i))
+
+def test_project_profile_arrays_matches_loop_engine():
+    profiles = random_profiles(40, seed=3)
+    table = fc.profiles_table(profiles)
+    years = int(table["years_to_simulate"].max())
+    arrays = fc.project_profile_arrays({name: table[name].to_numpy() for name in table}, years, dict(fc.DEFAULT_ASSUMPTIONS))
+    for i, inputs in enumerate(profiles):
+        corpus = [row["Corpus"] for row in fc.simulate_yearly_projection(inputs)]
+        np.testing.assert_allclose(arrays["Corpus"][i, :len(corpus)], corpus, rtol=1e-9, atol=0.011)
+
+def test_batch_frame_matches_rows_and_keeps_table_index():
+    profiles = random_profiles(12, seed=4)
+    table = fc.profiles_table(profiles)
+    table.index = [f"client_{i}" for i in range(len(table))]
+    batch = fc.simulate_batch_projection(table)
+    df = batch.to_frame(with_events=True)
+    assert df["Profile"].tolist() == [name for name, inputs in zip(table.index, profiles)
+                                      for _ in range(inputs["simulation_parameters"]["years_to_simulate"])]
+    for i, name in enumerate(table.index):
+        rows = batch.rows(i)
+        part = df[df["Profile"] == name]
+        assert part["Life Events"].tolist() == [row["Life Events"] for row in rows]
+        np.testing.assert_allclose(part["Corpus"], [row["Corpus"] for row in rows])
+        # Cells past a profile's own horizon are NaN
+        assert np.isnan(batch["Corpus"][i, len(rows):]).all()
+
+def test_projection_result_round_trips_rows():
+    rows = fc.simulate_yearly_projection(random_profiles(1, seed=24)[0])
+    result = fc.ProjectionResult.from_rows(rows)
+    assert result.rows() == rows
+    assert result["Year"].dtype == result["Age"].dtype == np.int16 and result["Corpus"].dtype == np.float64
+    assert not hasattr(result, "__dict__")
+    assert fc.projection_frame(result)["Corpus"].tolist() == [row["Corpus"] for row in rows]
+
+def test_batch_result_pickles_with_rendered_text():
+    import pickle
+    batch = fc.simulate_batch_projection(fc.profiles_table(random_profiles(3, seed=25)))
+    for i in range(len(batch)):
+        result = batch.result(i)
+        assert result.fields == fc.PROJECTION_FIELDS
+        assert pickle.loads(pickle.dumps(result)).rows() == batch.rows(i)
+
+def past_retirement_inputs():
+    # Current age above retirement age, as the app allows (age up to 100, retirement age down to 50)
+    return {"personal_information": {"age": 70},
+            "assets_liabilities_investments": {"liabilities": [{"amount": 1e5, "remaining_term": 12, "min_payment": 1e4}]},
+            "retirement_investment_strategy": {"retirement_age": 60},
+            "simulation_parameters": {"years_to_simulate": -10, "starting_age": 70}}
+
+@pytest.mark.parametrize("assumptions", [{}, {"amortize_liabilities": False}])
+def test_negative_horizon_projects_no_years(assumptions):
+    inputs = past_retirement_inputs()
+    assert fc.simulate_yearly_projection(inputs, assumptions=assumptions) == []
+    assert fc.vectorized_yearly_projection(inputs, assumptions) == []
+    assert fc.simulate_batch_projection(fc.profiles_table([inputs, random_profiles(1)[0]]), assumptions).rows(0) == []
+
+# -----------------------------------------------------------------------------
+# LOAN AMORTIZATION
+# -----------------------------------------------------------------------------
+def month_by_month_balances(loan, months):
+    balance, balances = loan["principal"], [loan["principal"]]
+    prepayments = {p["month"]: p["amount"] for p in loan.get("prepayments", [])}
+    for month in range(1, months + 1):
+        balance = max(balance * (1 + loan["annual_rate"] / 100 / 12) - loan["payment"], 0.0)
+        balance = max(balance - prepayments.get(month, 0.0), 0.0)
+        balances.append(balance)
+    return balances
+
+def test_closed_form_balances_match_monthly_iteration():
+    rng = random.Random(20)
+    loans = [{"principal": rng.uniform(1e4, 5e6), "annual_rate": rng.choice([0.0, rng.uniform(1, 18)]),
+              "payment": rng.uniform(1e3, 6e4),
+              "prepayments": [{"month": rng.randint(1, 240), "amount": rng.uniform(1e4, 1e6)} for _ in range(rng.randint(0, 2))]}
+             for _ in range(50)]
+    balances = fc.loan_balances(loans, 240)
+    for loan, row in zip(loans, balances):
+        np.testing.assert_allclose(row, month_by_month_balances(loan, 240), rtol=1e-7, atol=1e-4)
+
+def test_emi_clears_loan_within_term():
+    for principal, rate, term in [(1e6, 9.0, 120), (5e5, 0.0, 36), (3e6, 12.0, 1)]:
+        loan = {"principal": principal, "annual_rate": rate, "payment": float(fc.emi_payment(principal, rate, term))}
+        balances = fc.loan_balances([loan], term)[0]
+        assert balances[-1] < 1e-4 and balances[-2] > 0
+        schedule = fc.amortize_loans([loan], 1 + term // 12)
+        assert math.isclose(schedule["payment"].sum() - schedule["interest"].sum(), principal, rel_tol=1e-9)
+
+def test_debt_schedule_negative_horizon():
+    debt = fc.profile_debt_schedule([[], None], -5)
+    assert debt["payment"].shape == debt["balance"].shape == (2, 0)
+
+# -----------------------------------------------------------------------------
+# TAX SCHEDULES
+# -----------------------------------------------------------------------------
+def slab_by_slab_tax(slabs, income):
+    tax, lower = 0.0, 0.0
+    for upper, rate in slabs:
+        upper = float("inf") if upper is None else upper
+        if income > lower:
+            tax += (min(income, upper) - lower) * rate
+        lower = upper
+    return tax
+
+@pytest.mark.parametrize("name", fc.tax_regime_names())
+def test_tax_schedule_matches_slab_by_slab_tax(name):
+    schedule = fc.get_tax_schedule(name)
+    slabs = list(zip([None if u == float("inf") else u for u in schedule.uppers.tolist()], schedule.rates.tolist()))
+    rng = np.random.default_rng(19)
+    incomes = np.concatenate([[-1e5, 0.0], schedule.lowers, schedule.lowers[1:] - 0.5, rng.uniform(0, 5e6, 200)])
+    expected = [slab_by_slab_tax(slabs, income) for income in incomes]
+    np.testing.assert_allclose([schedule.tax(income) for income in incomes], expected, rtol=1e-12, atol=1e-9)
+    np.testing.assert_allclose(schedule.tax_array(incomes), expected, rtol=1e-12, atol=1e-9)
+    for income in incomes[-10:]:
+        assert math.isclose(sum(slab[3] for slab in schedule.breakdown(income)), schedule.tax(income), rel_tol=1e-12)
+
+def test_tax_schedule_rejects_bad_slabs():
+    for slabs in ([], [(500000, 0.1)], [(500000, 0.0), (300000, 0.1), (None, 0.2)]):
+        with pytest.raises(ValueError):
+            fc.TaxSchedule(slabs, name="bad")
+    with pytest.raises(ValueError, match="Unknown tax regime"):
+        fc.get_tax_schedule("missing")
+
+# -----------------------------------------------------------------------------
+# GOAL SEEK
+# -----------------------------------------------------------------------------
+def final_corpus(inputs, assumptions):
+    return fc.simulate_yearly_projection(inputs, assumptions=assumptions)[-1]["Corpus"]
+
+def test_goal_seek_finds_smallest_contribution():
+    profiles = random_profiles(8, seed=27)
+    for inputs, result in zip(profiles, fc.goal_seek(profiles, 5e7, tol=1.0)):
+        if result["status"] == "solved":
+            assert final_corpus(inputs, {"annual_contribution": result["value"]}) >= 5e7 - 1
+            assert final_corpus(inputs, {"annual_contribution": result["value"] - 2}) < 5e7
+        else:
+            assert result["status"] == "already_met" and final_corpus(inputs, {"annual_contribution": 0}) >= 5e7
+
+def test_goal_seek_finds_largest_expense():
+    profiles = random_profiles(6, seed=28)
+    for inputs, result in zip(profiles, fc.goal_seek(profiles, 1e6, variable="expense", tol=1.0)):
+        if result["status"] == "solved":
+            level = {"baseline_rent": result["value"], "baseline_expense": result["value"]}
+            assert final_corpus(inputs, level) >= 1e6 - 1
+            assert final_corpus(inputs, {key: value + 2 for key, value in level.items()}) < 1e6
+        else:
+            assert result["status"] == "unreachable"
+
+def test_goal_seek_finds_earliest_retirement_age():
+    profiles = random_profiles(6, seed=29)
+    for inputs, result in zip(profiles, fc.goal_seek(profiles, 2e7, variable="retirement_age")):
+        corpus = [row["Corpus"] for row in fc.simulate_yearly_projection(dict(
+            inputs, simulation_parameters=dict(inputs["simulation_parameters"], years_to_simulate=100 - inputs["personal_information"]["age"])))]
+        reached = [t for t, value in enumerate(corpus) if value >= 2e7]
+        assert result["value"] == (inputs["personal_information"]["age"] + reached[0] + 1 if reached else None)
+
+# -----------------------------------------------------------------------------
+# SENSITIVITY ANALYSIS
+# -----------------------------------------------------------------------------
+def with_scenario(inputs, scenario):
+    """all_inputs and assumptions equivalent to one sweep scenario."""
+    inputs = copy.deepcopy(inputs)
+    assumptions = {name: value for name, value in scenario.items() if name in fc.RATE_KEYS + ("annual_contribution",)}
+    if "city_cost_factor" in scenario:
+        inputs["personal_information"]["city_cost_factor"] = scenario["city_cost_factor"]
+    if "retirement_age" in scenario:
+        simulation = inputs["simulation_parameters"]
+        simulation["years_to_simulate"] = int(scenario["retirement_age"]) - simulation["starting_age"]
+    return inputs, assumptions
+
+def test_sensitivity_grid_matches_loop_engine():
+    profiles = random_profiles(3, seed=30)
+    axes = {"investment_return": [0.06, 0.12], "city_cost_factor": [0.9, 1.3], "retirement_age": [62, 67],
+            "annual_contribution": [0, 300000]}
+    grid = fc.sensitivity_grid(profiles, axes)
+    assert grid["corpus"].shape == (3, 2, 2, 2, 2)
+    for i, inputs in enumerate(profiles):
+        for cell in np.ndindex(*grid["corpus"].shape[1:]):
+            scenario = {name: values[k] for (name, values), k in zip(grid["axes"].items(), cell)}
+            expected = final_corpus(*with_scenario(inputs, scenario))
+            assert math.isclose(grid["corpus"][(i,) + cell], expected, rel_tol=1e-9, abs_tol=0.011), (i, scenario)
+
+def test_sensitivity_compounds_inflation_and_income_growth():
+    inputs = {"personal_information": {"age": 25}, "career_income_details": {"monthly_salary": 150000},
+              "simulation_parameters": {"years_to_simulate": 40, "starting_age": 25}}
+    axes = fc.default_sensitivity_axes(inputs)
+    axes = {name: axes[name] for name in ("inflation", "income_growth")}
+    grid = fc.sensitivity_grid([inputs], axes)
+    for cell in np.ndindex(*grid["corpus"].shape[1:]):
+        scenario = {name: values[k] for (name, values), k in zip(grid["axes"].items(), cell)}
+        assert math.isclose(grid["corpus"][(0,) + cell], final_corpus(*with_scenario(inputs, scenario)), rel_tol=1e-9, abs_tol=0.011)
+    # Compounded over 40 years, the ends of each axis are a fifth or more apart
+    corpus = grid["corpus"][0]
+    assert corpus[0, 2] > 1.2 * corpus[4, 2] and corpus[2, 4] > 1.2 * corpus[2, 0]
+
+def test_tornado_swings_one_factor_at_a_time():
+    profiles = random_profiles(2, seed=31)
+    ranges = {"inflation": (0.04, 0.09), "retirement_age": (60, 70)}
+    tornado = fc.tornado_sensitivity(profiles, ranges)
+    for i, inputs in enumerate(profiles):
+        assert math.isclose(tornado["base_corpus"][i], final_corpus(inputs, {}), rel_tol=1e-9, abs_tol=0.011)
+        for j, (name, (low, high)) in enumerate(ranges.items()):
+            assert math.isclose(tornado["corpus_low"][i, j], final_corpus(*with_scenario(inputs, {name: low})), rel_tol=1e-9, abs_tol=0.011)
+            assert math.isclose(tornado["corpus_high"][i, j], final_corpus(*with_scenario(inputs, {name: high})), rel_tol=1e-9, abs_tol=0.011)
+    with pytest.raises(ValueError, match="Unknown sweep factors"):
+        fc.sensitivity_grid(profiles, {"salary": [1, 2]})
+
+# -----------------------------------------------------------------------------
+# HOUSEHOLD PORTFOLIO
+# -----------------------------------------------------------------------------
+def test_single_class_portfolio_matches_projection():
+    profiles = random_profiles(10, seed=38)
+    for inputs in profiles:
+        inputs["personal_information"]["dependents"] = []
+    one_class = {"asset_classes": {"equity": {"mean": fc.DEFAULT_ASSUMPTIONS["investment_return"], "std": 0.0}},
+                 "strategy_allocations": {"Moderate": {"equity": 1.0}}}
+    result = fc.simulate_household_portfolio(profiles, one_class)
+    invested = result["base"]["Investment Value"]
+    positive = np.cumprod(np.nan_to_num(invested, nan=-1) > 0, axis=1).astype(bool)
+    np.testing.assert_allclose(result["Portfolio Value"][0][positive], invested[positive], rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(result["Household Corpus"][0][positive], result["base"]["Corpus"][positive], rtol=1e-9, atol=1e-6)
+
+def test_household_cash_flows_compound():
+    inputs = {"personal_information": {"age": 30, "spouse": {"age": 28, "monthly_income": 50000, "retirement_age": 60},
+                                       "additional_income_sources": [{"source": "Rental", "amount": 20000}],
+                                       "dependents": [{"relationship": "Parent", "age": 60}]},
+              "simulation_parameters": {"years_to_simulate": 30, "starting_age": 30}}
+    a = fc.portfolio_assumptions()
+    result = fc.simulate_household_portfolio([inputs])
+    wages, prices = (1 + a["income_growth"]) ** np.arange(1, 31), (1 + a["inflation"]) ** np.arange(1, 31)
+    np.testing.assert_allclose(result["Spouse Income"][0], 50000 * 12 * wages)
+    np.testing.assert_allclose(result["Other Income"][0], 20000 * 12 * wages)
+    np.testing.assert_allclose(result["Dependent Costs"][0], 120000 * prices)
+
+def test_investment_debits_follow_the_investment_recurrence():
+    table = fc.profiles_table(random_profiles(20, seed=42))
+    a = fc.DEFAULT_ASSUMPTIONS
+    years = int(table["years_to_simulate"].max())
+    arrays = fc.project_profile_arrays({name: table[name].to_numpy() for name in table}, years, a)
+    invested = arrays["Investment Value"]
+    previous = np.concatenate([table["total_investment"].to_numpy(dtype=float)[:, None], invested[:, :-1]], axis=1)
+    grown = previous * (1 + a["investment_return"]) + a["annual_contribution"]
+    np.testing.assert_allclose(arrays["Investment Debits"], grown - invested, rtol=1e-9, atol=1e-6)
+    assert (arrays["Investment Debits"] >= 0).all() and (arrays["Investment Debits"] > 0).any()
+
+def test_rebalancing_restores_target_weights():
+    profiles = random_profiles(4, seed=39)
+    result = fc.simulate_household_portfolio(profiles, n_paths=50, seed=1)
+    again = fc.simulate_household_portfolio(profiles, n_paths=50, seed=1)
+    np.testing.assert_array_equal(result["Portfolio Value"], again["Portfolio Value"])
+    targets = fc.PORTFOLIO_DEFAULTS["strategy_allocations"]
+    for i, inputs in enumerate(profiles):
+        weights = np.array([targets["Moderate"].get(name, 0.0) for name in result["classes"]])
+        values = result["Class Values"][:, i, :len(result["base"].rows(i))]
+        funded = values[values.sum(axis=-1) > 0]
+        np.testing.assert_allclose(funded / funded.sum(axis=-1, keepdims=True), np.broadcast_to(weights, funded.shape), atol=1e-9)
+
+def test_withdraw_pro_rata_reports_unmet_amount():
+    holdings, unmet = fc.withdraw_pro_rata(np.array([[60.0, 40.0], [10.0, 0.0]]), np.array([50.0, 30.0]))
+    np.testing.assert_allclose(holdings, [[30.0, 20.0], [0.0, 0.0]])
+    np.testing.assert_allclose(unmet, [0.0, 20.0])
+
+# -----------------------------------------------------------------------------
+# RETIREMENT DECUMULATION
+# -----------------------------------------------------------------------------
+def year_by_year_drawdown(corpus, returns, inflation, rate, strategy, expenses, a):
+    """Balances and withdrawals of one path, stepping the documented rules one year at a time."""
+    balance, price, planned, floor = corpus, 1.0, None, None
+    balances, withdrawals = [], []
+    for t, (growth, indexation) in enumerate(zip(returns, inflation)):
+        if strategy == "percentage":
+            planned = rate * balance
+        elif strategy == "expenses":
+            planned = expenses * a["retirement_expense_ratio"] * price
+        elif t == 0:
+            planned = rate * balance
+        else:
+            planned *= 1 + inflation[t - 1]
+            if strategy == "guardrails" and planned > rate * (1 + a["guardrail_band"]) * balance:
+                planned *= 1 - a["guardrail_adjustment"]
+            elif strategy == "guardrails" and planned < rate * (1 - a["guardrail_band"]) * balance:
+                planned *= 1 + a["guardrail_adjustment"]
+        if t == 0:
+            floor = a["spending_floor"] * planned
+        elif strategy in ("percentage", "guardrails"):
+            planned = max(planned, floor * price)
+        balances.append(balance)
+        withdrawals.append(min(planned, balance))
+        balance = (balance - withdrawals[-1]) * (1 + growth)
+        price *= 1 + indexation
+    return balances, withdrawals
+
+@pytest.mark.parametrize("strategy", fc.WITHDRAWAL_STRATEGIES)
+def test_decumulation_paths_match_year_by_year_drawdown(strategy):
+    rng = np.random.default_rng(40)
+    returns, inflation = rng.normal(0.07, 0.15, (20, 30)), rng.normal(0.05, 0.02, (20, 30))
+    a = fc.decumulation_assumptions()
+    paths = fc.decumulation_paths(1e7, returns, inflation, 0.05, strategy, expenses=4e5)
+    for p in range(len(returns)):
+        balances, withdrawals = year_by_year_drawdown(1e7, returns[p], inflation[p], 0.05, strategy, 4e5, a)
+        np.testing.assert_allclose(paths["Balance"][p], balances, rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(paths["Withdrawal"][p], withdrawals, rtol=1e-9, atol=1e-6)
+
+def test_fixed_capacity_is_the_largest_lasting_rate():
+    rng = np.random.default_rng(41)
+    returns, inflation = rng.normal(0.07, 0.15, (200, 30)), rng.normal(0.05, 0.02, (200, 30))
+    capacity = fc.fixed_withdrawal_capacity(returns, inflation)
+    below = fc.decumulation_paths(1.0, returns, inflation, capacity * (1 - 1e-6), full=False)["First Failure"]
+    above = fc.decumulation_paths(1.0, returns, inflation, capacity * (1 + 1e-6), full=False)["First Failure"]
+    assert (below == 30).all() and (above < 30).all()
+
+@pytest.mark.parametrize("strategy", ["fixed", "percentage", "guardrails"])
+def test_safe_withdrawal_rate_meets_target(strategy):
+    inputs = random_profiles(1, seed=42)[0]
+    options = dict(strategy=strategy, n_paths=2000, seed=5, target=0.9)
+    result = fc.safe_withdrawal_rate(inputs, **options)
+    assert 0 < result["rate"] < 0.2 and result["success_probability"] >= 0.9
+    tol = 1e-6 if strategy == "fixed" else 2.5e-4
+    above = fc.simulate_decumulation(inputs, strategy=strategy, rate=result["rate"] + tol, n_paths=2000, seed=5)
+    assert above["success_probability"] < 0.9
+
+def test_safe_withdrawal_rate_edge_cases():
+    inputs = random_profiles(1, seed=43)[0]
+    assert fc.safe_withdrawal_rate(inputs, n_paths=100, seed=0, corpus=-1e6)["rate"] == 0.0
+    with pytest.raises(ValueError, match="no withdrawal rate"):
+        fc.safe_withdrawal_rate(inputs, strategy="expenses", n_paths=100, seed=0)
+    with pytest.raises(ValueError, match="no years before retirement"):
+        fc.simulate_decumulation(past_retirement_inputs())
+
+# -----------------------------------------------------------------------------
+# STREAMING
+# -----------------------------------------------------------------------------
+def test_checkpoint_resumes_remaining_years():
+    inputs = random_profiles(1, seed=12)[0]
+    checkpoints = []
+    rows = list(fc.iter_yearly_projection(inputs, checkpoints=checkpoints))
+    assert len(checkpoints) == len(rows)
+    for year in (1, len(rows) // 2, len(rows) - 1):
+        assert_rows_match(rows[year:], list(fc.iter_yearly_projection(inputs, start_state=checkpoints[year])))
+
+def test_stream_projection_writes_every_row_once():
+    import io
+    import pandas as pd
+    inputs = random_profiles(1, seed=13)[0]
+    buffer = io.StringIO()
+    count = financial_export.stream_projection(fc.iter_yearly_projection(inputs), [financial_export.CSVSink(buffer)], batch_size=4)
+    rows = fc.simulate_yearly_projection(inputs)
+    assert count == len(rows)
+    df = pd.read_csv(io.StringIO(buffer.getvalue()))
+    assert df.columns.tolist() == fc.PROJECTION_FIELDS
+    np.testing.assert_allclose(df["Corpus"], [row["Corpus"] for row in rows])
+
+def test_chunked_batch_stream_matches_single_batch():
+    import io
+    table = fc.profiles_table(random_profiles(25, seed=14))
+    whole, chunked = io.StringIO(), io.StringIO()
+    assert (financial_export.stream_batch_projection(table, [financial_export.CSVSink(whole)], with_events=True)
+            == financial_export.stream_batch_projection(table, [financial_export.CSVSink(chunked)], chunk_size=6, with_events=True))
+    assert whole.getvalue() == chunked.getvalue()
+
+# -----------------------------------------------------------------------------
+# INCREMENTAL RE-SIMULATION
+# -----------------------------------------------------------------------------
+def edit_inputs(inputs, rng):
+    edited = copy.deepcopy(inputs)
+    personal, simulation = edited["personal_information"], edited["simulation_parameters"]
+    edit = rng.choice(["marriage", "reserved", "horizon", "emergency", "none"])
+    if edit == "marriage":
+        personal["age_of_marriage"] = personal["age"] + rng.randint(1, 30)
+    elif edit == "reserved":
+        edited["reserved_investments"] = rng.uniform(0, 3e6)
+    elif edit == "horizon":
+        simulation["years_to_simulate"] = max(simulation["years_to_simulate"] + rng.randint(-10, 10), 1)
+    elif edit == "emergency":
+        edited["emergency_fund"] = rng.uniform(0, 600000)
+    return edited
+
+def test_incremental_updates_match_full_projection():
+    rng = random.Random(18)
+    for inputs in random_profiles(20, seed=18):
+        incremental = fc.IncrementalProjection(inputs)
+        for _ in range(4):
+            inputs = edit_inputs(inputs, rng)
+            assert_rows_match(fc.simulate_yearly_projection(inputs), incremental.update(inputs))
+
+def test_late_edit_reuses_earlier_years():
+    inputs = {"personal_information": {"age": 30, "age_of_marriage": 40},
+              "simulation_parameters": {"years_to_simulate": 30, "starting_age": 30}}
+    incremental = fc.IncrementalProjection(inputs)
+    edited = copy.deepcopy(inputs)
+    edited["personal_information"]["age_of_marriage"] = 45
+    assert fc.first_changed_year(inputs, edited) == 10
+    assert_rows_match(fc.simulate_yearly_projection(edited), incremental.update(edited))
+    assert incremental.recomputed_from == 10
+    assert fc.first_changed_year(edited, copy.deepcopy(edited)) is None
+    assert fc.first_changed_year(edited, edited, {"inflation": 0.05}) == 0
+
+# -----------------------------------------------------------------------------
+# MONTE CARLO
+# -----------------------------------------------------------------------------
+def test_monte_carlo_is_seeded_and_independent_of_chunk_size():
+    inputs = random_profiles(1, seed=5)[0]
+    a = fc.simulate_monte_carlo(inputs, n_paths=700, seed=7, chunk_size=300)
+    b = fc.simulate_monte_carlo(inputs, n_paths=700, seed=7)
+    for p in a["percentiles"]:
+        np.testing.assert_array_equal(a["percentiles"][p], b["percentiles"][p])
+    bands = np.array(list(a["percentiles"].values()))
+    assert (np.diff(bands, axis=0) >= 0).all()
+
+def test_monte_carlo_without_volatility_matches_deterministic_projection():
+    inputs = random_profiles(1, seed=6)[0]
+    fixed = {factor: {"dist": "fixed", "mean": fc.DEFAULT_ASSUMPTIONS[factor]} for factor in fc.MONTE_CARLO_FACTORS}
+    result = fc.simulate_monte_carlo(inputs, n_paths=3, distributions=fixed, seed=0)
+    corpus = [row["Corpus"] for row in fc.simulate_yearly_projection(inputs)]
+    for band in result["percentiles"].values():
+        np.testing.assert_allclose(band, corpus, rtol=1e-9, atol=0.011)
+    assert result["probability_short"] == float(min(corpus) < 0)
+
+def test_monte_carlo_compounds_drawn_rates():
+    inputs = {"personal_information": {"age": 25}, "career_income_details": {"monthly_salary": 150000},
+              "simulation_parameters": {"years_to_simulate": 40, "starting_age": 25}}
+    def median_corpus(**means):
+        distributions = {factor: {"mean": mean} for factor, mean in means.items()}
+        return fc.simulate_monte_carlo(inputs, n_paths=500, distributions=distributions, seed=3)["percentiles"][50][-1]
+    # Each year's draw grows the level reached so far, so two points on a mean rate add up over 40 years
+    base = median_corpus()
+    assert median_corpus(inflation=0.09) < 0.9 * base
+    assert median_corpus(income_growth=0.06) > 1.1 * base
+    table = fc.profiles_table([inputs])
+    growth = np.random.default_rng(0).normal(0.04, 0.03, (5, 40))
+    arrays = fc.project_profile_arrays({name: table[name].to_numpy() for name in table}, 40, dict(fc.DEFAULT_ASSUMPTIONS, income_growth=growth))
+    np.testing.assert_allclose(arrays["Income"], 150000 * 12 * np.cumprod(1 + growth, axis=1))
+
+# -----------------------------------------------------------------------------
+# PARALLEL EXECUTION
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("assumptions", [{}, {"amortize_liabilities": False}])
+def test_parallel_batch_matches_serial_batch(assumptions):
+    table = fc.profiles_table(random_profiles(30, seed=8))
+    serial = fc.simulate_batch_projection(table, assumptions)
+    parallel = financial_parallel.parallel_batch_projection(table, assumptions, workers=2, chunk_size=7)
+    for i in range(len(table)):
+        assert_rows_match(serial.rows(i), parallel.rows(i))
+
+def test_parallel_monte_carlo_does_not_depend_on_workers():
+    inputs = random_profiles(1, seed=9)[0]
+    one = financial_parallel.parallel_monte_carlo(inputs, n_paths=700, seed=3, workers=1, chunk_size=256)
+    two = financial_parallel.parallel_monte_carlo(inputs, n_paths=700, seed=3, workers=2, chunk_size=256)
+    for p in one["percentiles"]:
+        np.testing.assert_array_equal(one["percentiles"][p], two["percentiles"][p])
+    np.testing.assert_array_equal(one["shortfall_probability_by_year"], two["shortfall_probability_by_year"])
+
+def test_parallel_monte_carlo_matches_serial_for_a_seed():
+    inputs = random_profiles(1, seed=10)[0]
+    serial = fc.simulate_monte_carlo(inputs, n_paths=600, seed=4)
+    parallel = financial_parallel.parallel_monte_carlo(inputs, n_paths=600, seed=4, workers=2, chunk_size=300)
+    for p in serial["percentiles"]:
+        np.testing.assert_array_equal(serial["percentiles"][p], parallel["percentiles"][p])
+    assert serial["probability_short"] == parallel["probability_short"]
+
+# -----------------------------------------------------------------------------
+# LIFE EVENTS
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("project", [
+    fc.simulate_yearly_projection,
+    fc.vectorized_yearly_projection,
+    lambda inputs: fc.simulate_batch_projection(fc.profiles_table([inputs])).arrays,
+    lambda inputs: fc.simulate_batch_projection(fc.profiles_table([inputs])).to_frame(with_events=True),
+    lambda inputs: fc.simulate_monte_carlo(inputs, n_paths=10, seed=0),
+])
+def test_marriage_before_starting_age_is_rejected_by_every_engine(project):
+    inputs = {"personal_information": {"age": 30, "age_of_marriage": 25},
+              "simulation_parameters": {"years_to_simulate": 10, "starting_age": 30}}
+    with pytest.raises(ValueError, match="Invalid marriage age"):
+        project(inputs)
+
+def test_event_schedule_pops_each_year_in_rank_order():
+    profile = fc.profile_from_inputs({
+        "personal_information": {"age": 30, "age_of_marriage": 32, "children": [{"age_at_birth": 1}, {"age_at_birth": 4}]},
+        "custom_events": [{"name": "Car", "year": 2, "cost": 8e5}, {"name": "Trip", "year": 0, "cost": 1e5}],
+        "simulation_parameters": {"years_to_simulate": 10, "starting_age": 30},
+    })
+    schedule = fc.EventSchedule.from_profile(profile)
+    assert [event.name for event in schedule.pop_due(0)] == ["Unexpected Expense", "Trip"]
+    assert [event.name for event in schedule.pop_due(2)] == ["Marriage", "Child_1_Expense", "Car"]
+    # Events of years that were skipped are dropped, not returned late
+    assert schedule.pop_due(9) == []
+    assert not schedule
+
+def test_pay_event_costs_drains_sources_in_order():
+    # Marriage cost comes from reserved investments first, the rest from savings, emergency fund, investments
+    assert fc.pay_event_costs(300, 200, 100, 150, 120, 1000) == (0, 0, 0, 1000 - 130)
+    reserved, savings, emergency, investment = fc.pay_event_costs(np.array([0.0, 50.0]), np.array([80.0, 0.0]), 100.0, 60.0, 0.0, 0.0)
+    np.testing.assert_array_equal(reserved, [100, 50])
+    np.testing.assert_array_equal(savings, [0, 60])
+    np.testing.assert_array_equal(investment, [-20, 0])
+
+# -----------------------------------------------------------------------------
+# CALCULATION TRACE
+# -----------------------------------------------------------------------------
+def test_trace_level_does_not_change_projection():
+    inputs = random_profiles(1, seed=10)[0]
+    traces = {level: fc.CalculationTrace(level) for level in (fc.TRACE_OFF, fc.TRACE_SUMMARY, fc.TRACE_FULL)}
+    rows = {level: fc.simulate_yearly_projection(inputs, trace=trace) for level, trace in traces.items()}
+    assert rows[fc.TRACE_OFF] == rows[fc.TRACE_SUMMARY] == rows[fc.TRACE_FULL]
+    assert not traces[fc.TRACE_OFF].records
+    summary = {r.formula for r in traces[fc.TRACE_SUMMARY].records}
+    full = {r.formula for r in traces[fc.TRACE_FULL].records}
+    assert "calculate_corpus" in summary and summary < full
+
+def test_trace_sink_and_record_limit():
+    lines = []
+    trace = fc.CalculationTrace(fc.TRACE_FULL, max_records=5, sink=lines.append)
+    fc.simulate_yearly_projection(random_profiles(1, seed=11)[0], trace=trace)
+    assert len(trace.records) == 5
+    assert trace.render() == lines[-5:] and all(isinstance(line, str) for line in lines)
+
+def test_marriage_event_logs_are_strings():
+    inputs = {"personal_information": {"age": 30, "age_of_marriage": 32}}
+    event = fc.AssumptionsAnalysis(inputs, trace=fc.CalculationTrace(fc.TRACE_FULL)).handle_marriage_event(1500000)
+    assert event["logs"] and all(isinstance(line, str) for line in event["logs"])
+    assert event["logs"][0] == "Marriage scheduled in simulation year: 2"
+
+# -----------------------------------------------------------------------------
+# INSTRUMENTATION
+# -----------------------------------------------------------------------------
+@pytest.fixture
+def metrics(monkeypatch):
+    """The global registry, enabled and empty for one test."""
+    monkeypatch.setattr(fc.METRICS, "enabled", True)
+    fc.METRICS.reset()
+    yield fc.METRICS
+    fc.METRICS.reset()
+
+def test_metrics_are_off_by_default():
+    fc.METRICS.reset()
+    fc.simulate_batch_projection(fc.profiles_table(random_profiles(2)))
+    assert fc.METRICS.snapshot() == {"histograms": {}, "counters": {}}
+
+def test_projection_records_stages_and_counters(metrics):
+    fc.simulate_yearly_projection(random_profiles(1, seed=37)[0])
+    fc.simulate_batch_projection(fc.profiles_table(random_profiles(4)))
+    snap = metrics.snapshot()
+    assert {f"projection.{stage}" for stage in fc.PROJECTION_STAGES} <= snap["histograms"].keys()
+    assert all(snap["histograms"][f"projection.{stage}"][1] == 1 for stage in fc.PROJECTION_STAGES)
+    assert snap["histograms"]["batch_projection"][1] == 1 and snap["counters"]["batch_profiles"] == 4
+
+def test_metrics_snapshots_merge_and_export(metrics):
+    for seconds in (2e-5, 3e-3, 3e-3, 20.0):
+        metrics.observe("stage", seconds)
+    metrics.count("rows", 7)
+    snap = metrics.snapshot(reset=True)
+    assert metrics.snapshot() == {"histograms": {}, "counters": {}}
+    metrics.merge(snap)
+    metrics.merge(snap)
+    stage = metrics.to_json()["stages"]["stage"]
+    assert stage["count"] == 8 and stage["sum"] == pytest.approx(2 * 20.00602)
+    assert stage["p50"] == 5e-3 and stage["p99"] == fc.STAGE_BUCKETS[-1] and stage["buckets"]["+Inf"] == 2
+    text = metrics.to_prometheus()
+    assert 'financial_stage_seconds_bucket{stage="stage",le="+Inf"} 8' in text
+    assert 'financial_stage_seconds_bucket{stage="stage",le="0.005"} 6' in text
+    assert "financial_rows_total 14" in text
+
+# -----------------------------------------------------------------------------
+# MODULE API
+# -----------------------------------------------------------------------------
+@pytest.mark.parametrize("module", [fc, financial_parallel, financial_export, financial_store, financial_reports, financial_cli])
+def test_all_lists_public_names_only(module):
+    import types
+    exported = set(module.__all__)
+    assert all(hasattr(module, name) for name in exported)
+    assert not any(name.startswith("_") or isinstance(getattr(module, name), types.ModuleType) for name in exported)
+    defined = {name for name, value in vars(module).items() if not name.startswith("_")
+               and isinstance(value, (types.FunctionType, type)) and value.__module__ == module.__name__}
+    assert defined <= exported
+    namespace = {}
+    exec(f"from {module.__name__} import *", namespace)
+    assert not {"np", "json", "math", "bisect", "os"} & namespace.keys()
+
+# -----------------------------------------------------------------------------
+# REPORTS
+# -----------------------------------------------------------------------------
+def pdf_pages(data):
+    return len(re.findall(rb"/Type /Page\b", data))
+
+def test_pdf_report_pages_follow_projection_length():
+    template = financial_reports.PDFReportTemplate()
+    pages = []
+    for years in (5, 200):
+        rows = fc.simulate_yearly_projection({"simulation_parameters": {"years_to_simulate": years, "starting_age": 30}})
+        before = template.pages_rendered
+        data = template.render(fc.projection_frame(rows))
+        assert data.startswith(b"%PDF")
+        assert pdf_pages(data) == template.pages_rendered - before
+        pages.append(pdf_pages(data))
+    assert pages[0] < pages[1]
+
+def test_bulk_pdf_reports_write_one_file_per_client(tmp_path):
+    import zipfile
+    batch = fc.simulate_batch_projection(fc.profiles_table(random_profiles(5, seed=21)))
+    stats = financial_reports.bulk_pdf_reports(financial_reports.batch_reports(batch), tmp_path / "reports.zip", workers=2, chunk_size=2)
+    with zipfile.ZipFile(tmp_path / "reports.zip") as archive:
+        assert sorted(archive.namelist()) == [f"client_{i}.pdf" for i in range(5)]
+        assert stats["pages"] == sum(pdf_pages(archive.read(name)) for name in archive.namelist())
+    financial_reports.bulk_pdf_reports(financial_reports.batch_reports(batch), tmp_path / "reports", workers=1)
+    assert sorted(path.name for path in (tmp_path / "reports").iterdir()) == [f"client_{i}.pdf" for i in range(5)]
+
+# -----------------------------------------------------------------------------
+# EXPORT FORMATS
+# -----------------------------------------------------------------------------
+def read_export(path):
+    import pandas as pd
+    import pyarrow as pa
+    if path.suffix == ".arrow":
+        with pa.ipc.open_stream(path) as reader:
+            return reader.read_pandas()
+    return {".csv": pd.read_csv, ".xlsx": pd.read_excel, ".parquet": pd.read_parquet}[path.suffix](path)
+
+@pytest.mark.parametrize("ext", [".csv", ".xlsx", ".arrow", ".parquet"])
+def test_export_round_trip(tmp_path, ext):
+    df = fc.projection_frame(fc.simulate_yearly_projection(random_profiles(1, seed=22)[0]))
+    financial_export.export_projection(df, tmp_path / f"projection{ext}")
+    back = read_export(tmp_path / f"projection{ext}")
+    assert back.columns.tolist() == df.columns.tolist()
+    assert back["Year"].tolist() == df["Year"].tolist()
+    assert back["Life Events"].astype(str).tolist() == df["Life Events"].tolist()
+    np.testing.assert_allclose(back["Corpus"].astype(float), df["Corpus"])
+
+def test_export_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        financial_export.export_projection(fc.projection_frame([]), tmp_path / "projection.txt")
+
+def test_partitioned_parquet_holds_every_batch_row(tmp_path):
+    import pandas as pd
+    table = fc.profiles_table(random_profiles(8, seed=23))
+    count = financial_export.stream_batch_projection(table, [financial_export.PartitionedParquetSink(tmp_path, scenario="base")], chunk_size=3)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f"client={i}" for i in range(8))
+    back = pd.read_parquet(tmp_path)
+    assert len(back) == count
+    assert back["Corpus"].sum() == pytest.approx(fc.simulate_batch_projection(table).to_frame()["Corpus"].sum())
+
+def test_import_stays_headless():
+    import subprocess
+    import sys
+    code = ("import sys, financial_core, financial_parallel, financial_export, financial_store, financial_reports, financial_cli; "
+            "print(sorted({'streamlit', 'pandas', 'altair', 'fpdf', 'pyarrow', 'openpyxl'} & sys.modules.keys()))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+def test_cli_projects_profiles_file(tmp_path):
+    import pandas as pd
+    profiles = random_profiles(3, seed=26)
+    (tmp_path / "profiles.json").write_text(json.dumps(profiles))
+    assert financial_cli.cli(["project", str(tmp_path / "profiles.json"), "-o", str(tmp_path / "out.csv")]) == 0
+    df = pd.read_csv(tmp_path / "out.csv")
+    assert len(df) == sum(p["simulation_parameters"]["years_to_simulate"] for p in profiles)
+
+# -----------------------------------------------------------------------------
+# CHART DATA
+# -----------------------------------------------------------------------------
+def test_lttb_keeps_ends_and_spikes():
+    rng = np.random.default_rng(32)
+    x = np.arange(10000.0)
+    y = rng.normal(size=len(x)).cumsum()
+    y[4321] = 1e6
+    keep = financial_reports.lttb_indices(x, y, 200)
+    assert len(keep) == 200 and keep[0] == 0 and keep[-1] == len(x) - 1
+    assert (np.diff(keep) > 0).all()
+    assert 4321 in keep
+    np.testing.assert_array_equal(financial_reports.lttb_indices(x[:50], y[:50], 200), np.arange(50))
+
+def test_downsample_frame_stays_within_budget():
+    import pandas as pd
+    n = 5000
+    df = pd.DataFrame({"Year": np.tile(np.arange(n), 3), "Series": np.repeat(["a", "b", "c"], n),
+                       "Corpus": np.random.default_rng(33).normal(size=3 * n).cumsum()})
+    small = financial_reports.downsample_frame(df, "Year", ["Corpus"], max_points=300, by="Series")
+    assert small.groupby("Series").size().tolist() == [100, 100, 100]
+    assert len(financial_reports.downsample_frame(df.head(100), "Year", max_points=300)) == 100
+
+def test_band_frame_over_ragged_batch():
+    table = fc.profiles_table(random_profiles(20, seed=34))
+    batch = fc.simulate_batch_projection(table)
+    cache = financial_store.ProjectionCache()
+    bands = financial_reports.batch_band_frame(batch, cache=cache)
+    for t in range(batch.years):
+        values = batch["Corpus"][:, t][batch.mask[:, t]]
+        assert bands["Count"][t] == len(values)
+        np.testing.assert_allclose(bands.loc[t, ["P5", "P50", "P95"]].astype(float), np.percentile(values, [5, 50, 95]))
+    assert financial_reports.batch_band_frame(batch, cache=cache) is bands and cache.stats["hits"] == 1
+
+# -----------------------------------------------------------------------------
+# CACHING & STORAGE
+# -----------------------------------------------------------------------------
+def edit_regime_slabs(monkeypatch, name):
+    """Replace a regime's slabs in the loaded schedules, as an in-place edit of tax_regimes.json would."""
+    schedule = fc.get_tax_schedule(name)
+    slabs = [(None if upper == float("inf") else upper, rate + 0.01) for upper, rate in zip(schedule.uppers.tolist(), schedule.rates.tolist())]
+    monkeypatch.setitem(fc._TAX_SCHEDULES, name, fc.TaxSchedule(slabs, name=name))
+    if fc._TAX_SCHEDULES[None] is schedule:
+        monkeypatch.setitem(fc._TAX_SCHEDULES, None, fc._TAX_SCHEDULES[name])
+
+def test_cache_key_changes_with_tax_slabs(monkeypatch):
+    inputs = random_profiles(1)[0]
+    regime = fc.DEFAULT_ASSUMPTIONS["tax_regime"]
+    before = financial_store.projection_cache_key("projection", inputs)
+    assert before == financial_store.projection_cache_key("projection", inputs, {"tax_regime": regime})
+    edit_regime_slabs(monkeypatch, regime)
+    assert financial_store.projection_cache_key("projection", inputs) != before
+
+def test_cache_key_is_canonical():
+    inputs = random_profiles(1, seed=15)[0]
+    reordered = dict(reversed(list(inputs.items())))
+    reordered["emergency_fund"] = float(inputs["emergency_fund"])
+    assert financial_store.projection_cache_key("projection", inputs) == financial_store.projection_cache_key("projection", reordered)
+    # Explicit defaults resolve to the same assumption set
+    assert financial_store.projection_cache_key("projection", inputs, {"inflation": fc.DEFAULT_ASSUMPTIONS["inflation"]}) == financial_store.projection_cache_key("projection", inputs)
+    assert financial_store.projection_cache_key("projection", inputs, {"inflation": 0.05}) != financial_store.projection_cache_key("projection", inputs)
+
+def test_projection_cache_memory_and_disk_tiers(tmp_path):
+    inputs = random_profiles(1, seed=16)[0]
+    cache = financial_store.ProjectionCache(max_entries=1, disk_dir=tmp_path)
+    rows = financial_store.cached_yearly_projection(inputs, cache)
+    rows[0]["Corpus"] = None  # callers get fresh row dicts
+    assert financial_store.cached_yearly_projection(inputs, cache) == fc.simulate_yearly_projection(inputs)
+    financial_store.cached_yearly_projection(random_profiles(1, seed=17)[0], cache)  # evicts the first entry from memory
+    assert financial_store.cached_yearly_projection(inputs, cache) == fc.simulate_yearly_projection(inputs)
+    assert cache.stats == {"hits": 1, "disk_hits": 1, "misses": 2, "evictions": 2, "disk_evictions": 0}
+
+def test_pack_projection_round_trip():
+    batch = fc.simulate_batch_projection(fc.profiles_table(random_profiles(3, seed=35)))
+    for i in range(len(batch)):
+        assert financial_store.unpack_projection(financial_store.pack_projection(batch.result(i))).rows() == batch.rows(i)
+    assert len(financial_store.unpack_projection(financial_store.pack_projection(fc.ProjectionResult.from_rows([])))) == 0
+
+def test_store_answers_as_of_queries():
+    profiles = dict(zip("abc", random_profiles(3, seed=36)))
+    edited = copy.deepcopy(profiles["a"])
+    edited["assets_liabilities_investments"]["investments"].append({"investment_type": "mutual funds", "current_value": 1e7})
+    with financial_store.ProjectionStore() as store:
+        batch = fc.simulate_batch_projection(fc.profiles_table(profiles.values()))
+        store.save_batch(batch, profiles, created=100.0)
+        store.save_results([("a", edited, fc.ProjectionResult.from_rows(fc.simulate_yearly_projection(edited)))], created=200.0)
+        # Going back to the first inputs reuses their version and stored projection, while the log keeps every save
+        store.save_results([("a", profiles["a"], store.find_result("a", profiles["a"]))], created=300.0)
+        assert [version for _, version, _ in store.profile_history("a")] == [1, 4, 1]
+        assert store.db.execute("SELECT COUNT(*) FROM projections").fetchone()[0] == 4
+        assert store.load_profile("a", as_of=150.0) == profiles["a"] == store.load_profile("a")
+        assert store.load_profile("a", as_of=250.0) == edited
+        finals = {client_id: batch.rows(i)[-1]["Corpus"] for i, client_id in enumerate(profiles)}
+        assert {row["client_id"]: row["final_corpus"] for row in store.summaries(as_of=150.0)} == pytest.approx(finals, abs=0.011)
+        target = np.mean(sorted(finals.values())[1:])
+        assert {client_id for client_id, _ in store.clients_below(target, as_of=150.0)} == {c for c, v in finals.items() if v < target}
+        before, after = store.compare(["a"], before=150.0, after=250.0)["a"]
+        assert before == pytest.approx(finals["a"], abs=0.011) and after > before
+        assert_rows_match(batch.rows(1), store.load_results(["b"])["b"].rows())
+
+def test_store_does_not_reuse_projections_across_tax_slabs(monkeypatch):
+    inputs = random_profiles(1)[0]
+    with financial_store.ProjectionStore() as store:
+        store.save_results([("c1", inputs, fc.ProjectionResult.from_rows(fc.simulate_yearly_projection(inputs)))])
+        assert store.find_result("c1", inputs) is not None
+        edit_regime_slabs(monkeypatch, fc.DEFAULT_ASSUMPTIONS["tax_regime"])
+        assert store.find_result("c1", inputs) is None
@@ -0,0 +1,94 @@
+"""
+Tests for the HTTP projection service. Run with `python -m pytest -q`.
+
+The service runs on an ephemeral port with a thread pool instead of worker
+processes, so requests exercise the real HTTP handling and micro-batching.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import financial_core as fc
+from projection_service import ProjectionService
+
+VALID = {"personal_information": {"age": 30}, "simulation_parameters": {"years_to_simulate": 5, "starting_age": 30}}
+# A wedding before the starting age is rejected by the engine
+INVALID = {"personal_information": {"age": 30, "age_of_marriage": 25},
+           "simulation_parameters": {"years_to_simulate": 5, "starting_age": 30}}
+
+def run_service(scenario, **options):
+    """Start a service, run `await scenario(service, port)` against it, and shut it down."""
+    async def main():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            service = ProjectionService(workers=2, executor=executor, **{"cache_entries": 0, **options})
+            server = await service.start("127.0.0.1", 0)
+            try:
+                return await scenario(service, server.sockets[0].getsockname()[1])
+            finally:
+                await service.close()
+    return asyncio.run(main())
+
+async def http(port, method, path, body=None, headers=None):
+    """(status, body) of one request on a fresh connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = b"" if body is None else json.dumps(body).encode()
+    head = {"Content-Length": str(len(payload)), "Connection": "close", **(headers or {})}
+    writer.write(f"{method} {path} HTTP/1.1\r\n".encode() + "".join(f"{k}: {v}\r\n" for k, v in head.items()).encode()
+                 + b"\r\n" + payload)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b"\r\n")
+    return int(status_line.split()[1]), rest.partition(b"\r\n\r\n")[2]
+
+def test_project_matches_engine():
+    async def scenario(service, port):
+        return await http(port, "POST", "/project", {"inputs": VALID})
+    status, body = run_service(scenario)
+    assert status == 200
+    assert json.loads(body)["rows"] == json.loads(json.dumps(fc.vectorized_yearly_projection(VALID)))
+
+def test_bad_profile_fails_only_its_own_request():
+    async def scenario(service, port):
+        # A long window puts all three requests into one batch
+        results = await asyncio.gather(*(http(port, "POST", "/project", {"inputs": inputs}) for inputs in (VALID, INVALID, VALID)))
+        return results, service.batcher.retried
+    results, retried = run_service(scenario, batch_window=0.2)
+    assert [status for status, _ in results] == [200, 400, 200]
+    assert "marriage" in json.loads(results[1][1])["error"]
+    assert retried == 3
+
+def test_concurrent_requests_share_batches_and_cache():
+    profiles = [dict(VALID, emergency_fund=100000 * i) for i in range(8)]
+    async def scenario(service, port):
+        first = await asyncio.gather(*(http(port, "POST", "/project", {"inputs": inputs}) for inputs in profiles))
+        again = await http(port, "POST", "/project", {"inputs": profiles[0]})
+        return first, again, json.loads((await http(port, "GET", "/stats"))[1])
+    first, again, stats = run_service(scenario, batch_window=0.2, cache_entries=16)
+    assert [status for status, _ in first] == [200] * 8
+    assert again == first[0]
+    assert stats["batches"] < 8 and stats["mean_batch_size"] > 1
+    assert stats["cache"]["hits"] == 1 and stats["cache"]["misses"] == 8
+
+def test_overload_and_unknown_routes():
+    async def scenario(service, port):
+        return [await http(port, "POST", "/project", {"profiles": [VALID] * 3}), await http(port, "GET", "/project"),
+                await http(port, "GET", "/missing"), await http(port, "POST", "/project", [VALID])]
+    results = run_service(scenario, max_pending=2)
+    assert [status for status, _ in results] == [503, 405, 404, 400]
+
+def test_monte_carlo_rejects_bad_paths():
+    async def scenario(service, port):
+        return [await http(port, "POST", "/monte-carlo", {"inputs": VALID, **params})
+                for params in ({"paths": 10 ** 9}, {"paths": "many"}, {"paths": 1.5}, {"paths": 0}, {"paths": True},
+                               {"paths": 100, "seed": "x"}, {"paths": 100, "seed": 1})]
+    results = run_service(scenario, max_paths=1000)
+    assert [status for status, _ in results] == [400] * 6 + [200]
+    assert json.loads(results[-1][1])["paths"] == 100
+
+def test_negative_content_length_is_rejected():
+    async def scenario(service, port):
+        return await http(port, "POST", "/project", headers={"Content-Length": "-5"})
+    status, body = run_service(scenario)
+    assert status == 400
+    assert "Content-Length" in json.loads(body)["error"]